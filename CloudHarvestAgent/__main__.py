@@ -1,24 +1,32 @@
 """
 Entrypoint for the CloudHarvestAgent
 """
-from CloudHarvestAgent.api import Api
-from CloudHarvestAgent.jobs import TaskChainQueue
-from CloudHarvestAgent.startup import (
-    load_configuration_from_file,
-    load_logging,
-    refresh_silos,
-    start_node_heartbeat
-)
-from CloudHarvestCorePluginManager import Registry, register_all
-from CloudHarvestCorePluginManager.plugins import generate_plugins_file, install_plugins
-from CloudHarvestCoreTasks.dataset import WalkableDict
-from CloudHarvestCoreTasks.environment import Environment
-from argparse import ArgumentParser, Namespace
-from flask import Flask
-from os import getpid
-
-# Imports objects which need to be registered by the CloudHarvestCorePluginManager
-from CloudHarvestAgent.__register__ import *
+import sys
+from CloudHarvestAgent.startup_profiler import startup_profiler
+
+# Profiling starts before the remaining imports so their cost is measured
+if '--profile-startup' in sys.argv:
+    startup_profiler.enable()
+
+with startup_profiler.phase('imports'):
+    from CloudHarvestAgent.plugins import install_plugins_once
+    from CloudHarvestAgent.startup import (
+        load_configuration_from_file,
+        load_logging,
+        start_agent
+    )
+    from CloudHarvestAgent.supervisor import queue_client
+    from CloudHarvestAgent.template_cache import template_cache
+    from CloudHarvestAgent.template_catalog import template_catalog
+    from CloudHarvestCorePluginManager import Registry, register_all
+    from CloudHarvestCoreTasks.dataset import WalkableDict
+    from CloudHarvestCoreTasks.environment import Environment
+    from argparse import ArgumentParser, Namespace
+    from flask import Flask
+    from os import getpid
+
+    # Imports objects which need to be registered by the CloudHarvestCorePluginManager
+    from CloudHarvestAgent.__register__ import *
 
 # The flask server object
 app = Flask('CloudHarvestAgent')
@@ -34,6 +42,9 @@ if __name__ == '__main__':
     debug_group.add_argument('--port', type=int, default=8500, help='Port number')
     debug_group.add_argument('--pemfile', type=str, default='./app/harvest-self-signed.pem', help='Use PEM file for SSL')
     debug_group.add_argument('--debug', action='store_true', help='Enable debug mode')
+    debug_group.add_argument('--profile-startup', type=str, nargs='?', const='./app/startup-profile.json',
+                             metavar='PATH', help='Profile each startup phase, print the results, write them to PATH '
+                                                  '(default: ./app/startup-profile.json), and exit')
 
     args = parser.parse_args()
 
@@ -43,10 +54,13 @@ else:
     args = Namespace(host=gunicorn_conf.bind.split(':')[0],
                      port=int(gunicorn_conf.bind.split(':')[1]),
                      pemfile=gunicorn_conf.certfile,
-                     debug=False)
+                     debug=False,
+                     profile_startup=None)
 
 # Load the configuration
-config = WalkableDict(**load_configuration_from_file())
+with startup_profiler.phase('load_configuration'):
+    config = WalkableDict(**load_configuration_from_file())
+
 config['agent']['connection'] = vars(args)
 config['agent']['pid'] = getpid()
 config['agent']['name'] = ':'.join([
@@ -56,18 +70,27 @@ config['agent']['name'] = ':'.join([
     str(getpid())
 ])
 
+if args.profile_startup:
+    # Profiling measures startup only; the queue must not claim any tasks
+    config['agent'].setdefault('tasks', {})['auto_start'] = False
+
 # Makes the configuration available throughout the app
 Environment.merge(config)
 
-# Install plugins
-generate_plugins_file(config.walk('plugins') or {})
-install_plugins(quiet=args.debug or config.walk('agent.logging.quiet'))
+# Install plugins unless they are already installed on this host; under gunicorn, the master has already done so
+with startup_profiler.phase('install_plugins'):
+    install_plugins_once(config, quiet=args.debug or config.walk('agent.logging.quiet'))
 
 # Find all plugins and register their objects and templates
-register_all()
+with startup_profiler.phase('register_all'):
+    register_all()
+
+    # Compiled templates and the template catalog must be rebuilt whenever plugins are registered
+    template_cache.invalidate()
+    template_catalog.build()
 
 # Register the blueprints from this app and all plugins
-with app.app_context():
+with startup_profiler.phase('register_blueprints'), app.app_context():
     [
         app.register_blueprint(api_blueprint)
         for api_blueprint in Registry.find(result_key='instances',
@@ -84,32 +107,28 @@ logger = load_logging(log_destination=config.walk('agent.logging.location'),
 
 logger.info('Agent configuration loaded successfully.')
 
-# Create a new API interface which will be used to communicate with the CloudHarvestApi
-api = Api(host=config.walk('api.host'),
-          port=config.walk('api.port'),
-          token=config.walk('api.token'),
-          pem=config.walk('api.ssl.pem'),
-          verify=config.walk('api.ssl.verify'))
+# Under gunicorn, the queue, heartbeat, and execution pools belong to the agent's supervisor process
+queue = queue_client()
 
+if queue is not None:
+    Environment.add(name='queue_object', value=queue)
 
-Environment.add(name='api_object', value=api)
-
-# Retrieves the list of silos from the API
-refresh_silos()
+else:
+    # Start the queue, heartbeat, and metrics publisher in this process
+    queue = start_agent(config)
 
-# Instantiate the JobQueue
-queue = TaskChainQueue(api=api, **config.walk('agent.tasks', {}))
-Environment.add(name='queue_object', value=queue)
+logger.debug(app.url_map)
 
-# Start the node heartbeat
-start_node_heartbeat(config)
+logger.info('Agent node started.')
 
-logger.debug(app.url_map)
+if args.profile_startup:
+    startup_profiler.disable()
+    startup_profiler.write(args.profile_startup)
 
-if config.walk('agent.tasks.auto_start', True):
-    queue.start()
+    print(startup_profiler.format_table())
+    print(f'Startup profile written to {args.profile_startup}')
 
-logger.info('Agent node started.')
+    sys.exit(0)
 
 if args.debug:
     import ssl
@@ -0,0 +1,288 @@
+"""
+Resource accounting for TaskChains. The TaskChainQueue records the CPU time, wall time, queue wait, result records, and
+optionally the memory allocated by each TaskChain, keeps the most recently finished TaskChains, and maintains rolling
+aggregates per template so the templates which use an agent's CPU and memory can be identified.
+
+CPU time is measured per thread: a TaskChain's CPU time is that of the thread which runs it, read live from the
+thread's CPU clock while it runs. TaskChains which start threads of their own are undercounted.
+
+Memory is measured with `tracemalloc` when `trace_memory` is enabled, which slows allocations down. tracemalloc does not
+attribute allocations to threads, so the peak of a TaskChain in the thread pool is the peak growth of the agent's
+traced memory while it ran, sampled every `memory_sample_interval_seconds`, and includes the allocations of TaskChains
+running alongside it. TaskChains in the process pool run alone in their process and are measured exactly.
+"""
+
+from collections import deque
+from logging import getLogger
+from threading import Event, Lock, Thread, get_ident
+from time import monotonic, thread_time
+
+logger = getLogger('harvest')
+
+
+def thread_cpu_seconds(thread_id: int) -> float or None:
+    """
+    Returns the CPU time used by a running thread, or None when the platform cannot measure it.
+
+    Arguments
+    thread_id (int): The `threading.get_ident()` of the thread.
+    """
+    from time import clock_gettime, pthread_getcpuclockid
+
+    try:
+        return clock_gettime(pthread_getcpuclockid(thread_id))
+
+    except (OSError, ValueError):
+        return None
+
+
+class ChainAccounting:
+    """
+    Records the resource usage of the TaskChains in a queue.
+    """
+
+    def __init__(self, trace_memory: bool = False,
+                 memory_sample_interval_seconds: float = 1,
+                 recent_chains: int = 50,
+                 template_window: int = 100):
+        """
+        Arguments
+        trace_memory (bool, optional): Measure the memory allocated by each TaskChain with tracemalloc.
+        memory_sample_interval_seconds (float, optional): How often the traced memory is sampled.
+        recent_chains (int, optional): The number of finished TaskChains which are kept.
+        template_window (int, optional): The number of finished TaskChains per template the aggregates cover.
+        """
+        self.trace_memory = trace_memory
+        self.memory_sample_interval_seconds = memory_sample_interval_seconds
+        self.template_window = template_window
+
+        self._lock = Lock()
+        self._running = {}                              # {redis_name: usage}
+        self._recent = deque(maxlen=recent_chains)
+        self._templates = {}                            # {template_identifier: deque of usage}
+        self._stop_event = Event()
+        self._sampler = None
+
+    def started(self, redis_name: str, template_identifier: str, queue_wait_seconds: float = None):
+        """
+        Starts accounting for a TaskChain which was added to the queue.
+
+        Arguments
+        redis_name (str): The Redis name of the TaskChain.
+        template_identifier (str): The template of the TaskChain.
+        queue_wait_seconds (float, optional): The time between the task being enqueued and claimed.
+        """
+        with self._lock:
+            self._running[redis_name] = {
+                'redis_name': redis_name,
+                'template': template_identifier,
+                'queue_wait_seconds': round(queue_wait_seconds, 3) if queue_wait_seconds is not None else None,
+                'cpu_seconds': 0.0,
+                'peak_allocated_bytes': None,
+                'records': None,
+                'status': None,
+                '_started': monotonic(),
+                '_thread_id': None,
+                '_thread_time': None,
+                '_traced_start': self._traced_memory(),
+            }
+
+    def attach_thread(self, redis_name: str):
+        """
+        Called by the thread which runs a TaskChain before it runs it.
+
+        Arguments
+        redis_name (str): The Redis name of the TaskChain.
+        """
+        with self._lock:
+            usage = self._running.get(redis_name)
+
+            if usage is not None:
+                usage['_thread_id'] = get_ident()
+                usage['_thread_time'] = thread_time()
+
+    def detach_thread(self, redis_name: str):
+        """
+        Called by the thread which ran a TaskChain after it finished, recording the CPU time the TaskChain used.
+
+        Arguments
+        redis_name (str): The Redis name of the TaskChain.
+        """
+        with self._lock:
+            usage = self._running.get(redis_name)
+
+            if usage is not None and usage['_thread_time'] is not None:
+                usage['cpu_seconds'] = thread_time() - usage['_thread_time']
+                usage['_thread_id'] = None
+                usage['_thread_time'] = None
+
+    @staticmethod
+    def _traced_memory() -> int or None:
+        import tracemalloc
+
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+
+    def _cpu_seconds(self, usage: dict) -> float:
+        """
+        Returns the CPU time a TaskChain has used so far. Must be called while holding the lock.
+        """
+        if usage['_thread_id'] is None:
+            return usage['cpu_seconds']
+
+        thread_seconds = thread_cpu_seconds(usage['_thread_id'])
+
+        if thread_seconds is None:
+            return usage['cpu_seconds']
+
+        # `thread_time()` reads the same clock, which counts from the creation of the thread; pool threads run many
+        # TaskChains
+        return max(thread_seconds - usage['_thread_time'], 0)
+
+    def sample_memory(self):
+        """
+        Updates the peak allocation of every running TaskChain from the agent's traced memory.
+        """
+        current = self._traced_memory()
+
+        if current is None:
+            return
+
+        with self._lock:
+            for usage in self._running.values():
+                if usage['_traced_start'] is None:
+                    usage['_traced_start'] = current
+
+                growth = max(current - usage['_traced_start'], 0)
+                usage['peak_allocated_bytes'] = max(usage['peak_allocated_bytes'] or 0, growth)
+
+    def finished(self, redis_name: str, status: str, summary: dict = None, records: int = None) -> dict or None:
+        """
+        Completes the accounting for a TaskChain which left the queue.
+
+        Arguments
+        redis_name (str): The Redis name of the TaskChain.
+        status (str): The final status of the TaskChain.
+        summary (dict, optional): Usage measured by a process pool worker: `cpu_seconds` and `peak_allocated_bytes`.
+        records (int, optional): The number of result records the TaskChain produced.
+
+        Returns
+        The usage of the TaskChain, or None if it was not accounted for.
+        """
+        self.sample_memory()
+
+        with self._lock:
+            usage = self._running.pop(redis_name, None)
+
+            if usage is None:
+                return None
+
+            for key in ('cpu_seconds', 'peak_allocated_bytes'):
+                if (summary or {}).get(key) is not None:
+                    usage[key] = summary[key]
+
+            result = self._public(usage, status=str(status), records=records)
+
+            self._recent.append(result)
+
+            if usage['template'] not in self._templates:
+                self._templates[usage['template']] = deque(maxlen=self.template_window)
+
+            self._templates[usage['template']].append(result)
+
+        return result
+
+    def _public(self, usage: dict, **updates) -> dict:
+        """
+        Returns the reportable fields of a usage record. Must be called while holding the lock.
+        """
+        result = {key: value for key, value in usage.items() if not key.startswith('_')} | updates
+        result['cpu_seconds'] = round(self._cpu_seconds(usage), 3)
+        result['wall_seconds'] = round(monotonic() - usage['_started'], 3)
+
+        return result
+
+    def usage(self, redis_name: str) -> dict or None:
+        """
+        Returns the usage of a running TaskChain so far.
+
+        Arguments
+        redis_name (str): The Redis name of the TaskChain.
+        """
+        with self._lock:
+            usage = self._running.get(redis_name)
+
+            return self._public(usage) if usage else None
+
+    def templates(self) -> dict:
+        """
+        Returns aggregates of the most recent finished TaskChains of each template.
+        """
+        with self._lock:
+            windows = {template: list(window) for template, window in self._templates.items()}
+
+        result = {}
+        for template, window in sorted(windows.items()):
+            cpu = [usage['cpu_seconds'] for usage in window]
+            wall = [usage['wall_seconds'] for usage in window]
+            waits = [usage['queue_wait_seconds'] for usage in window if usage['queue_wait_seconds'] is not None]
+            peaks = [usage['peak_allocated_bytes'] for usage in window if usage['peak_allocated_bytes'] is not None]
+            records = [usage['records'] for usage in window if usage['records'] is not None]
+
+            result[template] = {
+                'chains': len(window),
+                'cpu_seconds_mean': round(sum(cpu) / len(cpu), 3),
+                'cpu_seconds_max': max(cpu),
+                'wall_seconds_mean': round(sum(wall) / len(wall), 3),
+                'wall_seconds_max': max(wall),
+                'cpu_utilization': round(sum(cpu) / sum(wall), 3) if sum(wall) else 0,
+                'queue_wait_seconds_mean': round(sum(waits) / len(waits), 3) if waits else None,
+                'peak_allocated_bytes_max': max(peaks) if peaks else None,
+                'records_mean': round(sum(records) / len(records), 1) if records else None,
+            }
+
+        return result
+
+    def snapshot(self) -> dict:
+        """
+        Returns the usage of the running and recently finished TaskChains and the per-template aggregates.
+        """
+        with self._lock:
+            running = [self._public(usage) for usage in self._running.values()]
+            recent = list(self._recent)
+
+        return {
+            'running': running,
+            'recent': recent,
+            'templates': self.templates()
+        }
+
+    def _sample(self):
+        while not self._stop_event.wait(timeout=self.memory_sample_interval_seconds):
+            self.sample_memory()
+
+    def start(self) -> 'ChainAccounting':
+        """
+        Starts tracing memory and the memory sampler when `trace_memory` is enabled.
+        """
+        import tracemalloc
+
+        if not self.trace_memory or (self._sampler and self._sampler.is_alive()):
+            return self
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        self._stop_event.clear()
+        self._sampler = Thread(target=self._sample, name='chain-accounting', daemon=True)
+        self._sampler.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stops the memory sampler. Tracing is left on, as other components may rely on it.
+        """
+        self._stop_event.set()
+
+        if self._sampler and self._sampler.is_alive():
+            self._sampler.join()
@@ -1,17 +1,51 @@
 from typing import Literal
 from logging import getLogger
+from threading import Lock
 
 from requests import JSONDecodeError
 
 logger = getLogger('harvest')
 
+# Methods which may be safely repeated when a request fails before a response is received
+IDEMPOTENT_METHODS = ('delete', 'get', 'head', 'options', 'put')
+
+# Response status codes which indicate a transient failure of an idempotent request
+RETRY_STATUS_CODES = (502, 503, 504)
+
+# The number of leading path segments which identify an endpoint's route when the caller does not name it
+ROUTE_SEGMENTS = 2
+
+
+def endpoint_route(endpoint: str) -> str:
+    """
+    Returns the route of an endpoint for metrics: its first ROUTE_SEGMENTS path segments, with `*` in place of any
+    further segments, which usually hold identifiers. The query string is dropped. Routes keep the number of metric
+    series bounded however many distinct paths are requested.
+
+    Arguments
+    endpoint (str): The endpoint, such as `tasks/get/abc123?full=true`.
+    """
+    segments = [segment for segment in endpoint.split('?')[0].split('/') if segment]
+
+    if len(segments) > ROUTE_SEGMENTS:
+        segments = segments[:ROUTE_SEGMENTS] + ['*']
+
+    return '/'.join(segments)
+
 
 class Api:
     """
-    Represents an Api object that can be used to make requests to the CloudHarvest API.
+    Represents an Api object that can be used to make requests to the CloudHarvest API. Requests share a pooled
+    keep-alive session, so repeated calls reuse warm connections to the API.
     """
 
-    def __init__(self, host: str, port: int, token: str, pem: str = None, verify: (bool, str) = False):
+    def __init__(self, host: str, port: int, token: str, pem: str = None, verify: (bool, str) = False,
+                 pool_maxsize: int = 10,
+                 connect_timeout_seconds: float = 5,
+                 read_timeout_seconds: float = 30,
+                 retries: int = 3,
+                 retry_backoff_seconds: float = 0.5,
+                 retry_backoff_max_seconds: float = 10):
         """
         Initializes the Api object.
 
@@ -21,6 +55,12 @@ class Api:
         token: (str) The token to authenticate with the API.
         pem: (str, optional) The certificate to use for SSL.
         verify: (bool, str, optional) Whether to verify the SSL certificate.
+        pool_maxsize: (int, optional) The maximum number of connections kept open to the API.
+        connect_timeout_seconds: (float, optional) The time allowed to establish a connection to the API.
+        read_timeout_seconds: (float, optional) The time allowed between bytes received from the API.
+        retries: (int, optional) The number of times an idempotent request is retried after a connection error, timeout, or 502/503/504 response.
+        retry_backoff_seconds: (float, optional) The base delay between retries, doubled for every attempt.
+        retry_backoff_max_seconds: (float, optional) The maximum delay between retries.
         """
         self.host = host
         self.port = port
@@ -28,52 +68,140 @@ class Api:
         self.pem = pem
         self.verify = verify
 
-    def request(self, request_type: Literal['get', 'post', 'put', 'delete'], endpoint: str, data: dict = None, **requests_kwargs) -> dict:
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout_seconds = connect_timeout_seconds
+        self.read_timeout_seconds = read_timeout_seconds
+        self.retries = retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.retry_backoff_max_seconds = retry_backoff_max_seconds
+
+        self._session = None
+        self._session_pid = None
+        self._lock = Lock()
+
+        # {endpoint: {'calls', 'errors', 'retries', 'latency_ms_total', 'latency_ms_max'}}
+        self._latency = {}
+
+    @property
+    def session(self):
+        """
+        Returns the pooled session, creating it on first use. A new session is created after the process forks so
+        connections are never shared between processes.
         """
-        Makes an API request to the CloudHarvest API.
+        from os import getpid
+
+        with self._lock:
+            if self._session is None or self._session_pid != getpid():
+                from requests import Session
+                from requests.adapters import HTTPAdapter
+
+                session = Session()
+                session.headers['Authorization'] = f'Bearer {self.token}'
+                session.cert = self.pem
+                session.verify = self.verify
+                session.mount('https://', HTTPAdapter(pool_connections=1,
+                                                      pool_maxsize=self.pool_maxsize,
+                                                      pool_block=False,
+                                                      max_retries=0))
+
+                self._session = session
+                self._session_pid = getpid()
+
+            return self._session
+
+    def close(self):
+        """
+        Closes the pooled session and its connections.
+        """
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def request(self, request_type: Literal['get', 'post', 'put', 'delete'], endpoint: str, data: dict = None,
+                route: str = None, **requests_kwargs) -> dict:
+        """
+        Makes an API request to the CloudHarvest API. Idempotent requests are retried with jittered exponential backoff
+        after connection errors, timeouts, and 502/503/504 responses.
 
         Arguments
-        host: (str) The host of the API.
-        port: (int) The port of the API.
-        token: (str) The token to authenticate with the API.
         request_type: (str) The type of request to make (GET, POST, PUT, DELETE).
         endpoint: (str) The endpoint to make the request to.
         data: (dict) The data to send with the request.
+        route: (str) The route rule of the endpoint, such as `tasks/get/<task_id>`, under which the request's latency
+            and errors are recorded. Defaults to `endpoint_route(endpoint)`.
+        requests_kwargs: Additional arguments for `requests.Session.request`, such as `timeout`.
 
         Returns
         {
             'id': (str) The request ID.
             'status_code': (int) The status code of the response.
             'response': (dict) The response from the API.
+            'headers': (dict) The headers of the response.
         }
         """
 
         from uuid import uuid4
+        from time import perf_counter
         request_id = str(uuid4())
 
         response = None
+        url = f'https://{self.host}:{self.port}/{endpoint}'
+        max_attempts = 1 + (self.retries if request_type.lower() in IDEMPOTENT_METHODS else 0)
+        requests_kwargs.setdefault('timeout', (self.connect_timeout_seconds, self.read_timeout_seconds))
+
+        attempt = 0
+        start = perf_counter()
 
         try:
-            from requests.api import request
-            logger.debug(f'request:{request_id}: {self.host}:{self.port}/{endpoint}')
-            response = request(method=request_type,
-                               url=f'https://{self.host}:{self.port}/{endpoint}',
-                               cert=self.pem,
-                               headers={
-                                   'Authorization': f'Bearer {self.token}'
-                               },
-                               json=data,
-                               verify=self.verify,
-                               **requests_kwargs)
+            while True:
+                attempt += 1
+                error = None
+
+                try:
+                    logger.debug(f'request:{request_id}: {self.host}:{self.port}/{endpoint}')
+                    response = self.session.request(method=request_type,
+                                                    url=url,
+                                                    json=data,
+                                                    **requests_kwargs)
+
+                except Exception as e:
+                    from requests.exceptions import ConnectionError, Timeout
+
+                    if not isinstance(e, (ConnectionError, Timeout)):
+                        raise
+
+                    error = e
+                    response = None
+
+                retryable = error is not None or response.status_code in RETRY_STATUS_CODES
+
+                if not retryable or attempt >= max_attempts:
+                    if error is not None:
+                        raise error
+
+                    break
+
+                delay = self._backoff(attempt)
+                logger.warning(f'request:{request_id}: attempt {attempt} of {max_attempts} failed '
+                               f'({error or response.status_code}); retrying in {delay:.2f} seconds')
+
+                from time import sleep
+                sleep(delay)
 
         except Exception as e:
             logger.error(f'request:{request_id}:An unexpected error occurred: {e}')
 
         finally:
+            self._record_latency(endpoint=f'{request_type.upper()} {route or endpoint_route(endpoint)}',
+                                 seconds=perf_counter() - start,
+                                 retries=attempt - 1,
+                                 error=response is None or response.status_code >= 500)
+
             result = {
                 'id': request_id,
                 'response': self.safe_decode(response),
-                'url': f'https://{self.host}:{self.port}/{endpoint}'
+                'url': url
             }
 
             # Additional fields to include in the response
@@ -85,8 +213,63 @@ class Api:
             for code, default in response_fields:
                 result[code] = getattr(response, code, default)
 
+            result['headers'] = dict(getattr(response, 'headers', None) or {})
+
             return result
 
+    def _backoff(self, attempt: int) -> float:
+        """
+        Returns the delay before the next attempt, using "full jitter" so agents which fail together do not retry
+        together.
+
+        Arguments
+        attempt: (int) The number of the attempt which failed, starting at 1.
+        """
+        from random import uniform
+
+        return uniform(0, min(self.retry_backoff_max_seconds, self.retry_backoff_seconds * 2 ** (attempt - 1)))
+
+    def _record_latency(self, endpoint: str, seconds: float, retries: int, error: bool):
+        from CloudHarvestAgent.prometheus import API_REQUEST_ERRORS, API_REQUEST_SECONDS
+
+        API_REQUEST_SECONDS.observe(seconds, endpoint)
+
+        if error:
+            API_REQUEST_ERRORS.inc(endpoint)
+
+        milliseconds = seconds * 1000
+
+        with self._lock:
+            counters = self._latency.setdefault(endpoint, {
+                'calls': 0,
+                'errors': 0,
+                'retries': 0,
+                'latency_ms_total': 0.0,
+                'latency_ms_max': 0.0
+            })
+
+            counters['calls'] += 1
+            counters['errors'] += int(error)
+            counters['retries'] += retries
+            counters['latency_ms_total'] += milliseconds
+            counters['latency_ms_max'] = max(counters['latency_ms_max'], milliseconds)
+
+    def stats(self) -> dict:
+        """
+        Returns the call, error, retry, and latency counters of each endpoint, keyed by `METHOD route`.
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    'calls': counters['calls'],
+                    'errors': counters['errors'],
+                    'retries': counters['retries'],
+                    'latency_ms_mean': round(counters['latency_ms_total'] / counters['calls'], 3),
+                    'latency_ms_max': round(counters['latency_ms_max'], 3)
+                }
+                for endpoint, counters in self._latency.items()
+            }
+
     @staticmethod
     def safe_decode(response):
         """
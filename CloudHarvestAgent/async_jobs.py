@@ -0,0 +1,434 @@
+"""
+An asyncio implementation of the TaskChainQueue. Queue pickup, claiming, task startup errors, and the removal of finished
+tasks from the processing lists are performed by a single event loop using `redis.asyncio`, so the worker does not hold
+an OS thread while it waits on the queues, and completions are handled by the loop rather than by the executor threads.
+
+The rest of the queue is shared with the threaded engine and still uses synchronous clients: each TaskChain writes its
+own final status from a thread of the default executor, progress and status updates are written by the
+`StatusReporter` thread, and the node heartbeat runs in its own thread. TaskChains themselves are synchronous and run in
+the queue's `max_chains` pool threads or the process pool, so the engine does not raise the concurrency ceiling.
+
+Select this engine with `agent.tasks.engine: asyncio` in `harvest.yaml`.
+"""
+
+from CloudHarvestAgent.jobs import (
+    CLAIM_TASK_SCRIPT,
+    POP_TASKS_SCRIPT,
+    REROUTE_TASK_SCRIPT,
+    RETURN_TASK_SCRIPT,
+    JobQueueStatusCodes,
+    TaskChainQueue
+)
+from CloudHarvestAgent.prometheus import instrument_redis
+from CloudHarvestCoreTasks.tasks import TaskStatusCodes
+
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from logging import getLogger
+
+import asyncio
+
+logger = getLogger('harvest')
+
+# Connection arguments which can be copied from a synchronous Redis connection pool to an asyncio client
+ASYNC_CLIENT_ARGUMENTS = (
+    'client_name',
+    'db',
+    'decode_responses',
+    'encoding',
+    'encoding_errors',
+    'health_check_interval',
+    'host',
+    'password',
+    'port',
+    'socket_connect_timeout',
+    'socket_keepalive',
+    'socket_timeout',
+    'ssl_ca_certs',
+    'ssl_cert_reqs',
+    'ssl_certfile',
+    'ssl_keyfile',
+    'username',
+)
+
+
+def async_client(client):
+    """
+    Creates a `redis.asyncio` client which connects to the same server as a synchronous silo client.
+
+    Arguments
+    client (StrictRedis): The synchronous client returned by a silo's `connect()` method.
+
+    Returns
+    A `redis.asyncio.Redis` client.
+    """
+    from redis.asyncio import Redis
+
+    pool = client.connection_pool
+    kwargs = {
+        key: value
+        for key, value in pool.connection_kwargs.items()
+        if key in ASYNC_CLIENT_ARGUMENTS
+    }
+
+    if pool.connection_kwargs.get('path'):
+        kwargs['unix_socket_path'] = pool.connection_kwargs['path']
+
+    if pool.connection_class.__name__ == 'SSLConnection':
+        kwargs['ssl'] = True
+
+    return Redis(**kwargs)
+
+
+class AsyncTaskChainQueue(TaskChainQueue):
+    """
+    A TaskChainQueue whose worker is an asyncio event loop. Configuration, task claiming, processing lists, and
+    execution backends are shared with the threaded TaskChainQueue.
+    """
+
+    engine = 'asyncio'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Created by the event loop when the worker starts
+        self._loop = None
+        self._async_wake_event = None
+        self._async_task_silo = None
+        self._async_pop_script = None
+        self._async_claim_script = None
+        self._async_reroute_script = None
+        self._async_return_script = None
+        self._completions = set()               # References to pending completion coroutines
+
+    def queue_summary(self) -> dict:
+        """
+        Returns the queue summary published by the node heartbeat, along with the state of the event loop.
+        """
+        return dict(sorted((super().queue_summary() | {
+            'event_loop_running': self._loop is not None,
+            'pending_completions': len(self._completions)
+        }).items()))
+
+    def _worker(self):
+        """
+        Runs the event loop for as long as the queue is running.
+        """
+        asyncio.run(self._run())
+
+    async def _run(self):
+        """
+        The asyncio equivalent of `TaskChainQueue._worker()`.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._async_wake_event = asyncio.Event()
+        self._async_task_silo = instrument_redis(async_client(self.task_silo), 'harvest-tasks')
+        self._async_pop_script = self._async_task_silo.register_script(POP_TASKS_SCRIPT)
+        self._async_claim_script = self._async_task_silo.register_script(CLAIM_TASK_SCRIPT)
+        self._async_reroute_script = self._async_task_silo.register_script(REROUTE_TASK_SCRIPT)
+        self._async_return_script = self._async_task_silo.register_script(RETURN_TASK_SCRIPT)
+
+        try:
+            while self.status == JobQueueStatusCodes.running:
+                free_slots = self.concurrency_limit - len(self.tasks.keys())
+                new_tasks = []
+                wait = True
+
+                if free_slots > 0:
+                    try:
+                        new_tasks = await self._get_tasks_async(count=free_slots)
+
+                        # A blocking pickup which found nothing already waited on the queue
+                        wait = not self._pickup_blocked
+
+                    except Exception as ex:
+                        logger.error(f'Could not retrieve tasks from the queue: {ex.args}')
+
+                for new_task in new_tasks:
+                    await self._start_task_chain_async(new_task)
+
+                # Periodically return the tasks of crashed agents to the queue
+                if self._orphan_recovery_due():
+                    try:
+                        await self._loop.run_in_executor(None, self.recover_orphaned_tasks)
+
+                    except Exception as e:
+                        logger.error(f'Could not recover orphaned tasks: {e.args}')
+
+                logger.debug('queue worker cycle complete')
+
+                if new_tasks or not wait:
+                    continue
+
+                # Completing chains set the wake event so the freed slots are filled immediately
+                try:
+                    await asyncio.wait_for(self._async_wake_event.wait(), timeout=self.queue_check_interval_seconds)
+
+                except asyncio.TimeoutError:
+                    pass
+
+                self._async_wake_event.clear()
+
+        finally:
+            if self._completions:
+                await asyncio.gather(*self._completions, return_exceptions=True)
+
+            self._loop = None
+
+            await self._async_task_silo.aclose()
+
+    async def _get_tasks_async(self, count: int) -> list:
+        """
+        The asyncio equivalent of `TaskChainQueue._get_tasks()`.
+
+        Arguments
+        count (int): The maximum number of tasks to claim.
+
+        Returns
+        A list of the claimed tasks.
+        """
+        self._pickup_blocked = False
+        queue_names = self.queue_names
+
+        if count <= 0 or not queue_names:
+            return []
+
+        queue_state = await self._get_queue_state_async() if self.pickup_scheduler.needs_queue_state else None
+        plan = self._pickup_plan(count=count, queue_state=queue_state)
+
+        tasks = await self._claim_tasks_async(count=count, plan=plan)
+
+        if tasks or not self.blocking_pickup:
+            return tasks
+
+        # No task was claimed; wait for a new task in the queues which may take one without holding up the event loop
+        plan = self._pickup_plan(count=count, queue_state=queue_state, waiting=True)
+        waiting_queues = [queue_name for queue_name, quota in plan if quota > 0]
+
+        if not waiting_queues:
+            return []
+
+        self._pickup_blocked = True
+        popped = await self._async_task_silo.brpop(waiting_queues, timeout=self.queue_check_interval_seconds)
+
+        if not popped:
+            return []
+
+        queue_name, task_redis_name = popped
+
+        return await self._claim_tasks_async(count=count, plan=plan, seed_queue=queue_name, seed_task=task_redis_name)
+
+    async def _claim_tasks_async(self, count: int, plan: list, seed_queue: str = None, seed_task: str = None) -> list:
+        """
+        The asyncio equivalent of `TaskChainQueue._claim_tasks()`.
+
+        Arguments
+        count (int): The maximum number of tasks to pop.
+        plan (list): The (queue name, maximum tasks to claim) of each queue, as returned by `_pickup_plan()`.
+        seed_queue (str, optional): The queue a task was already popped from.
+        seed_task (str, optional): The Redis name of a task which was already popped from `seed_queue`.
+
+        Returns
+        A list of the claimed tasks.
+        """
+        keys, args = self._pop_arguments(count=count, plan=plan, seed_queue=seed_queue, seed_task=seed_task)
+        popped = []
+
+        try:
+            popped = self._parse_popped_tasks(keys, await self._async_pop_script(keys=keys, args=args))
+
+            if not popped:
+                return []
+
+            claimed_at = datetime.now(tz=timezone.utc).isoformat()
+
+            async with self._async_task_silo.pipeline(transaction=False) as pipeline:
+                for queue_name, task_redis_name in popped:
+                    claim_keys, claim_args = self._claim_task_arguments(queue_name, task_redis_name, claimed_at)
+                    await self._async_claim_script(keys=claim_keys, args=claim_args, client=pipeline)
+
+                claimed = await pipeline.execute()
+
+        except Exception:
+            await self._return_tasks_async(popped=popped, seed_queue=seed_queue, seed_task=seed_task)
+            raise
+
+        tasks, reroutes = self._parse_claimed_tasks(popped, claimed)
+
+        if reroutes:
+            try:
+                async with self._async_task_silo.pipeline(transaction=False) as pipeline:
+                    for reroute_keys, reroute_args in reroutes:
+                        await self._async_reroute_script(keys=reroute_keys, args=reroute_args, client=pipeline)
+
+                    await pipeline.execute()
+
+            except Exception as e:
+                # The tasks stay in this agent's processing lists and are recovered once the agent stops
+                logger.error(f'Could not move {len(reroutes)} tasks to their account queues: {e.args}')
+
+        return tasks
+
+    async def _return_tasks_async(self, popped: list, seed_queue: str = None, seed_task: str = None):
+        """
+        The asyncio equivalent of `TaskChainQueue._return_tasks()`.
+
+        Arguments
+        popped (list): The (queue name, task redis name) of each popped task.
+        seed_queue (str, optional): The queue the seed task was popped from.
+        seed_task (str, optional): The Redis name of the seed task.
+        """
+        returned = self._return_arguments(popped=popped, seed_queue=seed_queue, seed_task=seed_task)
+
+        if not returned:
+            return
+
+        try:
+            async with self._async_task_silo.pipeline(transaction=False) as pipeline:
+                for return_keys, return_args in returned:
+                    await self._async_return_script(keys=return_keys, args=return_args, client=pipeline)
+
+                await pipeline.execute()
+
+        except Exception as e:
+            logger.error(f'Could not return tasks {[keys[0] for keys, args in returned]} to their queues: {e.args}')
+
+    async def _get_queue_state_async(self) -> dict:
+        """
+        The asyncio equivalent of `TaskChainQueue._get_queue_state()`.
+        """
+        queue_names = self.queue_names
+
+        async with self._async_task_silo.pipeline(transaction=False) as pipeline:
+            for queue_name in queue_names:
+                pipeline.llen(queue_name)
+                pipeline.lindex(queue_name, -1)
+
+            peeked = await pipeline.execute()
+
+        oldest_tasks = [task_redis_name for task_redis_name in peeked[1::2] if task_redis_name]
+
+        async with self._async_task_silo.pipeline(transaction=False) as pipeline:
+            for task_redis_name in oldest_tasks:
+                pipeline.hmget(task_redis_name, 'enqueued', 'created')
+
+            enqueued = await pipeline.execute()
+
+        return self._parse_queue_state(queue_names, peeked, dict(zip(oldest_tasks, enqueued)))
+
+    async def _start_task_chain_async(self, new_task: dict):
+        """
+        The asyncio equivalent of `TaskChainQueue._start_task_chain()`.
+
+        Arguments
+        new_task (dict): The claimed task.
+        """
+        try:
+            task_chain = self._submit_task_chain(new_task)
+
+            if task_chain is None:
+                logger.error(f'No task chain class found for {new_task["name"]}.')
+                await self._report_error_async(new_task)
+
+        except Exception as ex:
+            logger.error(f'Error while adding task chain {new_task.get("id")} to the JobQueue: {ex.args}')
+            await self._report_error_async(new_task)
+
+    async def _report_error_async(self, new_task: dict):
+        """
+        Reports a task which could not be started as an error and removes it from this agent's processing list.
+
+        Arguments
+        new_task (dict): The claimed task.
+        """
+        try:
+            async with self._async_task_silo.pipeline(transaction=False) as pipeline:
+                pipeline.hset(name=new_task['redis_name'], key='status', value=TaskStatusCodes.error)
+                pipeline.lrem(new_task['processing_list'], 1, new_task['redis_name'])
+                await pipeline.execute()
+
+        except Exception as e:
+            logger.error(f'{new_task["redis_name"]} failed to report status to server: {e.args}')
+
+    def _wake(self):
+        """
+        Wakes the event loop so it can fill free slots or notice a status change.
+        """
+        super()._wake()
+
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._async_wake_event.set)
+
+            except RuntimeError:
+                # The event loop closed
+                pass
+
+    def _on_chain_complete(self, redis_name: str, future: Future):
+        """
+        Called by the executor as soon as a TaskChain finishes. Completion is handed to the event loop; once the loop
+        has stopped, the threaded completion is used instead.
+
+        Arguments
+        redis_name (str): The Redis name of the completed TaskChain.
+        future (Future): The future which ran the TaskChain.
+        """
+        loop = self._loop
+
+        try:
+            if loop is None:
+                raise RuntimeError('The event loop is not running.')
+
+            loop.call_soon_threadsafe(self._schedule_completion, redis_name, future)
+
+        except RuntimeError:
+            super()._on_chain_complete(redis_name, future)
+
+    def _schedule_completion(self, redis_name: str, future: Future):
+        completion = asyncio.create_task(self._complete_async(redis_name, future))
+        self._completions.add(completion)
+        completion.add_done_callback(self._completions.discard)
+
+    async def _complete_async(self, redis_name: str, future: Future):
+        """
+        The asyncio equivalent of `TaskChainQueue._on_chain_complete()`.
+
+        Arguments
+        redis_name (str): The Redis name of the completed TaskChain.
+        future (Future): The future which ran the TaskChain.
+        """
+        with self._tasks_lock:
+            task_object = self.tasks.get(redis_name)
+
+        if task_object is None:
+            return
+
+        task_chain = task_object['chain']
+
+        try:
+            if future.exception():
+                logger.error(f'{redis_name} ({task_chain.template_identifier}) raised an exception: {future.exception().args}')
+
+                if isinstance(future.exception(), BrokenProcessPool):
+                    self._replace_broken_process_pool(task_object)
+
+            # The TaskChain reports its own final status using its synchronous client, so it is written from a thread
+            await self._loop.run_in_executor(None, self._report_final_status, redis_name, task_object)
+
+        except Exception as ex:
+            logger.error(f'{redis_name} failed to report its final status: {ex.args}')
+
+        finally:
+            self._remove_task_chain(redis_name, task_object)
+
+            try:
+                await self._async_task_silo.lrem(task_object['processing_list'], 1, redis_name)
+
+            except Exception as e:
+                logger.error(f'{redis_name} could not be removed from {task_object["processing_list"]}: {e.args}')
+
+            logger.info(f'{redis_name} ({task_chain.template_identifier}) removed from the task pool with status: {task_chain.status}')
+
+            self._async_wake_event.set()
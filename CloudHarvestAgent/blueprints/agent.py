@@ -14,6 +14,18 @@ agent_blueprint = HarvestAgentBlueprint(
     url_prefix='/agent'
 )
 
+@agent_blueprint.route(rule='profile', methods=['GET'])
+def profile() -> Response:
+    """
+    Samples the stacks of every thread of the agent for `seconds` (default 10) and returns the collapsed stacks and the
+    functions with the most samples. With `format=collapsed`, only the collapsed stacks are returned.
+    """
+    from CloudHarvestAgent.blueprints.tasks import profile_response
+    from CloudHarvestCoreTasks.environment import Environment
+
+    return profile_response(Environment.get('queue_object').profile_agent(seconds=request.args.get('seconds', 10, type=float)))
+
+
 @agent_blueprint.route(rule='reload', methods=['GET'])
 def reload() -> Response:
     """
@@ -0,0 +1,23 @@
+"""
+The metrics blueprint serves the agent's metrics in the Prometheus text exposition format.
+"""
+
+from CloudHarvestCoreTasks.blueprints import HarvestAgentBlueprint
+from flask import Response
+
+# Blueprint Configuration
+metrics_blueprint = HarvestAgentBlueprint(
+    'metrics_bp', __name__
+)
+
+
+@metrics_blueprint.route(rule='/metrics', methods=['GET'])
+def metrics() -> Response:
+    """
+    Returns the agent's metrics for Prometheus to scrape. Under gunicorn, the metrics are those of the supervisor
+    process, which runs the queue and the heartbeat.
+    """
+    from CloudHarvestAgent.prometheus import CONTENT_TYPE
+    from CloudHarvestCoreTasks.environment import Environment
+
+    return Response(Environment.get('queue_object').prometheus_metrics(), content_type=CONTENT_TYPE)
@@ -31,11 +31,12 @@ def start() -> Response:
     """
     Starts the job queue.
     """
-    from CloudHarvestAgent.app import CloudHarvestNode
+    from CloudHarvestCoreTasks.environment import Environment
 
-    result = CloudHarvestNode.job_queue.start()
+    queue = Environment.get('queue_object')
+    queue.start()
 
-    return jsonify(result)
+    return jsonify(queue.detailed_status())
 
 
 @queue_blueprint.route(rule='stop', methods=['GET'])
@@ -43,11 +44,12 @@ def stop() -> Response:
     """
     Stops the job queue.
     """
-    from CloudHarvestAgent.app import CloudHarvestNode
+    from CloudHarvestCoreTasks.environment import Environment
 
-    result = CloudHarvestNode.job_queue.stop()
+    queue = Environment.get('queue_object')
+    queue.stop()
 
-    return jsonify(result)
+    return jsonify(queue.detailed_status())
 
 
 @queue_blueprint.route(rule='status', methods=['GET'])
@@ -55,9 +57,9 @@ def status() -> Response:
     """
     Returns a detailed status of the job queue.
     """
-    from CloudHarvestAgent.app import CloudHarvestNode
+    from CloudHarvestCoreTasks.environment import Environment
 
-    result = CloudHarvestNode.job_queue.detailed_status()
+    result = Environment.get('queue_object').detailed_status()
 
     return jsonify({
         'success': bool(result),
@@ -15,6 +15,42 @@ tasks_blueprint = HarvestAgentBlueprint(
     url_prefix='/tasks'
 )
 
+def profile_response(profile: dict) -> Response:
+    """
+    Returns a profile as JSON, or only its collapsed stacks as text when the request has `format=collapsed`.
+
+    Arguments
+    profile (dict): The profile returned by `TaskChainQueue.profile_task()` or `TaskChainQueue.profile_agent()`.
+    """
+    if request.args.get('format') == 'collapsed' and 'error' not in profile:
+        return Response(profile['collapsed'] + '\n', content_type='text/plain; charset=utf-8')
+
+    return jsonify(profile)
+
+
+@tasks_blueprint.route(rule='profile/<task_id>', methods=['GET'])
+def profile(task_id: str) -> Response:
+    """
+    Samples the stacks of a running TaskChain's thread for `seconds` (default 10) and returns the collapsed stacks and
+    the functions with the most samples. With `format=collapsed`, only the collapsed stacks are returned.
+
+    Arguments:
+        task_id (str): The ID of the TaskChain to profile.
+
+    Returns:
+        A Response object containing the profile.
+    """
+
+    from CloudHarvestCoreTasks.environment import Environment
+
+    result = Environment.get('queue_object').profile_task(task_id, seconds=request.args.get('seconds', 10, type=float))
+
+    if result is None:
+        return jsonify({'error': 'Task not found.'})
+
+    return profile_response(result)
+
+
 @tasks_blueprint.route(rule='shutdown/<task_id>', methods=['GET'])
 def terminate(task_id: str) -> Response:
     """
@@ -27,16 +63,13 @@ def terminate(task_id: str) -> Response:
         A Response object containing the result of the operation.
     """
 
-    from CloudHarvestAgent.app import CloudHarvestNode
-
-    task_object = CloudHarvestNode.job_queue.get(task_id)
+    from CloudHarvestCoreTasks.environment import Environment
 
-    if task_object is None:
+    if not Environment.get('queue_object').terminate_task(task_id):
         logger.warning(f'Attempt to terminate task {task_id} failed. No task with that name was found.')
         return jsonify({'error': 'Task not found.'})
 
     else:
-        task_object.terminate()
         return jsonify({'message': 'Task terminated.'})
 
 
@@ -52,12 +85,12 @@ def status(task_id: str) -> Response:
         A Response object containing the status of the TaskChain
     """
 
-    from CloudHarvestAgent.app import CloudHarvestNode
+    from CloudHarvestCoreTasks.environment import Environment
 
-    task_object = CloudHarvestNode.job_queue.get(task_id)
+    task_status = Environment.get('queue_object').task_status(task_id)
 
-    if task_object is None:
+    if task_status is None:
         return jsonify({'error': 'Task not found.'})
 
     else:
-        return jsonify(task_object.status)
+        return jsonify(task_status)
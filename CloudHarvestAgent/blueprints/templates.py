@@ -4,6 +4,9 @@ from logging import getLogger
 
 logger = getLogger('harvest')
 
+# The largest page of templates returned by `list_templates`
+MAX_PAGE_SIZE = 1000
+
 
 # Blueprint Configuration
 templates_blueprint = HarvestAgentBlueprint(
@@ -11,18 +14,104 @@ templates_blueprint = HarvestAgentBlueprint(
     url_prefix='/templates'
 )
 
+
+def not_modified(etag: str) -> Response or None:
+    """
+    Returns a 304 response if the client already holds the representation identified by `etag`.
+
+    Arguments
+    etag (str): The ETag of the representation.
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+
+        return response
+
+    return None
+
+
 @templates_blueprint.route(rule='/get_template/<template_type>/<template_name>', methods=['GET'])
 def get_template(template_type: str, template_name: str) -> Response:
-    from CloudHarvestCorePluginManager.registry import Registry
-    template_definition = Registry.find(result_key='cls', category=template_type, name=template_name, limit=1)
+    """
+    Returns a template. Supports `If-None-Match` with the template's ETag.
+
+    Arguments
+    template_type (str): The template category, such as `template_reports`.
+    template_name (str): The template name.
+    """
+    from CloudHarvestAgent.template_catalog import template_catalog
+    entry = template_catalog.get(category=template_type, name=template_name)
+
+    if entry is None:
+        return jsonify(error=f'Template `{template_name}` of type `{template_type}` not found.'), 404
 
-    if template_definition:
-        return jsonify(template_definition[0])
+    response = not_modified(entry['etag'])
+
+    if response is None:
+        response = Response(entry['body'], mimetype='application/json')
+        response.set_etag(entry['etag'])
+
+    return response
 
-    else:
-        return Response({'error': f'Template `{template_name}` of type `{template_type}` not found.'}, status=404)
 
 @templates_blueprint.route(rule='/list_templates', methods=['GET'])
 def list_templates() -> Response:
-    pass
+    """
+    Lists the templates registered on this agent along with the ETag and size of each one. Supports `If-None-Match`
+    with the ETag of the page.
+
+    Arguments
+    category (str, optional): A category or shell-style pattern, such as `template_*`.
+    name (str, optional): A name or shell-style pattern.
+    offset (int, optional): The number of matching templates to skip. Defaults to 0.
+    limit (int, optional): The maximum number of templates to return. Defaults to and may not exceed 1000.
+    """
+    from CloudHarvestAgent.template_catalog import template_catalog
+    from hashlib import sha256
+
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', MAX_PAGE_SIZE)), 0), MAX_PAGE_SIZE)
+
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': '`offset` and `limit` must be integers.',
+            'result': []
+        }), 400
+
+    entries = template_catalog.find(category=request.args.get('category'), name=request.args.get('name'))
+    page = entries[offset:offset + limit]
+
+    # The page's ETag covers its templates' content and the total, so it changes whenever the page would
+    etag = sha256(
+        '\n'.join([str(len(entries))] + [f'{entry["category"]}/{entry["name"]}:{entry["etag"]}' for entry in page])
+        .encode('utf-8')
+    ).hexdigest()[:32]
+
+    response = not_modified(etag)
+
+    if response is None:
+        response = jsonify({
+            'success': True,
+            'message': 'OK',
+            'meta': {
+                'catalog_etag': template_catalog.etag,
+                'limit': limit,
+                'offset': offset,
+                'total': len(entries)
+            },
+            'result': [
+                {
+                    'category': entry['category'],
+                    'name': entry['name'],
+                    'etag': entry['etag'],
+                    'size': entry['size']
+                }
+                for entry in page
+            ]
+        })
+        response.set_etag(etag)
 
+    return response
@@ -0,0 +1,273 @@
+"""
+Adaptive concurrency control for the TaskChainQueue. Whether an agent should run 4 or 40 TaskChains at once depends on
+whether they wait on throttled APIs or crunch datasets, so rather than always running `max_chains` TaskChains, the
+controller adjusts the number of TaskChains the queue admits between `min_chains` and `max_chains`.
+
+The controller uses additive increase, multiplicative decrease (AIMD). Every `interval_seconds` it reads the host's CPU
+utilization and the agent's resident memory from /proc, and the latency and error rate of the TaskChains which finished
+since its last decision. When any signal is over its limit, the limit is multiplied by `decrease_factor`. When every
+signal is healthy and the queue is using all of its slots, the limit is raised by `increase_step`.
+
+Chain latency is compared per template with a slowly moving baseline, so a mix of short and long templates does not
+look like a slowdown. On hosts without /proc, only the latency and error rate signals are used.
+"""
+
+from collections import deque
+from datetime import datetime, timezone
+from logging import getLogger
+from threading import Event, Lock, Thread
+
+logger = getLogger('harvest')
+
+# The number of decisions kept for the queue status
+DECISION_HISTORY = 20
+
+
+def read_cpu_times() -> tuple or None:
+    """
+    Returns the host's (busy, total) CPU time in clock ticks from /proc/stat, or None when it cannot be read.
+    """
+    try:
+        with open('/proc/stat') as stat_file:
+            fields = [int(value) for value in stat_file.readline().split()[1:]]
+
+    except (OSError, ValueError):
+        return None
+
+    # user nice system idle iowait irq softirq steal; guest time is already included in user and nice
+    total = sum(fields[:8])
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+
+    return total - idle, total
+
+
+def read_rss_bytes() -> int or None:
+    """
+    Returns the resident memory of this process from /proc/self/status, or None when it cannot be read.
+    """
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+class AdaptiveConcurrency:
+    """
+    Adjusts a concurrency limit between `min_chains` and `max_chains` based on host load and TaskChain outcomes.
+    """
+
+    def __init__(self, max_chains: int,
+                 min_chains: int = 1,
+                 initial_chains: int = None,
+                 interval_seconds: float = 5,
+                 cpu_limit: float = 0.85,
+                 rss_limit_mb: float = None,
+                 error_rate_limit: float = 0.25,
+                 latency_ratio_limit: float = 2.0,
+                 increase_step: int = 1,
+                 decrease_factor: float = 0.75,
+                 running=None,
+                 **kwargs):
+        """
+        Arguments
+        max_chains (int): The highest limit, which is the queue's `max_chains`.
+        min_chains (int, optional): The lowest limit.
+        initial_chains (int, optional): The limit before the first decision. Defaults to `min_chains`.
+        interval_seconds (float, optional): How often the limit is adjusted.
+        cpu_limit (float, optional): The host CPU utilization, from 0 to 1, above which the limit is decreased.
+        rss_limit_mb (float, optional): The resident memory of the agent above which the limit is decreased.
+        error_rate_limit (float, optional): The fraction of TaskChains ending in error above which the limit is decreased.
+        latency_ratio_limit (float, optional): How many times slower than their template's baseline TaskChains may
+            finish, on average, before the limit is decreased.
+        increase_step (int, optional): The number of chains added to the limit when the agent is healthy and busy.
+        decrease_factor (float, optional): The factor the limit is multiplied by when the agent is overloaded.
+        running (callable, optional): Returns the number of running TaskChains. The limit is only increased while all
+            of its slots are in use.
+        """
+        self.max_chains = max_chains
+        self.min_chains = max(min(min_chains, max_chains), 1)
+        self.interval_seconds = interval_seconds
+        self.cpu_limit = cpu_limit
+        self.rss_limit_bytes = rss_limit_mb * 1024 * 1024 if rss_limit_mb else None
+        self.error_rate_limit = error_rate_limit
+        self.latency_ratio_limit = latency_ratio_limit
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.running = running
+
+        self.limit = min(max(initial_chains or self.min_chains, self.min_chains), self.max_chains)
+        self.increases = 0
+        self.decreases = 0
+        self.decisions = deque(maxlen=DECISION_HISTORY)
+        self.signals = {}
+
+        self._lock = Lock()
+        self._baselines = {}        # {template_identifier: seconds}, a slow moving average of chain durations
+        self._completions = 0
+        self._errors = 0
+        self._latency_ratios = 0.0
+        self._latency_samples = 0
+        self._cpu_times = read_cpu_times()
+        self._stop_event = Event()
+        self._thread = None
+
+    def record(self, template_identifier: str, duration_seconds: float, errored: bool = False):
+        """
+        Records a finished TaskChain.
+
+        Arguments
+        template_identifier (str): The template of the TaskChain.
+        duration_seconds (float): The time the TaskChain spent running.
+        errored (bool, optional): True if the TaskChain ended in error.
+        """
+        with self._lock:
+            self._completions += 1
+
+            if errored:
+                self._errors += 1
+                return
+
+            baseline = self._baselines.get(template_identifier)
+
+            if baseline:
+                self._latency_ratios += duration_seconds / baseline
+                self._latency_samples += 1
+                self._baselines[template_identifier] = 0.9 * baseline + 0.1 * duration_seconds
+
+            elif duration_seconds > 0:
+                self._baselines[template_identifier] = duration_seconds
+
+    def _read_signals(self) -> dict:
+        """
+        Returns the signals measured since the previous decision and starts a new window.
+        """
+        signals = {}
+
+        cpu_times = read_cpu_times()
+        if cpu_times and self._cpu_times and cpu_times[1] > self._cpu_times[1]:
+            signals['cpu'] = round((cpu_times[0] - self._cpu_times[0]) / (cpu_times[1] - self._cpu_times[1]), 3)
+
+        self._cpu_times = cpu_times
+
+        rss_bytes = read_rss_bytes()
+        if rss_bytes is not None:
+            signals['rss_mb'] = round(rss_bytes / 1024 / 1024, 1)
+
+        with self._lock:
+            if self._completions:
+                signals['error_rate'] = round(self._errors / self._completions, 3)
+
+            if self._latency_samples:
+                signals['latency_ratio'] = round(self._latency_ratios / self._latency_samples, 3)
+
+            signals['completions'] = self._completions
+
+            self._completions = 0
+            self._errors = 0
+            self._latency_ratios = 0.0
+            self._latency_samples = 0
+
+        return signals
+
+    def adjust(self) -> int:
+        """
+        Measures the signals and raises or lowers the limit.
+
+        Returns
+        The new limit.
+        """
+        signals = self._read_signals()
+        self.signals = signals
+
+        overloaded = [
+            reason
+            for reason, over in (
+                ('cpu', self.cpu_limit and signals.get('cpu', 0) > self.cpu_limit),
+                ('rss', self.rss_limit_bytes and signals.get('rss_mb', 0) * 1024 * 1024 > self.rss_limit_bytes),
+                ('error_rate', self.error_rate_limit and signals.get('error_rate', 0) > self.error_rate_limit),
+                ('latency', self.latency_ratio_limit and signals.get('latency_ratio', 0) > self.latency_ratio_limit),
+            )
+            if over
+        ]
+
+        previous = self.limit
+
+        if overloaded:
+            self.limit = max(int(self.limit * self.decrease_factor), self.min_chains)
+            reason = ', '.join(overloaded)
+
+        elif self.running is None or self.running() >= self.limit:
+            self.limit = min(self.limit + self.increase_step, self.max_chains)
+            reason = 'saturated'
+
+        else:
+            reason = 'idle slots'
+
+        if self.limit != previous:
+            if self.limit > previous:
+                self.increases += 1
+
+            else:
+                self.decreases += 1
+
+            self.decisions.append({
+                'timestamp': datetime.now(tz=timezone.utc).isoformat(),
+                'from': previous,
+                'to': self.limit,
+                'reason': reason,
+                'signals': signals
+            })
+
+            logger.info(f'adaptive concurrency: {previous} -> {self.limit} chains ({reason})')
+
+        return self.limit
+
+    def _run(self):
+        while not self._stop_event.wait(timeout=self.interval_seconds):
+            try:
+                self.adjust()
+
+            except Exception as e:
+                logger.error(f'adaptive concurrency: could not adjust the limit: {e.args}')
+
+    def start(self) -> 'AdaptiveConcurrency':
+        """
+        Starts adjusting the limit every `interval_seconds`.
+        """
+        if self._thread and self._thread.is_alive():
+            return self
+
+        self._stop_event.clear()
+        self._thread = Thread(target=self._run, name='adaptive-concurrency', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stops adjusting the limit.
+        """
+        self._stop_event.set()
+
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+
+    def stats(self) -> dict:
+        """
+        Returns the current limit, its bounds, the latest signals, and the recent decisions.
+        """
+        return {
+            'decisions': list(self.decisions),
+            'decreases': self.decreases,
+            'increases': self.increases,
+            'limit': self.limit,
+            'max_chains': self.max_chains,
+            'min_chains': self.min_chains,
+            'signals': self.signals
+        }
@@ -0,0 +1,163 @@
+"""
+A deadline scheduler for the TaskChainQueue. Every running TaskChain has a deadline derived from
+`chain_timeout_seconds` or a per-template override. Deadlines are kept in a min-heap which a single thread sleeps on
+until the earliest one passes, so the cost of tracking deadlines does not grow with how often they are checked, and
+a deadline fires within milliseconds of passing however many TaskChains are running.
+
+Cancelled and rescheduled deadlines are removed lazily: their heap entries are skipped when they reach the top of the
+heap, and the heap is compacted when stale entries outnumber live ones.
+"""
+
+from heapq import heapify, heappop, heappush
+from itertools import count
+from logging import getLogger
+from threading import Condition, Thread
+from time import monotonic
+
+logger = getLogger('harvest')
+
+# Stale heap entries tolerated before the heap is rebuilt
+COMPACTION_THRESHOLD = 64
+
+
+class DeadlineStages:
+    """
+    The stages of a TaskChain's deadline. When the `terminate` deadline passes the TaskChain is directed to terminate
+    and given a grace period; when the `escalate` deadline passes the TaskChain is abandoned and its slot freed.
+    """
+    terminate = 'terminate'
+    escalate = 'escalate'
+
+
+class DeadlineScheduler:
+    """
+    Calls `on_deadline(key, stage)` from its own thread when a scheduled deadline passes.
+    """
+
+    def __init__(self, on_deadline):
+        """
+        Arguments
+        on_deadline (callable): Called with the key and stage of each deadline which passes.
+        """
+        self.on_deadline = on_deadline
+
+        self._heap = []                 # [(deadline, sequence, key, stage)]
+        self._entries = {}              # {key: sequence} of each live deadline
+        self._sequence = count()
+        self._condition = Condition()
+        self._running = False
+        self._thread = None
+
+        self.fired = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, key: str, delay_seconds: float, stage: str = DeadlineStages.terminate):
+        """
+        Schedules a deadline `delay_seconds` from now, replacing any deadline already scheduled for `key`.
+
+        Arguments
+        key (str): Identifies the deadline, such as the Redis name of a TaskChain.
+        delay_seconds (float): The number of seconds until the deadline.
+        stage (str, optional): Passed to `on_deadline` when the deadline passes.
+        """
+        deadline = monotonic() + delay_seconds
+
+        with self._condition:
+            sequence = next(self._sequence)
+            self._entries[key] = sequence
+            heappush(self._heap, (deadline, sequence, key, stage))
+
+            # Wake the scheduler thread if this is now the earliest deadline
+            if self._heap[0][1] == sequence:
+                self._condition.notify()
+
+    def cancel(self, key: str) -> bool:
+        """
+        Cancels the deadline of `key`.
+
+        Arguments
+        key (str): Identifies the deadline.
+
+        Returns
+        True if a deadline was cancelled.
+        """
+        with self._condition:
+            cancelled = self._entries.pop(key, None) is not None
+
+            if len(self._heap) > 2 * len(self._entries) + COMPACTION_THRESHOLD:
+                self._heap = [entry for entry in self._heap if self._entries.get(entry[2]) == entry[1]]
+                heapify(self._heap)
+
+        return cancelled
+
+    def _next_due(self) -> tuple or None:
+        """
+        Waits for the earliest live deadline to pass and removes it from the heap. Must be called while holding the
+        condition. Returns None when the scheduler is stopped.
+        """
+        while self._running:
+            if not self._heap:
+                self._condition.wait()
+                continue
+
+            deadline, sequence, key, stage = self._heap[0]
+
+            # Skip deadlines which were cancelled or rescheduled
+            if self._entries.get(key) != sequence:
+                heappop(self._heap)
+                continue
+
+            wait_seconds = deadline - monotonic()
+
+            if wait_seconds > 0:
+                self._condition.wait(timeout=wait_seconds)
+                continue
+
+            heappop(self._heap)
+            del self._entries[key]
+
+            return key, stage
+
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due = self._next_due()
+
+            if due is None:
+                return
+
+            self.fired += 1
+
+            try:
+                self.on_deadline(*due)
+
+            except Exception as e:
+                logger.error(f'deadlines: handling the {due[1]} deadline of {due[0]} failed: {e.args}')
+
+    def start(self) -> 'DeadlineScheduler':
+        """
+        Starts the scheduler thread.
+        """
+        if self._thread and self._thread.is_alive():
+            return self
+
+        self._running = True
+        self._thread = Thread(target=self._run, name='deadline-scheduler', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stops the scheduler thread. Scheduled deadlines are kept and fire once the scheduler is started again.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
@@ -0,0 +1,382 @@
+"""
+Execution backends for TaskChains. By default, TaskChains run in the TaskChainQueue's thread pool. CPU-heavy TaskChains
+may instead be run in a process pool so they do not contend with every other TaskChain on the agent for the GIL.
+
+TaskChains which run in the process pool are built and run entirely within the child process. The child reports the
+results and status of the TaskChain to Redis itself, so only a small summary is returned to the parent. While the
+TaskChain runs, its status and termination requests are exchanged through a small shared memory block.
+"""
+
+from CloudHarvestCoreTasks.chains import BaseTaskChain
+from CloudHarvestCoreTasks.environment import Environment
+from CloudHarvestCoreTasks.tasks import TaskStatusCodes
+
+from concurrent.futures import Future
+from logging import getLogger
+from multiprocessing.shared_memory import SharedMemory
+
+logger = getLogger('harvest')
+
+# Layout of the shared memory block: the first byte is a control flag set by the parent, the next four bytes are the
+# process id of the worker running the TaskChain, and the rest is the status of the TaskChain as written by the child.
+SHARED_STATE_SIZE = 64
+PID_OFFSET = 1
+STATUS_OFFSET = 5
+CONTROL_NONE = 0
+CONTROL_TERMINATE = 1
+
+# How often the child process publishes the TaskChain's status to the shared memory block
+STATUS_INTERVAL_SECONDS = 0.25
+
+
+class ExecutionBackends:
+    process = 'process'
+    thread = 'thread'
+
+
+def build_task_chain(task: dict) -> BaseTaskChain or None:
+    """
+    Instantiates the TaskChain for a claimed task.
+
+    Arguments
+    task (dict): The claimed task.
+
+    Returns
+    The TaskChain or None if no template is registered for the task.
+    """
+    # Get a private copy of the task chain configuration from the template cache
+    from CloudHarvestAgent.template_cache import template_cache
+    template = template_cache.instantiate(category=task['category'], name=task['name'])
+
+    if template is None:
+        return None
+
+    # Instantiate the new task
+    from CloudHarvestCoreTasks.factories import task_chain_from_dict
+    task_chain = task_chain_from_dict(
+        template_identifier=f"{task['category']}/{task['name']}",
+        template=template,
+        **task['config']
+    )
+    task_chain.agent = Environment.get('agent.name')
+
+    # Large results are written to Redis in compressed chunks rather than a single field of the task hash
+    from CloudHarvestAgent.results import ResultSink, binary_client
+    from CloudHarvestCoreTasks.silos import get_silo
+    compression_level = Environment.get('agent.results.compression_level')
+
+    task_chain.result_sink = ResultSink(client=binary_client(get_silo('harvest-tasks').connect()),
+                                        redis_name=task['redis_name'],
+                                        max_chunk_bytes=Environment.get('agent.results.max_chunk_bytes') or 1048576,
+                                        compression_level=6 if compression_level is None else compression_level)
+
+    return task_chain
+
+
+def run_task_chain(task_chain: BaseTaskChain):
+    """
+    Runs a TaskChain and then closes its result sink, writing any buffered records and the result manifest. A large
+    result is first moved into the sink so the TaskChain reports a reference to it rather than the result itself.
+
+    Arguments
+    task_chain (BaseTaskChain): The TaskChain to run.
+    """
+    from CloudHarvestAgent.results import DEFAULT_INLINE_MAX_BYTES, spill_result
+
+    try:
+        task_chain.run()
+
+        try:
+            inline_max_bytes = Environment.get('agent.results.inline_max_bytes')
+            spill_result(task_chain, DEFAULT_INLINE_MAX_BYTES if inline_max_bytes is None else inline_max_bytes)
+
+        except Exception as e:
+            logger.error(f'{task_chain.redis_name}: could not move the result into the result stream: {e.args}')
+
+    finally:
+        result_sink = getattr(task_chain, 'result_sink', None)
+
+        if result_sink is not None:
+            try:
+                result_sink.close()
+
+            except Exception as e:
+                logger.error(f'{task_chain.redis_name}: could not write the result manifest: {e.args}')
+
+
+class ProcessTaskChain:
+    """
+    Stands in for a TaskChain which is running in the process pool. It exposes the parts of the TaskChain interface the
+    TaskChainQueue relies on.
+    """
+
+    def __init__(self, task: dict):
+        """
+        Arguments
+        task (dict): The claimed task.
+        """
+        self.redis_name = task['redis_name']
+        self.template_identifier = f"{task['category']}/{task['name']}"
+        self.agent = Environment.get('agent.name')
+
+        self._final_status = None
+        self._pid = None
+        self.error = None
+        self.summary = {}
+        self._shared_memory = SharedMemory(create=True, size=SHARED_STATE_SIZE)
+
+    @property
+    def shared_memory_name(self) -> str:
+        return self._shared_memory.name
+
+    @property
+    def status(self) -> str:
+        """
+        Returns the last status reported by the child process.
+        """
+        if self._final_status:
+            return self._final_status
+
+        return read_status(self._shared_memory) or TaskStatusCodes.initialized
+
+    @property
+    def pid(self) -> int or None:
+        """
+        Returns the process id of the worker running the TaskChain, or None if no worker has started it.
+        """
+        if self._final_status:
+            return self._pid
+
+        return read_pid(self._shared_memory) or None
+
+    def complete(self, future: Future):
+        """
+        Records the final status of the TaskChain and releases the shared memory block. Added as the first done
+        callback of the process pool future. When the future raised, for example because the worker died, the child
+        could not report the TaskChain's status, so the error is kept for `update_status()`.
+
+        Arguments
+        future (Future): The process pool future which ran the TaskChain.
+        """
+        try:
+            self._pid = read_pid(self._shared_memory) or None
+            self.summary = future.result()
+            self._final_status = self.summary.get('status')
+
+        except BaseException as ex:
+            self.error = f'{type(ex).__name__}: {ex}'
+            self._final_status = TaskStatusCodes.error
+
+        finally:
+            self._shared_memory.close()
+            self._shared_memory.unlink()
+
+    def kill(self) -> bool:
+        """
+        Kills the worker process running the TaskChain. Used when the TaskChain does not exit after being terminated.
+
+        Returns
+        True if the worker was signalled.
+        """
+        import os
+        from signal import SIGKILL
+
+        pid = self.pid
+
+        if not pid:
+            return False
+
+        try:
+            os.kill(pid, SIGKILL)
+
+        except (ProcessLookupError, PermissionError) as ex:
+            logger.warning(f'{self.redis_name}: could not kill worker process {pid}: {ex}')
+            return False
+
+        logger.warning(f'{self.redis_name}: killed worker process {pid}.')
+
+        return True
+
+    def terminate(self):
+        """
+        Directs the child process to terminate the TaskChain.
+        """
+        if not self._final_status:
+            self._shared_memory.buf[0] = CONTROL_TERMINATE
+
+    def update_status(self):
+        """
+        Reports the final status of a TaskChain whose child process failed. Otherwise the child process reported the
+        final status of the TaskChain to Redis itself, so there is nothing left to report.
+        """
+        if self.error is None:
+            return
+
+        from CloudHarvestCoreTasks.silos import get_silo
+
+        get_silo('harvest-tasks').connect().hset(name=self.redis_name, mapping={
+            'status': TaskStatusCodes.error,
+            'error': self.error
+        })
+
+
+def read_pid(shared_memory: SharedMemory) -> int:
+    """
+    Reads the process id of the worker running the TaskChain from a shared memory block. Returns 0 until a worker
+    starts the TaskChain.
+
+    Arguments
+    shared_memory (SharedMemory): The shared memory block.
+    """
+    return int.from_bytes(shared_memory.buf[PID_OFFSET:STATUS_OFFSET], 'little')
+
+
+def write_pid(shared_memory: SharedMemory, pid: int):
+    """
+    Writes the process id of the worker running the TaskChain to a shared memory block.
+
+    Arguments
+    shared_memory (SharedMemory): The shared memory block.
+    pid (int): The process id.
+    """
+    shared_memory.buf[PID_OFFSET:STATUS_OFFSET] = pid.to_bytes(STATUS_OFFSET - PID_OFFSET, 'little')
+
+
+def read_status(shared_memory: SharedMemory) -> str:
+    """
+    Reads the TaskChain status from a shared memory block.
+
+    Arguments
+    shared_memory (SharedMemory): The shared memory block.
+    """
+    return bytes(shared_memory.buf[STATUS_OFFSET:SHARED_STATE_SIZE]).rstrip(b'\x00').decode('utf-8', errors='ignore')
+
+
+def write_status(shared_memory: SharedMemory, status: str):
+    """
+    Writes the TaskChain status to a shared memory block.
+
+    Arguments
+    shared_memory (SharedMemory): The shared memory block.
+    status (str): The status to write.
+    """
+    encoded = str(status).encode('utf-8')[:SHARED_STATE_SIZE - STATUS_OFFSET]
+    shared_memory.buf[STATUS_OFFSET:SHARED_STATE_SIZE] = encoded.ljust(SHARED_STATE_SIZE - STATUS_OFFSET, b'\x00')
+
+
+def process_initializer(agent_name: str, silos: dict):
+    """
+    Prepares a process pool worker to run TaskChains. The worker loads the agent configuration, connects to the same
+    silos as its parent, and registers all plugins.
+
+    Arguments
+    agent_name (str): The name of the parent agent.
+    silos (dict): The silo configurations of the parent agent.
+    """
+    from CloudHarvestAgent.startup import load_configuration_from_file, load_logging
+    from CloudHarvestCoreTasks.dataset import WalkableDict
+    from CloudHarvestCoreTasks.silos import add_silo
+    from CloudHarvestAgent.template_cache import template_cache
+    from CloudHarvestCorePluginManager import register_all
+
+    config = WalkableDict(**load_configuration_from_file())
+    config['agent']['name'] = agent_name
+    Environment.merge(config)
+
+    load_logging(log_destination=config.walk('agent.logging.location'),
+                 log_level=config.walk('agent.logging.level'),
+                 quiet=True)
+
+    [
+        add_silo(name=silo_name, **silo_config)
+        for silo_name, silo_config in (silos or {}).items()
+    ]
+
+    register_all()
+    template_cache.invalidate()
+
+
+def run_chain_in_process(shared_memory_name: str, task: dict) -> dict:
+    """
+    Builds and runs a TaskChain in a process pool worker. The TaskChain runs in a thread so this function can publish
+    its status and relay termination requests from the parent while it runs.
+
+    Arguments
+    shared_memory_name (str): The name of the shared memory block created by the parent's ProcessTaskChain.
+    task (dict): The claimed task.
+
+    Returns
+    A summary of the TaskChain containing its final status, the CPU time of its thread, its peak allocation when
+    `agent.tasks.chain_accounting.trace_memory` is enabled, and the number of result records it wrote.
+    """
+    from threading import Thread
+    from time import thread_time
+
+    import tracemalloc
+
+    import os
+
+    shared_memory = SharedMemory(name=shared_memory_name, track=False)
+
+    try:
+        # Lets the parent kill this worker if the TaskChain does not exit after being terminated
+        write_pid(shared_memory, os.getpid())
+
+        task_chain = build_task_chain(task)
+
+        if task_chain is None:
+            logger.error(f'No task chain class found for {task["name"]}.')
+
+            from CloudHarvestCoreTasks.silos import get_silo
+            get_silo('harvest-tasks').connect().hset(name=task['redis_name'], key='status', value=TaskStatusCodes.error)
+
+            return {'status': TaskStatusCodes.error}
+
+        usage = {}
+
+        # The worker runs one TaskChain at a time, so its traced memory belongs to this TaskChain
+        if Environment.get('agent.tasks.chain_accounting.trace_memory'):
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+            tracemalloc.reset_peak()
+            traced_start = tracemalloc.get_traced_memory()[0]
+
+        def _run():
+            cpu_start = thread_time()
+
+            try:
+                run_task_chain(task_chain)
+
+            finally:
+                usage['cpu_seconds'] = thread_time() - cpu_start
+
+        thread = Thread(target=_run, daemon=True)
+        thread.start()
+
+        terminated = False
+        while thread.is_alive():
+            write_status(shared_memory, task_chain.status)
+
+            if not terminated and shared_memory.buf[0] == CONTROL_TERMINATE:
+                task_chain.terminate()
+                terminated = True
+
+            thread.join(timeout=STATUS_INTERVAL_SECONDS)
+
+        # Report the final status to Redis
+        task_chain.update_status()
+        write_status(shared_memory, task_chain.status)
+
+        if tracemalloc.is_tracing() and Environment.get('agent.tasks.chain_accounting.trace_memory'):
+            usage['peak_allocated_bytes'] = max(tracemalloc.get_traced_memory()[1] - traced_start, 0)
+
+        result_sink = getattr(task_chain, 'result_sink', None)
+
+        return {
+            'status': task_chain.status,
+            'records': result_sink.records if result_sink is not None else None,
+        } | usage
+
+    finally:
+        shared_memory.close()
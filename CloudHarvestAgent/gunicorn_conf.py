@@ -69,6 +69,68 @@ def when_ready(server):
         except Exception:
             pass
 
+# The agent's supervisor process, which owns the task queue, heartbeat, and execution pools for all workers
+_supervisor = None
+
+def _supervisor_connection():
+    return {
+        "host": bind.split(":")[0],
+        "port": int(bind.split(":")[1]),
+        "pemfile": certfile,
+        "debug": False
+    }
+
+def on_starting(server):
+    """
+    Install the plugins once in the master before any worker starts. Workers find the stamp written here and skip
+    installation, so respawned workers start without running pip. Then start the agent's supervisor process.
+    """
+    global _supervisor
+
+    try:
+        from CloudHarvestAgent.plugins import install_plugins_once
+        from CloudHarvestAgent.startup import load_configuration_from_file
+        from CloudHarvestCoreTasks.dataset import WalkableDict
+
+        config = WalkableDict(**load_configuration_from_file())
+
+        if install_plugins_once(config, quiet=bool(config.walk('agent.logging.quiet'))):
+            server.log.info("Plugins installed")
+
+        else:
+            server.log.info("Plugins already installed; skipping installation")
+
+    except Exception:
+        # Workers retry the installation themselves
+        server.log.warning("Could not install plugins in the master", exc_info=True)
+
+    # A watchdog thread in the master restarts the supervisor whenever it exits
+    from CloudHarvestAgent.supervisor import Supervisor
+    _supervisor = Supervisor(_supervisor_connection(), log=server.log).start()
+    server.log.info("Supervisor started (pid: %s)", _supervisor.pid)
+
+def pre_fork(server, worker):
+    """
+    Make sure the supervisor is running before a worker is (re)spawned.
+    """
+    if _supervisor is not None:
+        _supervisor.ensure_running()
+
+def on_exit(server):
+    """
+    Stop the supervisor, allowing it to finish its running TaskChains.
+    """
+    if _supervisor is not None:
+        _supervisor.stop(timeout=graceful_timeout)
+
 def post_fork(server, worker):
+    """
+    Tell the worker how to reach the supervisor. The key is handed over in memory so it is not exported to the
+    environment inherited by the processes which TaskChains start.
+    """
+    if _supervisor is not None:
+        from CloudHarvestAgent.supervisor import configure_client
+        configure_client(_supervisor.address, _supervisor.authkey)
+
     # Helpful for debugging worker lifecycle while tuning
     server.log.info("Worker spawned (pid: %s)", getattr(worker, "pid", "unknown"))
@@ -1,25 +1,248 @@
 from CloudHarvestCoreTasks.chains import BaseTaskChain
 
+from CloudHarvestAgent.accounting import ChainAccounting
 from CloudHarvestAgent.api import Api
+from CloudHarvestAgent.concurrency import AdaptiveConcurrency
+from CloudHarvestAgent.deadlines import DeadlineScheduler, DeadlineStages
+from CloudHarvestAgent.execution import (
+    ExecutionBackends,
+    ProcessTaskChain,
+    build_task_chain,
+    process_initializer,
+    run_chain_in_process,
+    run_task_chain
+)
+from CloudHarvestAgent.metrics import QueueCounters, QueueMetrics, QueueWaitTimes
+from CloudHarvestAgent.profiler import ProfilerBusy, SamplingProfiler
+from CloudHarvestAgent.prometheus import (
+    CHAIN_DURATION_SECONDS,
+    CHAINS_FINISHED,
+    CONCURRENCY_LIMIT,
+    MAX_CHAINS,
+    QUEUE_WAIT_SECONDS,
+    RUNNING_CHAINS,
+    TASKS_CLAIMED,
+    instrument_redis,
+    registry,
+    thread_group
+)
+from CloudHarvestAgent.reporter import StatusReporter
+from CloudHarvestAgent.scheduling import get_pickup_scheduler, queue_priority
+from CloudHarvestAgent.template_cache import template_cache
 from CloudHarvestCoreTasks.environment import Environment
 from CloudHarvestCoreTasks.tasks import TaskStatusCodes
 from CloudHarvestCoreTasks.tasks.redis import format_hset, unformat_hset
 
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timezone
+from functools import partial
 from logging import getLogger
-from threading import Thread
+from threading import Event, RLock, Thread, enumerate as enumerate_threads, get_ident
+from time import monotonic
 
 logger = getLogger('harvest')
 
+# Separates the queue name from the agent name in a processing list name, e.g. `queue::0::processing::agent:host:8500:1`
+PROCESSING_LIST_SEPARATOR = '::processing::'
+
+# The status reported for TaskChains which exceeded their timeout
+TIMEOUT_TASK_STATUS = 'timeout'
+
+# Statuses which indicate a task chain will not make any further progress
+FINISHED_TASK_STATUSES = ('complete', 'error', 'skipped', 'terminated', TIMEOUT_TASK_STATUS)
+
+# Tasks are claimed in three steps so that every script only touches the keys passed to it in KEYS:
+# 1. `POP_TASKS_SCRIPT` moves up to the planned number of tasks from the queues into this agent's processing lists.
+# 2. `CLAIM_TASK_SCRIPT` validates each popped task and records the claim, in one pipeline.
+# 3. `REROUTE_TASK_SCRIPT` moves the tasks which belong to another account's queue to that queue, in one pipeline.
+# Popped tasks are held in a processing list throughout, so the tasks of an agent which stops between the steps are
+# recovered by `recover_orphaned_tasks()`. When a step fails, `RETURN_TASK_SCRIPT` returns the popped tasks to their
+# queues.
+
+# Moves up to ARGV[1] tasks from the queues into the processing lists of this agent.
+# KEYS holds the queues in priority order followed by the matching processing lists of this agent. ARGV[2] is the
+# 1-based index of the queue a task was already popped from (0 for none) and ARGV[3] is that task. ARGV[4] is a comma
+# separated list of the maximum number of tasks to pop from each queue, as planned by the pickup scheduler. The seed task
+# is returned to the front of its queue when that queue's quota is 0.
+# Returns a flat list of [queue index, task redis name, ...].
+POP_TASKS_SCRIPT = """
+local count = tonumber(ARGV[1])
+local seed_index = tonumber(ARGV[2])
+local queues = #KEYS / 2
+local result = {}
+local popped = 0
+
+local quotas = {}
+local taken = {}
+for quota in string.gmatch(ARGV[4], '[^,]+') do
+    table.insert(quotas, tonumber(quota))
+    table.insert(taken, 0)
+end
+
+if seed_index > 0 and (count < 1 or quotas[seed_index] < 1) then
+    redis.call('RPUSH', KEYS[seed_index], ARGV[3])
+
+elseif seed_index > 0 then
+    redis.call('LPUSH', KEYS[seed_index + queues], ARGV[3])
+
+    table.insert(result, seed_index)
+    table.insert(result, ARGV[3])
+    popped = popped + 1
+    taken[seed_index] = taken[seed_index] + 1
+end
+
+for index = 1, queues do
+    while popped < count and taken[index] < quotas[index] do
+        local task = redis.call('RPOPLPUSH', KEYS[index], KEYS[index + queues])
+
+        if not task then
+            break
+        end
+
+        table.insert(result, index)
+        table.insert(result, task)
+        popped = popped + 1
+        taken[index] = taken[index] + 1
+    end
+end
+
+return result
+"""
+
+# Claims the popped task KEYS[1], held in the processing list KEYS[2], for the agent named ARGV[1].
+# ARGV[2] is the claim timestamp. ARGV[3] is `1` when the task was popped from a shared priority queue and ARGV[4:] are
+# the capabilities of the agent. Tasks which are not `enqueued` or are owned by another agent are removed from the
+# processing list. Tasks in a shared queue which declare a `platform` and `account` the agent cannot serve are left in
+# the processing list for `REROUTE_TASK_SCRIPT`.
+# Returns ['claimed', [field, value, ...]], ['reroute', platform, account], or ['discarded'].
+CLAIM_TASK_SCRIPT = """
+local task = KEYS[1]
+local agent = ARGV[1]
+local fields = redis.call('HMGET', task, 'status', 'agent', 'platform', 'account')
+local status, owner, platform, account = fields[1], fields[2], fields[3], fields[4]
+
+if status ~= 'enqueued' or (owner and owner ~= '' and owner ~= 'null' and owner ~= agent) then
+    redis.call('LREM', KEYS[2], 1, task)
+    return {'discarded'}
+end
+
+if ARGV[3] == '1' and platform and account and platform ~= '' and account ~= '' then
+    local capability = platform .. ':' .. account
+    local served = false
+
+    for index = 4, #ARGV do
+        if ARGV[index] == capability then
+            served = true
+            break
+        end
+    end
+
+    if not served then
+        return {'reroute', platform, account}
+    end
+end
+
+redis.call('HSET', task, 'agent', agent, 'claimed', ARGV[2])
+
+return {'claimed', redis.call('HGETALL', task)}
+"""
+
+# Moves the task ARGV[1] from the processing list KEYS[1] to the front of the account queue KEYS[2]. Tasks which are no
+# longer in the processing list are not moved.
+REROUTE_TASK_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) > 0 then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    return 1
+end
+
+return 0
+"""
+
+
+# Returns the task KEYS[1] from the processing list KEYS[2] to the front of its queue KEYS[3] and releases the claim of the
+# agent named ARGV[1]. When ARGV[2] is `1` the task is a seed task which was popped by BRPOP and may not have reached the
+# processing list yet, and it is returned either way. Returns 1 if the task was returned.
+RETURN_TASK_SCRIPT = """
+local removed = redis.call('LREM', KEYS[2], 1, KEYS[1])
+
+if removed == 0 and ARGV[2] ~= '1' then
+    return 0
+end
+
+if redis.call('HGET', KEYS[1], 'agent') == ARGV[1] then
+    redis.call('HDEL', KEYS[1], 'agent', 'claimed')
+end
+
+redis.call('RPUSH', KEYS[3], KEYS[1])
+
+return 1
+"""
+
+
+def task_queue_name(priority: int, platform: str = None, account: str = None) -> str:
+    """
+    Returns the queue a task should be enqueued to. Tasks which run against a platform account are routed to that
+    account's queue, `queue::<priority>::<platform>:<account>`, which is only read by agents with the account. All other
+    tasks are enqueued to the shared `queue::<priority>`.
+
+    Arguments
+    priority (int): The priority of the task.
+    platform (str, optional): The platform the task runs against, such as `aws`.
+    account (str, optional): The platform account the task runs against.
+    """
+    if platform and account:
+        return f'queue::{priority}::{platform}:{account}'
+
+    return f'queue::{priority}'
+
+
+def agent_capabilities(platforms: dict = None, chain_task_restrictions: list = None) -> list:
+    """
+    Returns the `<platform>:<account>` capabilities of an agent: every account in its `platforms` configuration, except
+    those of platforms whose task is listed in `chain_task_restrictions`.
+
+    Arguments
+    platforms (dict, optional): The `platforms` configuration of the agent.
+    chain_task_restrictions (list, optional): The `agent.tasks.chain_task_restrictions` of the agent.
+    """
+    restricted = {
+        restriction.get('task_name') if isinstance(restriction, dict) else restriction
+        for restriction in chain_task_restrictions or []
+    }
+
+    return sorted(
+        f'{platform}:{account}'
+        for platform, platform_config in (platforms or {}).items()
+        if platform not in restricted
+        for account in (platform_config or {}).get('accounts') or []
+    )
+
 
 class TaskChainQueue:
+    # The name of the queue engine, selected by `agent.tasks.engine`
+    engine = 'threaded'
+
     def __init__(self, api: Api,
                  accepted_chain_priorities: list = None,
                  chain_progress_reporting_interval_seconds: int = 60,
                  chain_task_restrictions: list = None,
-                 chain_timeout_seconds: int = 60,
+                 chain_timeout_seconds: int = 7200,
+                 chain_timeout_grace_seconds: int = 30,
+                 chain_timeout_templates: dict = None,
                  queue_check_interval_seconds: int = 5,
                  max_chains: int = 10,
+                 blocking_pickup: bool = True,
+                 orphan_recovery_interval_seconds: int = 60,
+                 process_pool_categories: list = None,
+                 process_pool_templates: list = None,
+                 process_pool_workers: int = None,
+                 wakeup_channel: str = 'harvest-tasks',
+                 wakeup_keyspace_notifications: bool = False,
+                 pickup_scheduler: dict = None,
+                 adaptive_concurrency: dict = None,
+                 chain_accounting: dict = None,
+                 profiler: dict = None,
                  **kwargs
         ):
 
@@ -27,24 +250,82 @@ class TaskChainQueue:
 
         # Remote resources
         self.api = api
-        self.node_silo = get_silo('harvest-nodes').connect()    # Note status reports
-        self.task_silo = get_silo('harvest-tasks').connect()    # Task queue, status, and results
+        self.node_silo = instrument_redis(get_silo('harvest-nodes').connect(), 'harvest-nodes')   # Note status reports
+        self.task_silo = instrument_redis(get_silo('harvest-tasks').connect(), 'harvest-tasks')   # Task queue, status, and results
 
         # Queue configuration
         self.accepted_chain_priorities = accepted_chain_priorities
         self.chain_progress_reporting_interval_seconds = chain_progress_reporting_interval_seconds
         self.chain_task_restrictions = chain_task_restrictions
         self.chain_timeout_seconds = chain_timeout_seconds
+        self.chain_timeout_grace_seconds = chain_timeout_grace_seconds
+        self.chain_timeout_templates = chain_timeout_templates or {}
         self.queue_check_interval_seconds = queue_check_interval_seconds
         self.max_chains = max_chains
+        self.blocking_pickup = blocking_pickup
+        self.orphan_recovery_interval_seconds = orphan_recovery_interval_seconds
+        self.process_pool_categories = process_pool_categories or []
+        self.process_pool_templates = process_pool_templates or []
+        self.process_pool_workers = process_pool_workers
+        self.wakeup_channel = wakeup_channel
+        self.wakeup_keyspace_notifications = wakeup_keyspace_notifications
+
+        # Name of this agent; used to identify the processing lists which hold the tasks claimed by this agent
+        self.agent_name = Environment.get('agent.name')
+
+        # The platform accounts this agent serves; the agent only reads the queues of these accounts
+        self.capabilities = agent_capabilities(platforms=Environment.get('platforms'),
+                                               chain_task_restrictions=chain_task_restrictions)
+        self.last_orphan_recovery = None
+
+        # Server-side scripts which pop, claim, and reroute tasks
+        self._pop_script = self.task_silo.register_script(POP_TASKS_SCRIPT)
+        self._claim_script = self.task_silo.register_script(CLAIM_TASK_SCRIPT)
+        self._reroute_script = self.task_silo.register_script(REROUTE_TASK_SCRIPT)
+        self._return_script = self.task_silo.register_script(RETURN_TASK_SCRIPT)
+
+        # Decides how many tasks are claimed from each queue
+        self.pickup_scheduler = get_pickup_scheduler(**(pickup_scheduler or {}))
+
+        # Adjusts the number of TaskChains the queue admits between `min_chains` and `max_chains` when enabled
+        adaptive_concurrency = dict(adaptive_concurrency or {})
+        self.concurrency = AdaptiveConcurrency(max_chains=max_chains,
+                                               running=lambda: len(self.tasks.keys()),
+                                               **adaptive_concurrency) if adaptive_concurrency.pop('enabled', False) else None
 
         self.start_time = None
         self.end_time = None
         self.status = JobQueueStatusCodes.initialized
         self.stop_time = None
         self.task_chains_processed = 0
-        self.tasks = {}                         # {task_chain.redis_name: {'chain': task_chain, 'thread': thread}}
+        self.metrics = QueueMetrics()
+        self.counters = QueueCounters(status_codes=TaskStatusCodes.get_codes())
+        self.wait_times = QueueWaitTimes()
+        self.accounting = ChainAccounting(**(chain_accounting or {}))
+        self.profiler = SamplingProfiler(**(profiler or {}))
+        self.tasks = {}                         # {task_chain.redis_name: {'chain': task_chain, 'executor': executor, 'future': future, ...}}
         self.worker_thread = None
+        self.wakeup_thread = None
+
+        # TaskChains run in a reusable pool of `max_chains` threads. Completion callbacks reap finished chains and wake
+        # the worker thread so it can immediately claim new tasks for the freed slots.
+        self._executor = None
+        self._process_executor = None           # Created when the first TaskChain selects the process backend
+        self._tasks_lock = RLock()
+        self._wake_event = Event()
+        self._pickup_blocked = False            # True when the latest pickup waited on BRPOP
+
+        # Enforces `chain_timeout_seconds`; TaskChains which do not exit within the grace period are abandoned
+        self.deadlines = DeadlineScheduler(on_deadline=self._on_deadline)
+        self.abandoned_chains = 0
+
+        # Status and progress updates are coalesced and written in one pipeline per reporting interval
+        self.reporter = StatusReporter(client=self.task_silo,
+                                       interval_seconds=chain_progress_reporting_interval_seconds,
+                                       collect=self._collect_progress)
+
+        # Sets the queue's gauges whenever the Prometheus metrics are scraped
+        registry.add_collector('queue', self._collect_prometheus)
 
     def detailed_status(self) -> dict:
         """
@@ -52,23 +333,83 @@ class TaskChainQueue:
         :return:
         """
 
-        from CloudHarvestCoreTasks.tasks import TaskStatusCodes
+        counts = self.counters.snapshot()
 
         result = {
-            'chain_status': {
-                str(status_code): sum(1 for task in self.tasks.keys() if task['chain'].status == status_code)
-                for status_code in TaskStatusCodes.get_codes()
+            'adaptive_concurrency': self.concurrency.stats() if self.concurrency else None,
+            'capabilities': self.capabilities,
+            'chain_accounting': self.accounting.snapshot(),
+            'chain_status': counts['chain_status'],
+            'chain_templates': counts['chain_templates'],
+            'chain_timeouts': counts['chain_timeouts'],
+            'concurrency_limit': self.concurrency_limit,
+            'deadlines': {
+                'abandoned_chains': self.abandoned_chains,
+                'fired': self.deadlines.fired,
+                'scheduled': len(self.deadlines)
             },
             'duration': self.duration,
+            'engine': self.engine,
             'max_chains': self.max_chains,
+            'pickup_scheduler': self.pickup_scheduler.stats(),
+            'profiler': self.profiler.stats(),
+            'queue_wait_seconds': self.wait_times.percentiles(),
+            'reporter': self.reporter.stats(),
             'start_time': self.start_time,
             'status': self.status,
             'stop_time': self.stop_time,
-            'total_chains_in_queue': len(self.tasks.keys())
+            'template_cache': template_cache.stats(),
+            'total_chains_in_queue': len(self.tasks.keys()),
+            'totals': counts['totals']
         }
 
         return result
 
+    def queue_summary(self) -> dict:
+        """
+        Returns a small summary of the queue for the node heartbeat: the running TaskChains by status, the lifetime
+        totals, and the queue's limits. Unlike `detailed_status()`, the summary does not grow with the number of
+        templates or queues, so it rarely changes between heartbeats.
+        """
+        counts = self.counters.snapshot()
+
+        return {
+            'chain_status': {status: count for status, count in sorted(counts['chain_status'].items()) if count},
+            'concurrency_limit': self.concurrency_limit,
+            'engine': self.engine,
+            'max_chains': self.max_chains,
+            'status': self.status,
+            'total_chains_in_queue': len(self.tasks.keys()),
+            'totals': counts['totals']
+        }
+
+    def metrics_record(self) -> dict:
+        """
+        Returns a metrics record covering the queue's activity since the previous record.
+        """
+        return self.metrics.record(running_chains=len(self.tasks.keys()),
+                                   max_chains=self.max_chains,
+                                   concurrency_limit=self.concurrency_limit)
+
+    def prometheus_metrics(self) -> str:
+        """
+        Returns the agent's metrics in the Prometheus text exposition format.
+        """
+        return registry.render()
+
+    def _collect_prometheus(self):
+        RUNNING_CHAINS.set(len(self.tasks.keys()))
+        CONCURRENCY_LIMIT.set(self.concurrency_limit)
+        MAX_CHAINS.set(self.max_chains)
+
+    @property
+    def concurrency_limit(self) -> int:
+        """
+        Returns the number of TaskChains the queue currently admits: the adaptive limit when adaptive concurrency is
+        enabled, otherwise `max_chains`.
+        """
+        return self.concurrency.limit if self.concurrency else self.max_chains
+
     @property
     def duration(self) -> float:
         """
@@ -88,52 +429,463 @@ class TaskChainQueue:
 
         return result
 
-    def _get_task(self) -> dict or None:
-        for priority in self.accepted_chain_priorities:
-            queue_name = f'queue::{priority}'
+    @property
+    def queue_names(self) -> list:
+        """
+        Returns the names of the Redis queues this agent accepts tasks from, in priority order. Within a priority, the
+        queues of the accounts this agent serves are read before the shared queue.
+        """
+        return [
+            queue_name
+            for priority in self.accepted_chain_priorities or []
+            for queue_name in [
+                *(task_queue_name(priority, *capability.split(':', 1)) for capability in self.capabilities),
+                task_queue_name(priority)
+            ]
+        ]
+
+    def processing_list_name(self, queue_name: str) -> str:
+        """
+        Returns the name of the list which holds the tasks this agent claimed from `queue_name`. Tasks remain in the
+        processing list until their chain completes so that the tasks of a crashed agent can be recovered.
 
-            while True:
-                # Check if this task queue is empty
-                if self.task_silo.llen(queue_name) == 0:
-                    # logger.debug(f'No priority {priority} tasks in the queue.')
-                    break
+        Arguments
+        queue_name (str): The name of the queue the task was claimed from.
+        """
+        return f'{queue_name}{PROCESSING_LIST_SEPARATOR}{self.agent_name}'
+
+    def _get_tasks(self, count: int) -> list:
+        """
+        Claims up to `count` tasks from the accepted queues, as many from each queue as the pickup scheduler allows. The
+        tasks are popped into this agent's processing lists, validated, and marked as claimed by this agent in two round
+        trips. When `blocking_pickup` is enabled and no task was claimed, this method blocks on BRPOP for up to
+        `queue_check_interval_seconds` so new tasks are picked up the moment they are enqueued. Only the queues which
+        the pickup scheduler would claim a new task from are waited on.
+
+        Note that the `harvest-tasks` silo must be configured with a socket timeout greater than
+        `queue_check_interval_seconds` for blocking pickups to succeed.
+
+        Arguments
+        count (int): The maximum number of tasks to claim.
+
+        Returns
+        A list of the claimed tasks.
+        """
+        self._pickup_blocked = False
+        queue_names = self.queue_names
+
+        if count <= 0 or not queue_names:
+            return []
+
+        queue_state = self._get_queue_state() if self.pickup_scheduler.needs_queue_state else None
+        plan = self._pickup_plan(count=count, queue_state=queue_state)
+
+        tasks = self._claim_tasks(count=count, plan=plan)
+
+        if tasks or not self.blocking_pickup:
+            return tasks
+
+        # No task was claimed, either because the planned queues were empty or because their tasks could not be
+        # claimed. Wait for a new task in the queues which may take one; Redis checks the keys in the order provided,
+        # preserving priority.
+        plan = self._pickup_plan(count=count, queue_state=queue_state, waiting=True)
+        waiting_queues = [queue_name for queue_name, quota in plan if quota > 0]
+
+        if not waiting_queues:
+            return []
+
+        self._pickup_blocked = True
+        popped = self.task_silo.brpop(keys=waiting_queues, timeout=self.queue_check_interval_seconds)
+
+        if not popped:
+            return []
+
+        # The popped task seeds the claim so it is validated and recorded in the same call as any other waiting tasks.
+        # The plan is reused so the seed, which is only held by this agent until it reaches a processing list, is
+        # claimed in the next round trip.
+        queue_name, task_redis_name = popped
+
+        return self._claim_tasks(count=count, plan=plan, seed_queue=queue_name, seed_task=task_redis_name)
+
+    def _pickup_plan(self, count: int, queue_state: dict = None, waiting: bool = False) -> list:
+        """
+        Returns the number of tasks to claim from each accepted queue, as planned by the pickup scheduler.
+
+        Arguments
+        count (int): The maximum number of tasks to claim.
+        queue_state (dict, optional): The queue state for pickup schedulers which need it.
+        waiting (bool, optional): Plan for tasks which arrive while the agent waits on the queues.
+        """
+        plan = self.pickup_scheduler.waiting_plan if waiting else self.pickup_scheduler.plan
+
+        return plan(count=count,
+                    queue_names=self.queue_names,
+                    running=self.running_by_priority(),
+                    max_chains=self.concurrency_limit,
+                    queue_state=queue_state)
+
+    def _claim_tasks(self, count: int, plan: list, seed_queue: str = None, seed_task: str = None) -> list:
+        """
+        Pops tasks with the `POP_TASKS_SCRIPT`, claims them with the `CLAIM_TASK_SCRIPT`, and reroutes those which belong
+        to another account's queue with the `REROUTE_TASK_SCRIPT`. When popping or claiming fails, the popped tasks and
+        the seed task are returned to their queues.
+
+        Arguments
+        count (int): The maximum number of tasks to pop.
+        plan (list): The (queue name, maximum tasks to claim) of each queue, as returned by `_pickup_plan()`.
+        seed_queue (str, optional): The queue a task was already popped from.
+        seed_task (str, optional): The Redis name of a task which was already popped from `seed_queue`.
+
+        Returns
+        A list of the claimed tasks.
+        """
+        keys, args = self._pop_arguments(count=count, plan=plan, seed_queue=seed_queue, seed_task=seed_task)
+        popped = []
+
+        try:
+            popped = self._parse_popped_tasks(keys, self._pop_script(keys=keys, args=args))
+
+            if not popped:
+                return []
+
+            claimed_at = datetime.now(tz=timezone.utc).isoformat()
+
+            with self.task_silo.pipeline(transaction=False) as pipeline:
+                for queue_name, task_redis_name in popped:
+                    self._claim_script(*self._claim_task_arguments(queue_name, task_redis_name, claimed_at), client=pipeline)
+
+                claimed = pipeline.execute()
+
+        except Exception:
+            self._return_tasks(popped=popped, seed_queue=seed_queue, seed_task=seed_task)
+            raise
+
+        tasks, reroutes = self._parse_claimed_tasks(popped, claimed)
+
+        if reroutes:
+            try:
+                with self.task_silo.pipeline(transaction=False) as pipeline:
+                    for reroute_keys, reroute_args in reroutes:
+                        self._reroute_script(keys=reroute_keys, args=reroute_args, client=pipeline)
+
+                    pipeline.execute()
+
+            except Exception as e:
+                # The tasks stay in this agent's processing lists and are recovered once the agent stops
+                logger.error(f'Could not move {len(reroutes)} tasks to their account queues: {e.args}')
+
+        return tasks
+
+    def _return_arguments(self, popped: list, seed_queue: str = None, seed_task: str = None) -> list:
+        """
+        Returns the KEYS and ARGV for the `RETURN_TASK_SCRIPT` of each popped task and the seed task.
+
+        Arguments
+        popped (list): The (queue name, task redis name) of each popped task.
+        seed_queue (str, optional): The queue the seed task was popped from.
+        seed_task (str, optional): The Redis name of the seed task.
+        """
+        # The first popped tasks are returned last so they end up at the front of their queues in their original order
+        returned = [
+            (queue_name, task_redis_name, 0)
+            for queue_name, task_redis_name in reversed(popped)
+            if task_redis_name != seed_task
+        ]
+
+        # Unless the `POP_TASKS_SCRIPT` returned, the seed task may not have reached the processing list. When the script
+        # returned without the seed task, the script already put it back in its queue.
+        if seed_task and not popped:
+            returned.append((seed_queue, seed_task, 1))
+
+        elif seed_task in [task_redis_name for queue_name, task_redis_name in popped]:
+            returned.append((seed_queue, seed_task, 0))
+
+        return [
+            ([task_redis_name, self.processing_list_name(queue_name), queue_name], [self.agent_name, seed])
+            for queue_name, task_redis_name, seed in returned
+        ]
+
+    def _return_tasks(self, popped: list, seed_queue: str = None, seed_task: str = None):
+        """
+        Returns popped tasks which could not be claimed to the front of their queues.
+
+        Arguments
+        popped (list): The (queue name, task redis name) of each popped task.
+        seed_queue (str, optional): The queue the seed task was popped from.
+        seed_task (str, optional): The Redis name of the seed task.
+        """
+        returned = self._return_arguments(popped=popped, seed_queue=seed_queue, seed_task=seed_task)
+
+        if not returned:
+            return
+
+        try:
+            with self.task_silo.pipeline(transaction=False) as pipeline:
+                for return_keys, return_args in returned:
+                    self._return_script(keys=return_keys, args=return_args, client=pipeline)
+
+                pipeline.execute()
+
+        except Exception as e:
+            logger.error(f'Could not return tasks {[keys[0] for keys, args in returned]} to their queues: {e.args}')
+
+    def _get_queue_state(self) -> dict:
+        """
+        Returns the length of each accepted queue and the wait of its oldest task, as passed to the pickup scheduler.
+        """
+        queue_names = self.queue_names
+
+        with self.task_silo.pipeline(transaction=False) as pipeline:
+            for queue_name in queue_names:
+                pipeline.llen(queue_name)
+                pipeline.lindex(queue_name, -1)
+
+            peeked = pipeline.execute()
+
+        oldest_tasks = [task_redis_name for task_redis_name in peeked[1::2] if task_redis_name]
+
+        with self.task_silo.pipeline(transaction=False) as pipeline:
+            for task_redis_name in oldest_tasks:
+                pipeline.hmget(task_redis_name, 'enqueued', 'created')
+
+            enqueued = pipeline.execute()
+
+        return self._parse_queue_state(queue_names, peeked, dict(zip(oldest_tasks, enqueued)))
+
+    @staticmethod
+    def _parse_queue_state(queue_names: list, peeked: list, enqueued: dict) -> dict:
+        """
+        Converts the length and oldest task of each queue into the queue state passed to the pickup scheduler.
+
+        Arguments
+        queue_names (list): The queues which were inspected.
+        peeked (list): A flat list of [length, oldest task redis name, ...]
+        enqueued (dict): The `enqueued` and `created` fields of each oldest task.
+        """
+        result = {}
+
+        for queue_name, length, task_redis_name in zip(queue_names, peeked[::2], peeked[1::2]):
+            enqueued_at = next((field for field in enqueued.get(task_redis_name) or [] if field), None)
 
-                task_queue_name = self.task_silo.rpop(name=queue_name)
+            result[queue_name] = {
+                'length': int(length),
+                'oldest_wait_seconds': queue_wait_seconds(unformat_hset({'enqueued': enqueued_at})) if enqueued_at else None
+            }
 
-                if task_queue_name:
-                    # Get the task status
-                    from CloudHarvestCoreTasks.tasks.redis import unformat_hset
-                    task_status = self.task_silo.hget(name=task_queue_name, key='status')
+        return result
+
+    def running_by_priority(self) -> dict:
+        """
+        Returns the number of running TaskChains by the priority of the queue they were claimed from.
+        """
+        result = {}
+
+        with self._tasks_lock:
+            for task_object in self.tasks.values():
+                result[task_object['priority']] = result.get(task_object['priority'], 0) + 1
+
+        return result
+
+    def _pop_arguments(self, count: int, plan: list, seed_queue: str = None, seed_task: str = None) -> tuple:
+        """
+        Returns the KEYS and ARGV for the `POP_TASKS_SCRIPT`.
+
+        Arguments
+        count (int): The maximum number of tasks to pop.
+        plan (list): The (queue name, maximum tasks to claim) of each queue, as returned by `_pickup_plan()`.
+        seed_queue (str, optional): The queue a task was already popped from.
+        seed_task (str, optional): The Redis name of a task which was already popped from `seed_queue`.
+        """
+        # The seed task is returned to its queue by the script when the plan leaves no room for it
+        if seed_task and seed_queue not in [queue_name for queue_name, quota in plan]:
+            plan = [*plan, (seed_queue, 0)]
 
-                    if task_status != 'enqueued':
-                        continue
+        queue_names = [queue_name for queue_name, quota in plan]
+        processing_lists = [self.processing_list_name(queue_name) for queue_name in queue_names]
 
-                    # Since this task has not started HGETALL is safe because it won't contain the 'result' key, yet. Should
-                    # the result key be present, it is possible that we'll consume a lot of resources by pulling large
-                    # datasets out of Redis.
-                    task = unformat_hset(self.task_silo.hgetall(name=task_queue_name))
+        seed_index = queue_names.index(seed_queue) + 1 if seed_task else 0
 
-                    if task:
-                        logger.debug(f'Retrieved task `{task_queue_name}` from the queue.')
+        return (
+            queue_names + processing_lists,
+            [count, seed_index, seed_task or '', ','.join(str(quota) for queue_name, quota in plan)]
+        )
 
-                        # Returns the first valid task from the queue, breaking the valid task and priority queue loops
-                        return task
+    @staticmethod
+    def _parse_popped_tasks(keys: list, popped: list) -> list:
+        """
+        Converts the output of the `POP_TASKS_SCRIPT` into a list of (queue name, task redis name).
+
+        Arguments
+        keys (list): The KEYS passed to the script.
+        popped (list): A flat list of [queue index, task redis name, ...]
+        """
+        return [(keys[int(index) - 1], task_redis_name) for index, task_redis_name in zip(popped[::2], popped[1::2])]
+
+    def _claim_task_arguments(self, queue_name: str, task_redis_name: str, claimed_at: str) -> tuple:
+        """
+        Returns the KEYS and ARGV for the `CLAIM_TASK_SCRIPT`.
+
+        Arguments
+        queue_name (str): The queue the task was popped from.
+        task_redis_name (str): The Redis name of the task hash.
+        claimed_at (str): The claim timestamp.
+        """
+        shared = queue_name == task_queue_name(queue_priority(queue_name))
+
+        return (
+            [task_redis_name, self.processing_list_name(queue_name)],
+            [self.agent_name, claimed_at, 1 if shared else 0, *(self.capabilities if shared else [])]
+        )
+
+    def _parse_claimed_tasks(self, popped: list, claimed: list) -> tuple:
+        """
+        Converts the output of the `CLAIM_TASK_SCRIPT` into task dictionaries and the arguments of the
+        `REROUTE_TASK_SCRIPT` for the tasks which belong to another account's queue.
+
+        Arguments
+        popped (list): The (queue name, task redis name) of each popped task.
+        claimed (list): The output of the `CLAIM_TASK_SCRIPT` for each popped task.
 
-                    else:
-                        # No task for this task id.
-                        # This happens when a task expires. We skip it at that point and move on to the next
-                        # task in the queue.
-                        continue
+        Returns
+        A tuple of the claimed tasks and a list of (KEYS, ARGV) of the tasks to reroute.
+        """
+        tasks = []
+        reroutes = []
 
-        return None
+        for (queue_name, task_redis_name), (outcome, *details) in zip(popped, claimed):
+            if outcome == 'reroute':
+                platform, account = details
+                account_queue = task_queue_name(queue_priority(queue_name), platform, account)
+
+                reroutes.append(([self.processing_list_name(queue_name), account_queue], [task_redis_name]))
+                logger.debug(f'Moved task `{task_redis_name}` to `{account_queue}`.')
+                continue
+
+            if outcome != 'claimed':
+                logger.debug(f'Discarded task `{task_redis_name}` which is no longer claimable.')
+                continue
+
+            fields = details[0]
+
+            task = unformat_hset(dict(zip(fields[::2], fields[1::2])))
+            task['redis_name'] = task_redis_name
+            task['processing_list'] = self.processing_list_name(queue_name)
+
+            wait_seconds = queue_wait_seconds(task)
+            self.metrics.claimed(queue_wait_seconds=wait_seconds)
+            TASKS_CLAIMED.inc(queue_name)
+
+            if wait_seconds is not None:
+                self.wait_times.record(queue_name, wait_seconds)
+                QUEUE_WAIT_SECONDS.observe(wait_seconds, queue_name)
+
+            logger.debug(f'Retrieved task `{task_redis_name}` from the queue.')
+
+            tasks.append(task)
+
+        return tasks, reroutes
+
+    def _release_task(self, task_redis_name: str, processing_list: str):
+        """
+        Removes a task from this agent's processing list.
+
+        Arguments
+        task_redis_name (str): The Redis name of the task hash.
+        processing_list (str): The processing list which holds the task.
+        """
+        if not processing_list:
+            return
 
-    def _update_task_status(self, task_redis_nane: str, new_status: str):
         try:
-            # Report the task chain instantiation to Redis
-            self.task_silo.hset(name=task_redis_nane, key='status', value=new_status)
+            self.task_silo.lrem(name=processing_list, count=1, value=task_redis_name)
 
         except Exception as e:
-            logger.error(f'{task_redis_nane} failed to report status to server: {e.args}')
+            logger.error(f'{task_redis_name} could not be removed from {processing_list}: {e.args}')
+
+    def recover_orphaned_tasks(self) -> int:
+        """
+        Returns the tasks claimed by agents which are no longer reporting a heartbeat to their original queue. Tasks
+        which were claimed but never started are requeued at the front of the queue; tasks which were running when the
+        agent stopped are marked as errors.
+
+        Returns
+        The number of tasks which were requeued.
+        """
+        requeued = 0
+
+        for processing_list in self.task_silo.scan_iter(match=f'queue::*{PROCESSING_LIST_SEPARATOR}*'):
+            queue_name, agent_name = processing_list.rsplit(PROCESSING_LIST_SEPARATOR, 1)
+
+            # Agents which still report a heartbeat own their processing lists
+            if agent_name == self.agent_name or self.node_silo.exists(agent_name):
+                continue
+
+            while True:
+                # The oldest claims are at the right of the processing list; moving from the left to the right of
+                # the queue returns the oldest claim to the front of the queue
+                task_redis_name = self.task_silo.lmove(first_list=processing_list,
+                                                       second_list=queue_name,
+                                                       src='LEFT',
+                                                       dest='RIGHT')
+
+                if not task_redis_name:
+                    break
+
+                task_status = self.task_silo.hget(name=task_redis_name, key='status')
+
+                if task_status == 'enqueued':
+                    # Release the claim so the task can be picked up by another agent
+                    self.task_silo.hdel(task_redis_name, 'agent', 'claimed')
+
+                    requeued += 1
+                    logger.warning(f'{task_redis_name} recovered from {agent_name} and returned to {queue_name}.')
+                    continue
+
+                # The task is not runnable; take it back out of the queue
+                self.task_silo.lrem(name=queue_name, count=1, value=task_redis_name)
+
+                if task_status and task_status not in FINISHED_TASK_STATUSES:
+                    logger.warning(f'{task_redis_name} was orphaned by {agent_name} while {task_status}.')
+                    self._update_task_status(task_redis_name, TaskStatusCodes.error)
+
+        self.last_orphan_recovery = datetime.now(tz=timezone.utc)
+
+        return requeued
+
+    def _update_task_status(self, task_redis_name: str, new_status: str):
+        # Status changes made by the queue are written right away along with any other pending updates
+        self.reporter.update(task_redis_name, urgent=True, status=new_status)
+
+    def _collect_progress(self) -> dict:
+        """
+        Returns the status, and the progress where the TaskChain reports it, of every running TaskChain for the
+        status reporter. TaskChains change their own status as they run, so the status of each is also recorded in the
+        queue counters.
+        """
+        import json
+
+        with self._tasks_lock:
+            task_objects = list(self.tasks.values())
+
+        result = {}
+        for task_object in task_objects:
+            task_chain = task_object['chain']
+            fields = {'status': TIMEOUT_TASK_STATUS if task_object.get('timed_out') else str(task_chain.status)}
+
+            if not task_object.get('timed_out'):
+                self.counters.transition(task_chain.redis_name, task_chain.status)
+
+            detailed_progress = getattr(task_chain, 'detailed_progress', None)
+            if callable(detailed_progress):
+                try:
+                    fields['progress'] = json.dumps(detailed_progress(), default=str)
+
+                except Exception as e:
+                    logger.debug(f'{task_chain.redis_name} could not report its progress: {e.args}')
+
+            result[task_chain.redis_name] = fields
+
+        return result
 
     def _worker(self):
         """
@@ -142,88 +894,631 @@ class TaskChainQueue:
         """
 
         while self.status == JobQueueStatusCodes.running:
+            # True when the last pickup of this cycle waited on BRPOP and found nothing
+            waited = False
 
             # Add new tasks to the queue
             while True:
-                # Check that the queue is not already full
-                if len(self.tasks.keys()) <= self.max_chains:
-                    # Attempt to pull a task from the queue
-                    new_task = self._get_task()
+                # Only claim as many tasks as there are free slots in the queue
+                free_slots = self.concurrency_limit - len(self.tasks.keys())
 
-                else:
+                if free_slots <= 0:
                     # Escape because the queue is full
                     break
 
-                # If we have a task, we need to process it
-                if new_task:
-                    try:
-                        # Converts the task from a Redis hash to a dictionary
-                        new_task = unformat_hset(new_task)
+                try:
+                    new_tasks = self._get_tasks(count=free_slots)
 
-                        # Get the task chain configuration from the registry
-                        from CloudHarvestCorePluginManager.registry import Registry
-                        task_chain_class = Registry.find(result_key='cls',
-                                                         name=new_task['name'],
-                                                         category=new_task['category'])
+                except Exception as ex:
+                    logger.error(f'Could not retrieve tasks from the queue: {ex.args}')
+                    break
 
-                        if not task_chain_class:
-                            logger.error(f'No task chain class found for {new_task["name"]}.')
-                            self._update_task_status(f'task::{new_task["id"]}', TaskStatusCodes.error)
-                            continue
+                if not new_tasks:
+                    # Escape the job queueing loop because the queue is empty
+                    waited = self._pickup_blocked
+                    break
 
-                        # Instantiate the new task
-                        from CloudHarvestCoreTasks.factories import task_chain_from_dict
-                        from copy import deepcopy
-                        task_chain = task_chain_from_dict(
-                            template_identifier=f"{new_task['category']}/{new_task['name']}",
-                            template=deepcopy(task_chain_class[0]),
-                            **new_task['config']
-                        )
-                        task_chain.agent = Environment.get('agent.name')
+                for new_task in new_tasks:
+                    self._start_task_chain(new_task)
 
-                        # Create a new thread for this task chain
-                        thread = Thread(target=task_chain.run, daemon=True)
+            # Periodically return the tasks of crashed agents to the queue
+            if self._orphan_recovery_due():
+                try:
+                    self.recover_orphaned_tasks()
 
-                        # Add the task chain and task thread to the task pool
-                        self.tasks[task_chain.redis_name] = {
-                            'chain': task_chain,
-                            'thread': thread
-                        }
+                except Exception as e:
+                    logger.error(f'Could not recover orphaned tasks: {e.args}')
 
-                        # Start the thread
-                        thread.start()
+            logger.debug('queue worker cycle complete')
 
-                        self.task_chains_processed += 1
+            # A blocking pickup which found nothing already waited on the queue. Otherwise the queue is full, the pickup
+            # failed, or it did not block, so wait here. Completing chains set the wake event so the freed slots are
+            # filled immediately.
+            if not waited:
+                self._wake_event.wait(timeout=self.queue_check_interval_seconds)
 
-                        logger.info(f'{task_chain.redis_name} ({task_chain.template_identifier}) started.')
+            self._wake_event.clear()
 
-                    except Exception as ex:
-                        logger.error(f'Error while adding task chain {new_task["id"]} to the JobQueue: {ex.args}')
+    def _wake(self):
+        """
+        Wakes the worker thread so it can fill free slots or notice a status change.
+        """
+        self._wake_event.set()
 
-                        # Report the error to Redis
-                        self._update_task_status(f'task::{new_task["id"]}', TaskStatusCodes.error)
+    def _wakeup_listener(self):
+        """
+        A thread which wakes the worker as soon as a task is enqueued. Enqueuers announce new tasks by publishing to
+        `wakeup_channel`. When `wakeup_keyspace_notifications` is enabled, pushes to the queue lists also wake the worker;
+        this requires the `harvest-tasks` Redis server to be configured with `notify-keyspace-events Kl`.
+        """
+        pubsub = self.task_silo.pubsub(ignore_subscribe_messages=True)
 
-                else:
-                    # Escape the job queueing loop because the queue is empty
-                    break
+        try:
+            if self.wakeup_channel:
+                pubsub.subscribe(self.wakeup_channel)
+
+            if self.wakeup_keyspace_notifications:
+                database = self.task_silo.connection_pool.connection_kwargs.get('db', 0)
+                pubsub.psubscribe(f'__keyspace@{database}__:queue::*')
 
-            # Remove completed tasks from the task pool
-            for task_object in list(self.tasks.values()):
-                if not task_object['thread'].is_alive():
-                    task_chain = task_object['chain']
-                    redis_name, final_status = task_chain.redis_name, task_chain.status
+            while self.status == JobQueueStatusCodes.running:
+                message = pubsub.get_message(timeout=self.queue_check_interval_seconds)
 
-                    # Report the final status to Redis
-                    task_chain.update_status()
+                if message:
+                    self._wake()
 
-                    # Remove it from the task pool
-                    self.tasks.pop(task_chain.redis_name, None)
+        except Exception as e:
+            logger.error(f'The queue wakeup listener stopped: {e.args}')
 
-                    logger.info(f'{redis_name} ({task_chain.template_identifier}) removed from the task pool with status: {final_status}')
+        finally:
+            pubsub.close()
 
-            from time import sleep
-            logger.debug('queue worker cycle complete')
-            sleep(self.queue_check_interval_seconds)
+    def _remove_task_chain(self, redis_name: str, task_object: dict):
+        """
+        Removes a finished TaskChain from the task pool and records its completion in the queue's counters and metrics.
+
+        Arguments
+        redis_name (str): The Redis name of the completed TaskChain.
+        task_object (dict): The task pool entry of the TaskChain.
+        """
+        with self._tasks_lock:
+            self.tasks.pop(redis_name, None)
+
+        self.deadlines.cancel(redis_name)
+
+        status = TIMEOUT_TASK_STATUS if task_object.get('timed_out') else str(task_object['chain'].status)
+        duration_seconds = monotonic() - task_object['started']
+
+        template_identifier = task_object['chain'].template_identifier
+
+        self.counters.finished(redis_name, status)
+        self.metrics.completed(duration_seconds=duration_seconds)
+        CHAIN_DURATION_SECONDS.observe(duration_seconds, template_identifier)
+        CHAINS_FINISHED.inc(template_identifier, status)
+
+        # Completes the accounting of a TaskChain whose final status could not be reported
+        self._record_usage(redis_name, task_object, status)
+
+        if self.concurrency:
+            self.concurrency.record(template_identifier=template_identifier,
+                                    duration_seconds=duration_seconds,
+                                    errored=status in ('error', TIMEOUT_TASK_STATUS))
+
+    def _record_usage(self, redis_name: str, task_object: dict, status: str) -> dict or None:
+        """
+        Completes the resource accounting of a finished TaskChain.
+
+        Arguments
+        redis_name (str): The Redis name of the TaskChain.
+        task_object (dict): The task pool entry of the TaskChain.
+        status (str): The final status of the TaskChain.
+
+        Returns
+        The usage of the TaskChain, or None if its accounting was already completed.
+        """
+        task_chain = task_object['chain']
+        summary = task_chain.summary if isinstance(task_chain, ProcessTaskChain) else None
+        result_sink = getattr(task_chain, 'result_sink', None)
+
+        return self.accounting.finished(redis_name,
+                                        status=status,
+                                        summary=summary,
+                                        records=result_sink.records if result_sink is not None else (summary or {}).get('records'))
+
+    def _run_task_chain(self, task_chain: BaseTaskChain):
+        """
+        Runs a TaskChain in the thread pool, accounting for the CPU time of the thread while it runs.
+
+        Arguments
+        task_chain (BaseTaskChain): The TaskChain to run.
+        """
+        task_object = self.tasks.get(task_chain.redis_name) or {}
+
+        # Identifies the thread so the TaskChain can be profiled
+        task_object['thread_id'] = get_ident()
+        self.accounting.attach_thread(task_chain.redis_name)
+        self.counters.transition(task_chain.redis_name, TaskStatusCodes.running)
+
+        try:
+            run_task_chain(task_chain)
+
+        finally:
+            task_object['thread_id'] = None
+            self.accounting.detach_thread(task_chain.redis_name)
+
+            # TaskChains which timed out keep the status the deadline gave them
+            if not task_object.get('timed_out'):
+                self.counters.transition(task_chain.redis_name, task_chain.status)
+
+    def _on_chain_complete(self, redis_name: str, future: Future):
+        """
+        Called by the executor as soon as a TaskChain finishes. Reports the final status of the chain, removes it from
+        the task pool and this agent's processing list, and wakes the worker thread to fill the freed slot.
+
+        Arguments
+        redis_name (str): The Redis name of the completed TaskChain.
+        future (Future): The future which ran the TaskChain.
+        """
+        with self._tasks_lock:
+            task_object = self.tasks.get(redis_name)
+
+        if task_object is None:
+            return
+
+        task_chain = task_object['chain']
+
+        try:
+            if future.exception():
+                logger.error(f'{redis_name} ({task_chain.template_identifier}) raised an exception: {future.exception().args}')
+
+                if isinstance(future.exception(), BrokenProcessPool):
+                    self._replace_broken_process_pool(task_object)
+
+            self._report_final_status(redis_name, task_object)
+
+        except Exception as ex:
+            logger.error(f'{redis_name} failed to report its final status: {ex.args}')
+
+        finally:
+            # Remove it from the task pool and this agent's processing list
+            self._remove_task_chain(redis_name, task_object)
+
+            self._release_task(redis_name, task_object['processing_list'])
+
+            logger.info(f'{redis_name} ({task_chain.template_identifier}) removed from the task pool with status: {task_chain.status}')
+
+            self._wake()
+
+    def _replace_broken_process_pool(self, task_object: dict):
+        """
+        Replaces the process pool for subsequent TaskChains after one of its workers died.
+
+        Arguments
+        task_object (dict): The task pool entry of a TaskChain which ran in the broken pool.
+        """
+        with self._tasks_lock:
+            # The broken pool may already have been replaced, for example when a TaskChain was abandoned
+            if self._process_executor is task_object.get('executor'):
+                self._process_executor = None
+
+    def _report_final_status(self, redis_name: str, task_object: dict):
+        """
+        Has a finished TaskChain report its final status to Redis. TaskChains which exceeded their timeout are reported
+        as `timeout` rather than `terminated`.
+
+        Arguments
+        redis_name (str): The Redis name of the finished TaskChain.
+        task_object (dict): The task pool entry of the TaskChain.
+        """
+        # Pending updates are older than the final status and must not overwrite it
+        self.reporter.discard(redis_name)
+        task_object['chain'].update_status()
+
+        self._report_final_fields(redis_name, task_object)
+
+    def _report_final_fields(self, redis_name: str, task_object: dict):
+        """
+        Writes the fields the queue adds to the final status of a TaskChain: `timeout` in place of the status of a
+        TaskChain which exceeded its timeout, and the TaskChain's resource usage. The fields are written right away in
+        a single command, after which the reporter forgets the TaskChain.
+
+        Arguments
+        redis_name (str): The Redis name of the finished TaskChain.
+        task_object (dict): The task pool entry of the TaskChain.
+        """
+        import json
+
+        timed_out = task_object.get('timed_out')
+        fields = {'status': TIMEOUT_TASK_STATUS} if timed_out else {}
+
+        usage = self._record_usage(redis_name, task_object,
+                                   TIMEOUT_TASK_STATUS if timed_out else str(task_object['chain'].status))
+
+        if usage is not None:
+            fields['resource_usage'] = json.dumps(usage)
+
+        self.reporter.finish(redis_name, **fields)
+
+    def chain_timeout(self, template_identifier: str) -> float:
+        """
+        Returns the number of seconds a TaskChain may run. A template's entry in `chain_timeout_templates` takes
+        precedence over its category's entry, which takes precedence over `chain_timeout_seconds`. A timeout of 0 or
+        None means the TaskChain may run indefinitely.
+
+        Arguments
+        template_identifier (str): The template of the TaskChain, as `category/name`.
+        """
+        category = template_identifier.split('/')[0]
+
+        for key in (template_identifier, category):
+            if key in self.chain_timeout_templates:
+                return self.chain_timeout_templates[key]
+
+        return self.chain_timeout_seconds
+
+    def _on_deadline(self, redis_name: str, stage: str):
+        """
+        Called by the deadline scheduler when a TaskChain's deadline passes. At the `terminate` stage the TaskChain is
+        directed to terminate, reported as `timeout`, and given `chain_timeout_grace_seconds` to exit. At the `escalate`
+        stage a TaskChain which is still running is abandoned so its slot can be reused.
+
+        Arguments
+        redis_name (str): The Redis name of the TaskChain.
+        stage (str): The deadline stage which passed.
+        """
+        with self._tasks_lock:
+            task_object = self.tasks.get(redis_name)
+
+        if task_object is None:
+            return
+
+        task_chain = task_object['chain']
+
+        if stage == DeadlineStages.terminate:
+            logger.warning(f'{redis_name} ({task_chain.template_identifier}) exceeded its timeout of '
+                           f'{self.chain_timeout(task_chain.template_identifier)} seconds and will be terminated.')
+
+            task_object['timed_out'] = True
+            task_chain.terminate()
+            self.counters.transition(redis_name, TaskStatusCodes.terminating)
+            self.reporter.update(redis_name, urgent=True, status=TIMEOUT_TASK_STATUS)
+
+            self.deadlines.schedule(redis_name, self.chain_timeout_grace_seconds, stage=DeadlineStages.escalate)
+
+        elif stage == DeadlineStages.escalate:
+            future = task_object['future']
+
+            if future is not None and future.done():
+                return
+
+            self._abandon_task_chain(redis_name, task_object)
+
+    def _abandon_task_chain(self, redis_name: str, task_object: dict):
+        """
+        Frees the slot of a TaskChain which did not exit after being terminated. The executor running the TaskChain is
+        replaced with a new one and left to finish its other work, and the abandoned TaskChain's eventual completion
+        is ignored. Threads cannot be killed, so an abandoned thread TaskChain keeps its thread until it exits on its
+        own. The worker process of an abandoned process TaskChain is killed once the other TaskChains of its pool have
+        finished, because killing a worker breaks the pool it belongs to.
+
+        Arguments
+        redis_name (str): The Redis name of the TaskChain.
+        task_object (dict): The task pool entry of the TaskChain.
+        """
+        task_chain = task_object['chain']
+
+        logger.error(f'{redis_name} ({task_chain.template_identifier}) did not exit within '
+                     f'{self.chain_timeout_grace_seconds} seconds of being terminated and was abandoned.')
+
+        with self._tasks_lock:
+            # The executor may already have been replaced when another of its TaskChains was abandoned
+            old_executor = task_object.get('executor')
+
+            if isinstance(task_chain, ProcessTaskChain):
+                if self._process_executor is old_executor:
+                    self._process_executor = None
+
+            elif self._executor is old_executor:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_chains, thread_name_prefix='chain')
+
+            self.abandoned_chains += 1
+
+        if old_executor is not None:
+            old_executor.shutdown(wait=False)
+
+        self._report_final_fields(redis_name, task_object)
+        self._remove_task_chain(redis_name, task_object)
+        self._release_task(redis_name, task_object['processing_list'])
+
+        # A TaskChain still waiting for a worker is simply cancelled
+        if isinstance(task_chain, ProcessTaskChain) and not task_object['future'].cancel():
+            with self._tasks_lock:
+                siblings = [
+                    other['future']
+                    for other in self.tasks.values()
+                    if other['future'] is not None and other.get('executor') is old_executor
+                ]
+
+            Thread(target=self._kill_abandoned_worker, args=(task_chain, task_object['future'], siblings),
+                   name='abandon', daemon=True).start()
+
+        self._wake()
+
+    def _kill_abandoned_worker(self, task_chain: ProcessTaskChain, future: Future, siblings: list):
+        """
+        Kills the worker process of an abandoned TaskChain after the other TaskChains of its retired process pool have
+        finished.
+
+        Arguments
+        task_chain (ProcessTaskChain): The abandoned TaskChain.
+        future (Future): The future which runs the abandoned TaskChain.
+        siblings (list): The futures of the other TaskChains in the same process pool.
+        """
+        wait(siblings)
+
+        if not future.done():
+            task_chain.kill()
+
+    def _start_task_chain(self, new_task: dict):
+        """
+        Instantiates the TaskChain for a claimed task and submits it to the executor.
+
+        Arguments
+        new_task (dict): The claimed task.
+        """
+        try:
+            task_chain = self._submit_task_chain(new_task)
+
+            if task_chain is None:
+                logger.error(f'No task chain class found for {new_task["name"]}.')
+                self._update_task_status(new_task['redis_name'], TaskStatusCodes.error)
+                self._release_task(new_task['redis_name'], new_task['processing_list'])
+
+        except Exception as ex:
+            logger.error(f'Error while adding task chain {new_task.get("id")} to the JobQueue: {ex.args}')
+
+            # Report the error to Redis
+            self._update_task_status(new_task['redis_name'], TaskStatusCodes.error)
+            self._release_task(new_task['redis_name'], new_task['processing_list'])
+
+    def _submit_task_chain(self, new_task: dict) -> BaseTaskChain or ProcessTaskChain or None:
+        """
+        Builds the TaskChain for a claimed task, adds it to the task pool, and submits it to the executor selected by
+        `execution_backend()`. `_on_chain_complete()` is called when the TaskChain finishes.
+
+        Arguments
+        new_task (dict): The claimed task.
+
+        Returns
+        The TaskChain, or None if no template is registered for the task.
+        """
+        use_process_pool = self.execution_backend(new_task) == ExecutionBackends.process
+
+        if use_process_pool:
+            # The TaskChain is built and run in a process pool worker; the parent only holds a handle to it
+            task_chain = ProcessTaskChain(new_task)
+            run = partial(run_chain_in_process, task_chain.shared_memory_name, new_task)
+
+        else:
+            task_chain = build_task_chain(new_task)
+            run = partial(self._run_task_chain, task_chain)
+
+        if task_chain is None:
+            return None
+
+        # Add the task chain to the task pool before it is submitted so the completion callback can always find it
+        with self._tasks_lock:
+            self.tasks[task_chain.redis_name] = {
+                'chain': task_chain,
+                'executor': None,
+                'future': None,
+                'priority': queue_priority(new_task['processing_list']),
+                'processing_list': new_task['processing_list'],
+                'started': monotonic(),
+                'thread_id': None,
+                'timed_out': False
+            }
+
+            self.counters.started(task_chain.redis_name, task_chain.template_identifier, task_chain.status)
+            self.reporter.track(task_chain.redis_name)
+            self.accounting.started(task_chain.redis_name,
+                                    task_chain.template_identifier,
+                                    queue_wait_seconds=queue_wait_seconds(new_task))
+
+            # Start the task chain. The executor is selected while holding the lock because abandoning a TaskChain
+            # replaces it.
+            executor = self._get_process_executor() if use_process_pool else self._executor
+            future = executor.submit(run)
+            self.tasks[task_chain.redis_name]['executor'] = executor
+            self.tasks[task_chain.redis_name]['future'] = future
+
+        timeout = self.chain_timeout(task_chain.template_identifier)
+
+        if timeout:
+            self.deadlines.schedule(task_chain.redis_name, timeout)
+
+        if isinstance(task_chain, ProcessTaskChain):
+            # Collect the final status from the child process before the queue reaps the TaskChain
+            future.add_done_callback(task_chain.complete)
+
+        future.add_done_callback(partial(self._on_chain_complete, task_chain.redis_name))
+
+        self.task_chains_processed += 1
+
+        logger.info(f'{task_chain.redis_name} ({task_chain.template_identifier}) started.')
+
+        return task_chain
+
+    def execution_backend(self, task: dict) -> str:
+        """
+        Returns the backend which should run a task's TaskChain. TaskChains whose template category is listed in
+        `process_pool_categories` or whose template identifier is listed in `process_pool_templates` run in the process
+        pool; all other TaskChains run in the thread pool.
+
+        Arguments
+        task (dict): The claimed task.
+        """
+        if task.get('category') in self.process_pool_categories:
+            return ExecutionBackends.process
+
+        if f"{task.get('category')}/{task.get('name')}" in self.process_pool_templates:
+            return ExecutionBackends.process
+
+        return ExecutionBackends.thread
+
+    def _get_process_executor(self) -> ProcessPoolExecutor:
+        """
+        Returns the process pool, creating it if necessary. Workers are spawned rather than forked because the agent
+        runs many threads which may hold locks at the time of a fork.
+        """
+        if self._process_executor is None:
+            from multiprocessing import get_context
+
+            self._process_executor = ProcessPoolExecutor(max_workers=self.process_pool_workers,
+                                                         mp_context=get_context('spawn'),
+                                                         initializer=process_initializer,
+                                                         initargs=(self.agent_name, Environment.get('silos') or {}))
+
+        return self._process_executor
+
+    def _orphan_recovery_due(self) -> bool:
+        """
+        Returns True when `orphan_recovery_interval_seconds` have passed since the last orphaned task recovery.
+        """
+        if not self.orphan_recovery_interval_seconds:
+            return False
+
+        if self.last_orphan_recovery is None:
+            return True
+
+        elapsed = (datetime.now(tz=timezone.utc) - self.last_orphan_recovery).total_seconds()
+
+        return elapsed >= self.orphan_recovery_interval_seconds
+
+    def get(self, task_id: str) -> BaseTaskChain or ProcessTaskChain or None:
+        """
+        Returns a running TaskChain.
+
+        Arguments
+        task_id (str): The Redis name or ID of the TaskChain.
+        """
+        task_object = self._get_task_object(task_id)
+
+        return task_object['chain'] if task_object else None
+
+    def _get_task_object(self, task_id: str) -> dict or None:
+        """
+        Returns the task pool entry of a running TaskChain.
+
+        Arguments
+        task_id (str): The Redis name or ID of the TaskChain.
+        """
+        with self._tasks_lock:
+            return self.tasks.get(task_id) or next(
+                (
+                    task_object
+                    for redis_name, task_object in self.tasks.items()
+                    if redis_name.split('::')[-1] == task_id
+                ),
+                None
+            )
+
+    def profile_task(self, task_id: str, seconds: float = 10) -> dict or None:
+        """
+        Samples the stacks of the thread running a TaskChain.
+
+        Arguments
+        task_id (str): The Redis name or ID of the TaskChain.
+        seconds (float, optional): How long to sample for. The profile ends early when the TaskChain finishes.
+
+        Returns
+        The profile (see `SamplingProfiler.profile()`), a dictionary with an `error` when the TaskChain cannot be
+        profiled, or None if the TaskChain is not running on this agent.
+        """
+        task_object = self._get_task_object(task_id)
+
+        if task_object is None:
+            return None
+
+        task_chain = task_object['chain']
+
+        if isinstance(task_chain, ProcessTaskChain):
+            return {'error': 'The TaskChain runs in the process pool and cannot be profiled.'}
+
+        def threads() -> dict:
+            thread_id = task_object.get('thread_id')
+
+            return {thread_id: None} if thread_id is not None and task_chain.redis_name in self.tasks else {}
+
+        try:
+            profile = self.profiler.profile(threads=threads, seconds=seconds)
+
+        except ProfilerBusy as ex:
+            return {'error': str(ex)}
+
+        return {'redis_name': task_chain.redis_name, 'template': task_chain.template_identifier} | profile
+
+    def profile_agent(self, seconds: float = 10) -> dict:
+        """
+        Samples the stacks of every thread of the agent. The stacks of threads running a TaskChain are rooted at the
+        TaskChain's template; those of other threads at their name, less numeric suffixes.
+
+        Arguments
+        seconds (float, optional): How long to sample for.
+
+        Returns
+        The profile (see `SamplingProfiler.profile()`), or a dictionary with an `error` when another profile is running.
+        """
+        def threads() -> dict:
+            with self._tasks_lock:
+                chains = {
+                    task_object['thread_id']: f'chain:{task_object["chain"].template_identifier}'
+                    for task_object in self.tasks.values()
+                    if task_object.get('thread_id') is not None
+                }
+
+            return {
+                thread.ident: chains.get(thread.ident) or thread_group(thread.name)
+                for thread in enumerate_threads()
+            }
+
+        try:
+            return self.profiler.profile(threads=threads, seconds=seconds)
+
+        except ProfilerBusy as ex:
+            return {'error': str(ex)}
+
+    def task_status(self, task_id: str) -> str or None:
+        """
+        Returns the status of a running TaskChain, or None if it is not running on this agent.
+
+        Arguments
+        task_id (str): The Redis name or ID of the TaskChain.
+        """
+        task_chain = self.get(task_id)
+
+        return str(task_chain.status) if task_chain else None
+
+    def terminate_task(self, task_id: str) -> bool:
+        """
+        Directs a running TaskChain to terminate.
+
+        Arguments
+        task_id (str): The Redis name or ID of the TaskChain.
+
+        Returns
+        True if the TaskChain was found, otherwise False.
+        """
+        task_chain = self.get(task_id)
+
+        if task_chain is None:
+            return False
+
+        task_chain.terminate()
+        self.counters.transition(task_chain.redis_name, TaskStatusCodes.terminating)
+        self.reporter.update(task_chain.redis_name, urgent=True, status=TaskStatusCodes.terminating)
+
+        return True
 
     def start(self) -> 'TaskChainQueue':
         """
@@ -235,6 +1530,9 @@ class TaskChainQueue:
 
         self.status = JobQueueStatusCodes.running
 
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_chains, thread_name_prefix='chain')
+
         if self.worker_thread:
             if self.worker_thread.is_alive():
                 logger.warning('JobQueue is already running.')
@@ -243,6 +1541,18 @@ class TaskChainQueue:
         self.worker_thread = Thread(target=self._worker, daemon=True)
         self.worker_thread.start()
 
+        self.reporter.start()
+        self.deadlines.start()
+        self.accounting.start()
+
+        if self.concurrency:
+            self.concurrency.start()
+
+        # Blocking pickups wake on new tasks by themselves; polling workers wait on the wake event between cycles
+        if not self.blocking_pickup and (self.wakeup_channel or self.wakeup_keyspace_notifications):
+            self.wakeup_thread = Thread(target=self._wakeup_listener, daemon=True)
+            self.wakeup_thread.start()
+
         return self
 
     def stop(self, terminate: bool = False) -> 'TaskChainQueue':
@@ -257,23 +1567,42 @@ class TaskChainQueue:
         logger.warning('Stopping the JobQueue.')
         self.status = JobQueueStatusCodes.terminating if terminate else JobQueueStatusCodes.stopping
 
+        # Wake the worker thread so it notices the status change
+        self._wake()
+
         # Direct all task chains to terminate
         if terminate:
-            for task_object in self.tasks.values():
+            with self._tasks_lock:
+                task_objects = list(self.tasks.values())
+
+            for task_object in task_objects:
                 task_chain = task_object['chain']
                 task_chain.terminate()
+                self.counters.transition(task_chain.redis_name, TaskStatusCodes.terminating)
+                self.reporter.update(task_chain.redis_name, status=TaskStatusCodes.terminating)
 
-                self.task_silo.hset(name=task_chain.redis_name, key='status', value=TaskStatusCodes.terminating)
+            # Report every termination in one pipeline
+            self.reporter.flush()
 
-            while not all(not task_object['thread'].is_alive() for task_object in self.tasks.values()):
-                # Wait for all task chains to terminate
-                from time import sleep
-                sleep(1)
+            # Wait for all task chains to terminate, giving up on those which do not exit within the grace period
+            done, not_done = wait([task_object['future'] for task_object in task_objects if task_object['future'] is not None],
+                                  timeout=self.chain_timeout_grace_seconds or None)
 
-        # Stop the worker thread
-        if self.worker_thread:
-            if self.worker_thread.is_alive():
-                self.worker_thread.join()
+            if not_done:
+                logger.error(f'{len(not_done)} TaskChains did not exit within {self.chain_timeout_grace_seconds} seconds '
+                             f'of being terminated.')
+
+        # Stop the worker and wakeup threads
+        for thread in (self.worker_thread, self.wakeup_thread):
+            if thread and thread.is_alive():
+                thread.join()
+
+        if self.concurrency:
+            self.concurrency.stop()
+
+        self.accounting.stop()
+        self.deadlines.stop()
+        self.reporter.stop()
 
         self.status = JobQueueStatusCodes.stopped
         self.stop_time = datetime.now(tz=timezone.utc)
@@ -282,6 +1611,38 @@ class TaskChainQueue:
         return self
 
 
+def queue_wait_seconds(task: dict) -> float or None:
+    """
+    Returns the number of seconds a task waited in the queue before this agent claimed it, or None when the task does
+    not record when it was enqueued.
+
+    Arguments
+    task (dict): The claimed task.
+    """
+    for key in ('enqueued', 'created'):
+        value = task.get(key)
+
+        if not value:
+            continue
+
+        try:
+            if isinstance(value, (int, float)):
+                enqueued = datetime.fromtimestamp(value, tz=timezone.utc)
+
+            else:
+                enqueued = datetime.fromisoformat(str(value))
+
+                if enqueued.tzinfo is None:
+                    enqueued = enqueued.replace(tzinfo=timezone.utc)
+
+            return max((datetime.now(tz=timezone.utc) - enqueued).total_seconds(), 0)
+
+        except (ValueError, TypeError, OverflowError):
+            continue
+
+    return None
+
+
 class JobQueueStatusCodes:
     error = 'error'
     initialized = 'initialized'
@@ -0,0 +1,283 @@
+"""
+Queue metrics for the CloudHarvestAgent. The TaskChainQueue records claims and completions as they happen; the metrics
+publisher periodically turns them into a compact record which is appended to a capped Redis Stream in the
+`harvest-nodes` silo so the API and reports can follow each agent's load over time.
+
+The queue also maintains counters of its TaskChains by status and template so that status reports and heartbeats do not
+need to inspect every running TaskChain, and a window of recent queue wait times from which per-queue percentiles are
+reported.
+"""
+
+from collections import deque
+from datetime import datetime, timezone
+from threading import Lock
+from time import monotonic
+
+
+def metrics_stream_name(agent_name: str) -> str:
+    """
+    Returns the name of the Redis Stream which holds an agent's metrics records.
+
+    Arguments
+    agent_name (str): The name of the agent.
+    """
+    return f'metrics::{agent_name}'
+
+
+class QueueMetrics:
+    """
+    Accumulates queue activity between metrics records.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+
+        self._window_start = monotonic()
+        self._claims = 0
+        self._completions = 0
+        self._queue_wait_seconds = 0.0
+        self._queue_wait_samples = 0
+        self._chain_duration_seconds = 0.0
+
+        # The most recent record returned by `record()`
+        self.latest = {}
+
+    def claimed(self, queue_wait_seconds: float = None):
+        """
+        Records a claimed task.
+
+        Arguments
+        queue_wait_seconds (float, optional): The time between the task being enqueued and claimed, when known.
+        """
+        with self._lock:
+            self._claims += 1
+
+            if queue_wait_seconds is not None:
+                self._queue_wait_seconds += queue_wait_seconds
+                self._queue_wait_samples += 1
+
+    def completed(self, duration_seconds: float):
+        """
+        Records a completed TaskChain.
+
+        Arguments
+        duration_seconds (float): The time the TaskChain spent running.
+        """
+        with self._lock:
+            self._completions += 1
+            self._chain_duration_seconds += duration_seconds
+
+    def record(self, running_chains: int, max_chains: int, concurrency_limit: int = None) -> dict:
+        """
+        Returns a metrics record covering the time since the previous record and starts a new window.
+
+        Arguments
+        running_chains (int): The number of TaskChains currently running.
+        max_chains (int): The maximum number of TaskChains the queue will run at once.
+        concurrency_limit (int, optional): The number of TaskChains the queue currently admits, when it is adjusted
+            by adaptive concurrency control. Defaults to `max_chains`.
+        """
+        concurrency_limit = concurrency_limit or max_chains
+
+        with self._lock:
+            now = monotonic()
+            elapsed = max(now - self._window_start, 1e-9)
+
+            result = {
+                'timestamp': datetime.now(tz=timezone.utc).isoformat(),
+                'running_chains': running_chains,
+                'concurrency_limit': concurrency_limit,
+                'free_slots': max(concurrency_limit - running_chains, 0),
+                'claims_per_second': round(self._claims / elapsed, 3),
+                'completions_per_second': round(self._completions / elapsed, 3),
+                'queue_wait_seconds_mean': round(self._queue_wait_seconds / self._queue_wait_samples, 3)
+                                           if self._queue_wait_samples else 0,
+                'chain_duration_seconds_mean': round(self._chain_duration_seconds / self._completions, 3)
+                                               if self._completions else 0,
+            }
+
+            self._window_start = now
+            self._claims = 0
+            self._completions = 0
+            self._queue_wait_seconds = 0.0
+            self._queue_wait_samples = 0
+            self._chain_duration_seconds = 0.0
+
+            self.latest = result
+
+        return result
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    """
+    Returns a percentile of sorted samples using the nearest-rank method.
+
+    Arguments
+    ordered (list): The samples, sorted in ascending order.
+    fraction (float): The percentile as a fraction, such as 0.99.
+    """
+    from math import ceil
+
+    return ordered[max(ceil(fraction * len(ordered)) - 1, 0)]
+
+
+class QueueWaitTimes:
+    """
+    Keeps the most recent queue wait times of each queue and reports their percentiles.
+    """
+
+    def __init__(self, samples: int = 1024):
+        """
+        Arguments
+        samples (int, optional): The number of recent wait times kept per queue.
+        """
+        self.samples = samples
+
+        self._lock = Lock()
+        self._wait_seconds = {}     # {queue_name: deque of seconds}
+
+    def record(self, queue_name: str, wait_seconds: float):
+        """
+        Records the time a claimed task waited in a queue.
+
+        Arguments
+        queue_name (str): The queue the task was claimed from.
+        wait_seconds (float): The time between the task being enqueued and claimed.
+        """
+        with self._lock:
+            if queue_name not in self._wait_seconds:
+                self._wait_seconds[queue_name] = deque(maxlen=self.samples)
+
+            self._wait_seconds[queue_name].append(wait_seconds)
+
+    def percentiles(self) -> dict:
+        """
+        Returns the count and the 50th, 90th, 99th percentile, and maximum recent wait time of each queue in seconds.
+        """
+        with self._lock:
+            samples = {queue_name: sorted(wait_seconds) for queue_name, wait_seconds in self._wait_seconds.items()}
+
+        return {
+            queue_name: {
+                'count': len(ordered),
+                'p50': round(percentile(ordered, 0.5), 3),
+                'p90': round(percentile(ordered, 0.9), 3),
+                'p99': round(percentile(ordered, 0.99), 3),
+                'max': round(ordered[-1], 3)
+            }
+            for queue_name, ordered in sorted(samples.items())
+            if ordered
+        }
+
+
+class QueueCounters:
+    """
+    Per-status and per-template counts of the TaskChains in a queue, along with lifetime totals. The counts are updated
+    as TaskChains change state, so reading them costs the same regardless of how many TaskChains are running.
+    """
+
+    def __init__(self, status_codes: list = None):
+        """
+        Arguments
+        status_codes (list, optional): Status codes which are always reported, even when no TaskChain has them.
+        """
+        self._lock = Lock()
+        self._chains = {}                           # {redis_name: (template_identifier, status)}
+        self._by_status = {str(code): 0 for code in status_codes or []}
+        self._by_template = {}
+        self._timeouts_by_template = {}
+
+        self.processed = 0
+        self.errored = 0
+        self.terminated = 0
+        self.timed_out = 0
+
+    def started(self, redis_name: str, template_identifier: str, status: str):
+        """
+        Records a TaskChain entering the queue.
+
+        Arguments
+        redis_name (str): The Redis name of the TaskChain.
+        template_identifier (str): The template of the TaskChain, as `category/name`.
+        status (str): The status of the TaskChain.
+        """
+        status = str(status)
+
+        with self._lock:
+            self._chains[redis_name] = (template_identifier, status)
+            self._by_status[status] = self._by_status.get(status, 0) + 1
+            self._by_template[template_identifier] = self._by_template.get(template_identifier, 0) + 1
+
+    def transition(self, redis_name: str, status: str):
+        """
+        Records a TaskChain changing status.
+
+        Arguments
+        redis_name (str): The Redis name of the TaskChain.
+        status (str): The new status of the TaskChain.
+        """
+        status = str(status)
+
+        with self._lock:
+            if redis_name not in self._chains:
+                return
+
+            template_identifier, previous_status = self._chains[redis_name]
+
+            if previous_status == status:
+                return
+
+            self._chains[redis_name] = (template_identifier, status)
+            self._by_status[previous_status] -= 1
+            self._by_status[status] = self._by_status.get(status, 0) + 1
+
+    def finished(self, redis_name: str, status: str):
+        """
+        Records a TaskChain leaving the queue and adds it to the lifetime totals.
+
+        Arguments
+        redis_name (str): The Redis name of the TaskChain.
+        status (str): The final status of the TaskChain.
+        """
+        status = str(status)
+
+        with self._lock:
+            if redis_name not in self._chains:
+                return
+
+            template_identifier, previous_status = self._chains.pop(redis_name)
+
+            self._by_status[previous_status] -= 1
+            self._by_template[template_identifier] -= 1
+
+            if not self._by_template[template_identifier]:
+                del self._by_template[template_identifier]
+
+            self.processed += 1
+
+            if status == 'error':
+                self.errored += 1
+
+            elif status in ('terminated', 'terminating'):
+                self.terminated += 1
+
+            elif status == 'timeout':
+                self.timed_out += 1
+                self._timeouts_by_template[template_identifier] = self._timeouts_by_template.get(template_identifier, 0) + 1
+
+    def snapshot(self) -> dict:
+        """
+        Returns a copy of the counts.
+        """
+        with self._lock:
+            return {
+                'chain_status': dict(self._by_status),
+                'chain_templates': dict(self._by_template),
+                'chain_timeouts': dict(self._timeouts_by_template),
+                'totals': {
+                    'errored': self.errored,
+                    'processed': self.processed,
+                    'terminated': self.terminated,
+                    'timed_out': self.timed_out
+                }
+            }
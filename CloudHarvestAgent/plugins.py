@@ -0,0 +1,145 @@
+"""
+Installs the agent's plugins once per host. Installation runs in the gunicorn master before any worker starts (see
+`gunicorn_conf.on_starting`) and is skipped entirely when the plugin list, the installed packages, and the Python
+interpreter are unchanged since the last successful installation, as recorded in a stamp file.
+
+Plugins may be installed from a local wheelhouse instead of their repositories so agents can start without network
+access to them.
+"""
+
+from logging import getLogger
+
+logger = getLogger('harvest')
+
+
+def plugins_hash(plugins: list) -> str:
+    """
+    Returns a hash of the plugin list, the versions of every installed distribution, and the Python version.
+
+    Arguments
+    plugins (list): The plugins from the `plugins` configuration.
+    """
+    import json
+    import sys
+    from hashlib import sha256
+    from importlib import invalidate_caches
+    from importlib.metadata import distributions
+
+    # Pick up distributions installed by this process
+    invalidate_caches()
+
+    installed = sorted({
+        f'{distribution.metadata["Name"]}=={distribution.version}'
+        for distribution in distributions()
+        if distribution.metadata['Name']
+    })
+
+    return sha256(json.dumps({
+        'installed': installed,
+        'plugins': plugins,
+        'python': sys.version
+    }, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def plugin_requirement(plugin: dict) -> str:
+    """
+    Returns the requirement used to install a plugin from a wheelhouse. The package name is taken from the end of the
+    plugin's URL, and the plugin's branch is used as its version when it is a version number.
+
+    Arguments
+    plugin (dict): A plugin from the `plugins` configuration.
+    """
+    from re import fullmatch
+
+    name = plugin['url_or_package_name'].rstrip('/').split('/')[-1]
+    name = name.removesuffix('.git')
+    branch = str(plugin.get('branch') or '')
+
+    if fullmatch(r'v?\d+(\.\d+)*', branch):
+        return f'{name}=={branch.lstrip("v")}'
+
+    return name
+
+
+def install_from_wheelhouse(plugins: list, wheelhouse: str, quiet: bool = False):
+    """
+    Installs plugins from a directory of wheels without contacting a package index or repository.
+
+    Arguments
+    plugins (list): The plugins from the `plugins` configuration.
+    wheelhouse (str): The directory which contains the plugin wheels and their dependencies.
+    quiet (bool, optional): Suppresses pip output.
+    """
+    import sys
+    from os.path import abspath, expanduser
+    from subprocess import run
+
+    command = [
+        sys.executable, '-m', 'pip', 'install',
+        '--no-index',
+        '--find-links', abspath(expanduser(wheelhouse)),
+    ]
+
+    if quiet:
+        command.append('--quiet')
+
+    command.extend(plugin_requirement(plugin) for plugin in plugins)
+
+    run(command, check=True)
+
+
+def install_plugins_once(config, quiet: bool = False) -> bool:
+    """
+    Installs the configured plugins unless the stamp file shows they are already installed. Concurrent callers on the
+    same host wait for each other, so only the first performs the installation.
+
+    Arguments
+    config (WalkableDict): The agent configuration.
+    quiet (bool, optional): Suppresses installation output.
+
+    Returns
+    True if the plugins were installed, False if installation was skipped.
+    """
+    from CloudHarvestCorePluginManager.plugins import generate_plugins_file, install_plugins
+    from fcntl import LOCK_EX, LOCK_UN, flock
+    from os.path import abspath, dirname, exists, expanduser
+    from pathlib import Path
+    from time import perf_counter
+
+    plugins = config.walk('plugins') or []
+    stamp_path = abspath(expanduser(config.walk('agent.plugins.stamp_path') or './app/plugins.stamp'))
+    wheelhouse = config.walk('agent.plugins.wheelhouse')
+
+    Path(dirname(stamp_path)).mkdir(parents=True, exist_ok=True)
+
+    with open(f'{stamp_path}.lock', 'w') as lock_file:
+        flock(lock_file, LOCK_EX)
+
+        try:
+            start = perf_counter()
+
+            if exists(stamp_path):
+                with open(stamp_path) as stamp_file:
+                    if stamp_file.read().strip() == plugins_hash(plugins):
+                        logger.info(f'plugins: already installed; skipped in {perf_counter() - start:.2f} seconds')
+
+                        return False
+
+            generate_plugins_file(plugins)
+
+            if wheelhouse and plugins:
+                install_from_wheelhouse(plugins=plugins, wheelhouse=wheelhouse, quiet=quiet)
+
+            else:
+                install_plugins(quiet=quiet)
+
+            # The hash includes the newly installed versions so the next start finds a match
+            with open(stamp_path, 'w') as stamp_file:
+                stamp_file.write(plugins_hash(plugins))
+
+            logger.info(f'plugins: installed {len(plugins)} plugins in {perf_counter() - start:.2f} seconds')
+
+            return True
+
+        finally:
+            flock(lock_file, LOCK_UN)
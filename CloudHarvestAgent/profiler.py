@@ -0,0 +1,229 @@
+"""
+An on-demand sampling profiler for the CloudHarvestAgent. When a TaskChain is slow in production, the profiler can be
+pointed at the thread which runs it, or at every thread of the agent, for a number of seconds without restarting the
+agent under a profiler.
+
+The profiler periodically reads the stack of each target thread with `sys._current_frames()` and counts identical stacks.
+Nothing is installed in the profiled threads, so they run at full speed between samples. Reading the stacks holds the
+GIL, which is the profiler's only cost to the agent; the time spent sampling is measured and the interval between
+samples is stretched so that cost never exceeds `overhead_limit` of the profile's wall time.
+
+Profiles are returned as collapsed stacks, one `frame;frame;frame count` line per distinct stack with the outermost
+frame first, which flamegraph.pl, speedscope, and similar tools read directly, and as a table of the functions with the
+most samples.
+"""
+
+from logging import getLogger
+from threading import Lock, get_ident
+from time import perf_counter, sleep
+
+logger = getLogger('harvest')
+
+
+class ProfilerBusy(Exception):
+    """
+    Raised when a profile is requested while another profile is running.
+    """
+    pass
+
+
+def frame_label(frame) -> str:
+    """
+    Returns the label of a stack frame, such as `CloudHarvestAgent.jobs:TaskChainQueue._worker`.
+
+    Arguments
+    frame (frame): The stack frame.
+    """
+    code = frame.f_code
+
+    return f'{frame.f_globals.get("__name__") or code.co_filename}:{code.co_qualname}'
+
+
+def stack_labels(frame, max_depth: int) -> tuple:
+    """
+    Returns the labels of a frame and its callers, outermost first. Stacks deeper than `max_depth` are truncated at the
+    outermost end.
+
+    Arguments
+    frame (frame): The innermost stack frame.
+    max_depth (int): The most frames which are kept.
+    """
+    labels = []
+
+    while frame is not None and len(labels) < max_depth:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+
+    labels.reverse()
+
+    return tuple(labels)
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of an agent's threads. One profile runs at a time.
+    """
+
+    def __init__(self, interval_seconds: float = 0.01,
+                 max_seconds: float = 60,
+                 overhead_limit: float = 0.02,
+                 max_depth: int = 128,
+                 top: int = 25,
+                 **kwargs):
+        """
+        Arguments
+        interval_seconds (float, optional): The shortest time between samples.
+        max_seconds (float, optional): The longest profile which may be requested.
+        overhead_limit (float, optional): The largest fraction of a profile's wall time which may be spent sampling.
+        max_depth (int, optional): The most frames kept per stack.
+        top (int, optional): The number of functions in the table of a profile.
+        """
+        self.interval_seconds = interval_seconds
+        self.max_seconds = max_seconds
+        self.overhead_limit = overhead_limit
+        self.max_depth = max_depth
+        self.top = top
+
+        self._lock = Lock()
+        self.profiles = 0
+
+    def profile(self, threads, seconds: float) -> dict:
+        """
+        Samples the stacks of a set of threads.
+
+        Arguments
+        threads (callable): Called before each sample. Returns `{thread id: root label}` of the threads to sample; the
+            root label, when not None, is added as the outermost frame of the thread's stacks. The profile ends early
+            when it returns no threads.
+        seconds (float): How long to sample for. Limited to `max_seconds`.
+
+        Returns
+        A dictionary with the collapsed stacks, the top functions, and the number of samples and cost of the profile.
+
+        Raises
+        ProfilerBusy: Another profile is running.
+        """
+        from sys import _current_frames
+
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy('Another profile is running.')
+
+        try:
+            seconds = max(min(float(seconds), self.max_seconds), 0)
+            sampler_thread = get_ident()
+
+            stacks = {}                     # {(root label, (label, ...)): samples}
+            samples = 0
+            sampling_seconds = 0.0
+            start = perf_counter()
+            deadline = start + seconds
+
+            while perf_counter() < deadline:
+                sample_start = perf_counter()
+
+                targets = threads()
+
+                if not targets:
+                    break
+
+                frames = _current_frames()
+
+                for thread_id, root in targets.items():
+                    frame = frames.get(thread_id)
+
+                    if frame is None or thread_id == sampler_thread:
+                        continue
+
+                    stack = (root, stack_labels(frame, self.max_depth))
+                    stacks[stack] = stacks.get(stack, 0) + 1
+                    samples += 1
+
+                # Release the frames promptly so they do not keep the threads' locals alive
+                del frames
+
+                cost = perf_counter() - sample_start
+                sampling_seconds += cost
+
+                # Stretch the interval so the time spent sampling stays within `overhead_limit`
+                wait_seconds = max(self.interval_seconds, cost / self.overhead_limit if self.overhead_limit else 0)
+                sleep(max(min(wait_seconds - cost, deadline - perf_counter()), 0))
+
+            duration = perf_counter() - start
+
+        finally:
+            self._lock.release()
+
+        self.profiles += 1
+
+        return {
+            'collapsed': collapse(stacks),
+            'duration_seconds': round(duration, 3),
+            'overhead': round(sampling_seconds / duration, 4) if duration else 0,
+            'samples': samples,
+            'top': top_functions(stacks, samples, self.top)
+        }
+
+    def stats(self) -> dict:
+        """
+        Returns the profiler's configuration and the number of profiles taken.
+        """
+        return {
+            'interval_seconds': self.interval_seconds,
+            'max_seconds': self.max_seconds,
+            'overhead_limit': self.overhead_limit,
+            'profiles': self.profiles,
+            'running': self._lock.locked()
+        }
+
+
+def collapse(stacks: dict) -> str:
+    """
+    Returns stacks in the collapsed format, one `frame;frame;frame count` line per stack, the most sampled first.
+
+    Arguments
+    stacks (dict): `{(root label, (label, ...)): samples}`, outermost frame first.
+    """
+    lines = []
+
+    for (root, stack), count in sorted(stacks.items(), key=lambda item: (-item[1], str(item[0]))):
+        lines.append(f'{";".join(((root,) if root is not None else ()) + stack)} {count}')
+
+    return '\n'.join(lines)
+
+
+def top_functions(stacks: dict, samples: int, limit: int) -> list:
+    """
+    Returns the functions with the most samples. `self` counts the samples in which a function was running; `total`
+    counts those in which it was anywhere on the stack.
+
+    Arguments
+    stacks (dict): `{(root label, (label, ...)): samples}`, outermost frame first. Root labels are not functions and
+        are not counted.
+    samples (int): The total number of samples.
+    limit (int): The number of functions returned.
+    """
+    self_samples = {}
+    total_samples = {}
+
+    for (root, stack), count in stacks.items():
+        if not stack:
+            continue
+
+        self_samples[stack[-1]] = self_samples.get(stack[-1], 0) + count
+
+        # Recursive functions are counted once per stack
+        for label in set(stack):
+            total_samples[label] = total_samples.get(label, 0) + count
+
+    ranked = sorted(total_samples, key=lambda label: (-self_samples.get(label, 0), -total_samples[label], label))
+
+    return [
+        {
+            'function': label,
+            'self': self_samples.get(label, 0),
+            'self_percent': round(100 * self_samples.get(label, 0) / samples, 1) if samples else 0,
+            'total': total_samples[label],
+            'total_percent': round(100 * total_samples[label] / samples, 1) if samples else 0
+        }
+        for label in ranked[:limit]
+    ]
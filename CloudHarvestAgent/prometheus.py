@@ -0,0 +1,574 @@
+"""
+Prometheus metrics for the CloudHarvestAgent, served in the text exposition format by the `/metrics` endpoint without a
+client library.
+
+Metrics are recorded on hot paths such as every Redis command, so counters and histograms never take a lock to record a
+value. Each thread writes to its own shard, created the first time the thread records a value, and a scrape sums the
+shards. The shards of threads which have exited are folded into a single retired shard at the next scrape so agents
+which start many short-lived threads do not accumulate them.
+
+Gauges which describe the current state of the agent, such as the number of threads, are set by collectors which run at
+the start of every scrape.
+"""
+
+from bisect import bisect_left
+from logging import getLogger
+from threading import Lock, current_thread, enumerate as enumerate_threads, local
+from time import perf_counter
+
+logger = getLogger('harvest')
+
+# The content type of the text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+REDIS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+QUEUE_WAIT_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, 14400)
+CHAIN_DURATION_BUCKETS = (1, 5, 10, 30, 60, 300, 900, 1800, 3600, 7200, 14400)
+
+
+def escape_label_value(value) -> str:
+    """
+    Escapes a label value for the text exposition format.
+
+    Arguments
+    value: The label value, which is converted to a string.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: float) -> str:
+    """
+    Formats a sample value for the text exposition format.
+
+    Arguments
+    value (float): The value.
+    """
+    if value == float('inf'):
+        return '+Inf'
+
+    if value == float('-inf'):
+        return '-Inf'
+
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+
+    return repr(value)
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    """
+    Returns the `{name="value",...}` part of a sample, or an empty string when the sample has no labels.
+
+    Arguments
+    names (tuple): The label names.
+    values (tuple): The label values, in the same order.
+    """
+    if not names:
+        return ''
+
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Metric:
+    """
+    The base of all metrics.
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        """
+        Arguments
+        name (str): The name of the metric.
+        documentation (str): The HELP text of the metric.
+        labelnames (tuple, optional): The names of the metric's labels. Values are recorded with one label value per
+            name, in the same order.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> list:
+        """
+        Returns the samples of the metric as a list of (suffix, label names, label values, value).
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        Returns the metric in the text exposition format.
+        """
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type}'
+        ]
+
+        for suffix, names, values, value in self.samples():
+            lines.append(f'{self.name}{suffix}{format_labels(names, values)} {format_value(value)}')
+
+        return '\n'.join(lines)
+
+
+class ShardedMetric(Metric):
+    """
+    A metric whose values are recorded in per-thread shards of `{label values: value}`.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+
+        self._local = local()
+        self._lock = Lock()             # Guards the list of shards, not the values in them
+        self._shards = []               # [(thread, shard)]
+        self._retired = {}              # The merged shards of threads which have exited
+
+    def _shard(self) -> dict:
+        """
+        Returns the calling thread's shard, creating it on the thread's first use.
+        """
+        try:
+            return self._local.shard
+
+        except AttributeError:
+            shard = self._local.shard = {}
+
+            with self._lock:
+                self._shards.append((current_thread(), shard))
+
+            return shard
+
+    @staticmethod
+    def _merge(into: dict, shard: dict):
+        raise NotImplementedError
+
+    def _collect(self) -> dict:
+        """
+        Returns the sum of every shard, retiring the shards of threads which have exited.
+        """
+        with self._lock:
+            live = []
+
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+
+                else:
+                    self._merge(self._retired, shard)
+
+            self._shards = live
+
+            total = {}
+            self._merge(total, self._retired)
+
+            for thread, shard in live:
+                # Copying a dict is atomic, so the owning thread may keep recording while it is read
+                self._merge(total, dict(shard))
+
+        return total
+
+
+class Counter(ShardedMetric):
+    """
+    A value which only increases, such as the number of claimed tasks. Counter names end in `_total`, which is added
+    when missing, so the HELP, TYPE, and sample lines all use the same name.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name if name.endswith('_total') else f'{name}_total', documentation, labelnames)
+
+    def inc(self, *labels, amount: float = 1):
+        """
+        Increases the counter.
+
+        Arguments
+        labels: One value per label name.
+        amount (float, optional): The amount to add.
+        """
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    @staticmethod
+    def _merge(into: dict, shard: dict):
+        for labels, value in shard.items():
+            into[labels] = into.get(labels, 0) + value
+
+    def samples(self) -> list:
+        return [
+            ('', self.labelnames, labels, value)
+            for labels, value in sorted(self._collect().items())
+        ]
+
+
+class Histogram(ShardedMetric):
+    """
+    Counts observations, such as latencies, in buckets.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        """
+        Arguments
+        name (str): The name of the metric.
+        documentation (str): The HELP text of the metric.
+        labelnames (tuple, optional): The names of the metric's labels.
+        buckets (tuple, optional): The upper bounds of the buckets, in increasing order. `+Inf` is added.
+        """
+        super().__init__(name, documentation, labelnames)
+
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        """
+        Records an observation.
+
+        Arguments
+        value (float): The observed value.
+        labels: One value per label name.
+        """
+        shard = self._shard()
+        counts = shard.get(labels)
+
+        if counts is None:
+            # One count per bucket and +Inf, followed by the sum and count of the observations
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    @staticmethod
+    def _merge(into: dict, shard: dict):
+        for labels, counts in shard.items():
+            # Copy the counts, which the owning thread may still be updating
+            counts = list(counts)
+            merged = into.get(labels)
+
+            if merged is None:
+                into[labels] = counts
+
+            else:
+                into[labels] = [a + b for a, b in zip(merged, counts)]
+
+    def samples(self) -> list:
+        result = []
+        bucket_names = self.labelnames + ('le',)
+
+        for labels, counts in sorted(self._collect().items()):
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                result.append(('_bucket', bucket_names, labels + (format_value(float(bound)),), cumulative))
+
+            result.append(('_sum', self.labelnames, labels, counts[-2]))
+            result.append(('_count', self.labelnames, labels, counts[-1]))
+
+        return result
+
+
+class Gauge(Metric):
+    """
+    A value which may go up and down, such as the number of running TaskChains. Setting a value is a single dict
+    assignment, which is atomic.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+
+        self._values = {}
+
+    def set(self, value: float, *labels):
+        """
+        Sets the gauge.
+
+        Arguments
+        value (float): The value.
+        labels: One value per label name.
+        """
+        self._values[labels] = value
+
+    def replace(self, values: dict):
+        """
+        Replaces every value of the gauge, removing label sets which are not in `values`.
+
+        Arguments
+        values (dict): `{(label values): value}`
+        """
+        self._values = dict(values)
+
+    def samples(self) -> list:
+        return [
+            ('', self.labelnames, labels, value)
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class MetricsRegistry:
+    """
+    Holds the agent's metrics and the collectors which update its gauges.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Adds a metric, replacing any metric of the same name.
+
+        Arguments
+        metric (Metric): The metric.
+
+        Returns
+        The metric.
+        """
+        self._metrics[metric.name] = metric
+
+        return metric
+
+    def add_collector(self, name: str, collector):
+        """
+        Adds a function which is called at the start of every scrape, replacing any collector of the same name.
+
+        Arguments
+        name (str): Identifies the collector.
+        collector (callable): Called without arguments; typically sets gauges.
+        """
+        self._collectors[name] = collector
+
+    def remove_collector(self, name: str):
+        """
+        Removes a collector.
+
+        Arguments
+        name (str): Identifies the collector.
+        """
+        self._collectors.pop(name, None)
+
+    def render(self) -> str:
+        """
+        Runs the collectors and returns every metric in the text exposition format.
+        """
+        for name, collector in list(self._collectors.items()):
+            try:
+                collector()
+
+            except Exception as e:
+                logger.error(f'metrics: the {name} collector failed: {e.args}')
+
+        return '\n'.join(metric.render() for name, metric in sorted(self._metrics.items())) + '\n'
+
+
+# The agent's metrics
+registry = MetricsRegistry()
+
+TASKS_CLAIMED = registry.register(Counter(
+    'harvest_tasks_claimed_total', 'Tasks claimed from the task queues.', ('queue',)
+))
+
+QUEUE_WAIT_SECONDS = registry.register(Histogram(
+    'harvest_queue_wait_seconds', 'Time between a task being enqueued and claimed.', ('queue',),
+    buckets=QUEUE_WAIT_BUCKETS
+))
+
+CHAIN_DURATION_SECONDS = registry.register(Histogram(
+    'harvest_chain_duration_seconds', 'Time TaskChains spent running.', ('template',),
+    buckets=CHAIN_DURATION_BUCKETS
+))
+
+CHAINS_FINISHED = registry.register(Counter(
+    'harvest_chains_finished_total', 'TaskChains which left the queue, by final status.', ('template', 'status')
+))
+
+REDIS_COMMAND_SECONDS = registry.register(Histogram(
+    'harvest_redis_command_seconds', 'Latency of Redis commands and pipelines. Blocking commands include their wait.',
+    ('silo', 'command'), buckets=REDIS_BUCKETS
+))
+
+REDIS_COMMAND_ERRORS = registry.register(Counter(
+    'harvest_redis_command_errors_total', 'Redis commands and pipelines which raised an error.', ('silo', 'command')
+))
+
+API_REQUEST_SECONDS = registry.register(Histogram(
+    'harvest_api_request_seconds', 'Latency of requests to the Harvest API by route, including retries.', ('endpoint',)
+))
+
+API_REQUEST_ERRORS = registry.register(Counter(
+    'harvest_api_request_errors_total', 'Requests to the Harvest API which failed or returned a server error.',
+    ('endpoint',)
+))
+
+HEARTBEAT_LAG_SECONDS = registry.register(Gauge(
+    'harvest_heartbeat_lag_seconds', 'How long the next heartbeat is overdue.'
+))
+
+HEARTBEAT_LAST_SUCCESS = registry.register(Gauge(
+    'harvest_heartbeat_last_success_timestamp_seconds', 'When the most recent heartbeat was written.'
+))
+
+RUNNING_CHAINS = registry.register(Gauge(
+    'harvest_running_chains', 'TaskChains running in the queue.'
+))
+
+CONCURRENCY_LIMIT = registry.register(Gauge(
+    'harvest_concurrency_limit', 'TaskChains the queue currently admits.'
+))
+
+MAX_CHAINS = registry.register(Gauge(
+    'harvest_max_chains', 'The most TaskChains the queue may run at once.'
+))
+
+THREADS = registry.register(Gauge(
+    'harvest_threads', 'Running threads, grouped by name with numeric suffixes removed.', ('group',)
+))
+
+
+def thread_group(name: str) -> str:
+    """
+    Returns the group of a thread, which is its name without numeric suffixes, such as `ThreadPoolExecutor` for
+    `ThreadPoolExecutor-0_3`.
+
+    Arguments
+    name (str): The name of the thread.
+    """
+    import re
+
+    return re.sub(r'[-_]\d+', '', name)
+
+
+def collect_threads():
+    """
+    Sets the `harvest_threads` gauge.
+    """
+    groups = {}
+
+    for thread in enumerate_threads():
+        group = thread_group(thread.name)
+        groups[(group,)] = groups.get((group,), 0) + 1
+
+    THREADS.replace(groups)
+
+
+registry.add_collector('threads', collect_threads)
+
+
+def command_name(args: tuple) -> str:
+    """
+    Returns the name of a Redis command from the arguments of `execute_command()`.
+
+    Arguments
+    args (tuple): The command and its arguments.
+    """
+    if not args:
+        return 'UNKNOWN'
+
+    name = args[0]
+
+    if isinstance(name, bytes):
+        name = name.decode(errors='replace')
+
+    return str(name).upper()
+
+
+def instrument_redis(client, silo: str):
+    """
+    Records the latency of every command and pipeline sent through a Redis client. Clients are instrumented once; later
+    calls return without changes. Both `redis.Redis` and `redis.asyncio.Redis` clients are supported.
+
+    Arguments
+    client: The Redis client.
+    silo (str): The name of the silo the client connects to, such as `harvest-tasks`.
+
+    Returns
+    The client.
+    """
+    from inspect import iscoroutinefunction
+
+    if getattr(client, '_harvest_instrumented', False):
+        return client
+
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def record(command: str, start: float, failed: bool):
+        REDIS_COMMAND_SECONDS.observe(perf_counter() - start, silo, command)
+
+        if failed:
+            REDIS_COMMAND_ERRORS.inc(silo, command)
+
+    if iscoroutinefunction(execute_command):
+        async def instrumented_execute_command(*args, **options):
+            start = perf_counter()
+            failed = True
+
+            try:
+                result = await execute_command(*args, **options)
+                failed = False
+
+                return result
+
+            finally:
+                record(command_name(args), start, failed)
+
+    else:
+        def instrumented_execute_command(*args, **options):
+            start = perf_counter()
+            failed = True
+
+            try:
+                result = execute_command(*args, **options)
+                failed = False
+
+                return result
+
+            finally:
+                record(command_name(args), start, failed)
+
+    def instrumented_pipeline(*args, **kwargs):
+        redis_pipeline = pipeline(*args, **kwargs)
+        execute = redis_pipeline.execute
+
+        if iscoroutinefunction(execute):
+            async def instrumented_execute(*execute_args, **execute_kwargs):
+                start = perf_counter()
+                failed = True
+
+                try:
+                    result = await execute(*execute_args, **execute_kwargs)
+                    failed = False
+
+                    return result
+
+                finally:
+                    record('PIPELINE', start, failed)
+
+        else:
+            def instrumented_execute(*execute_args, **execute_kwargs):
+                start = perf_counter()
+                failed = True
+
+                try:
+                    result = execute(*execute_args, **execute_kwargs)
+                    failed = False
+
+                    return result
+
+                finally:
+                    record('PIPELINE', start, failed)
+
+        redis_pipeline.execute = instrumented_execute
+
+        return redis_pipeline
+
+    client.execute_command = instrumented_execute_command
+    client.pipeline = instrumented_pipeline
+    client._harvest_instrumented = True
+
+    return client
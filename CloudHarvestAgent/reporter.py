@@ -0,0 +1,242 @@
+"""
+A central reporter which writes the status and progress of a queue's TaskChains to their task hashes. Updates are
+collected from the queue and from the running TaskChains, repeated updates to the same field are coalesced, and all
+pending updates are written in a single Redis pipeline every `chain_progress_reporting_interval_seconds`. Redis writes
+therefore grow with the number of agents rather than with the number of TaskChains and updates.
+
+Urgent updates, such as errors and termination requests, wake the reporter so they are written immediately, along with
+anything else which is pending.
+"""
+
+from logging import getLogger
+from threading import Event, Lock, Thread
+
+logger = getLogger('harvest')
+
+
+class StatusReporter:
+    """
+    Coalesces task hash updates and writes them to Redis in batches.
+    """
+
+    def __init__(self, client, interval_seconds: float = 60, collect=None):
+        """
+        Arguments
+        client (StrictRedis): A client of the `harvest-tasks` silo.
+        interval_seconds (float, optional): How often pending updates are written.
+        collect (callable, optional): Returns the current fields of every running TaskChain as
+            `{redis_name: {field: value}}`. Only fields which changed since they were last reported are written.
+        """
+        self.client = client
+        self.interval_seconds = interval_seconds
+        self.collect = collect
+
+        self.flushes = 0
+        self.fields_written = 0
+        self.updates = 0
+        self.coalesced = 0
+
+        self._pending = {}          # {redis_name: {field: value}}
+        self._reported = {}         # {redis_name: {field: value}} as last written, for tracked tasks only
+        self._tracked = set()       # The tasks whose running TaskChains are collected
+        self._lock = Lock()
+        self._urgent = Event()
+        self._running = False
+        self._thread = None
+
+    def update(self, redis_name: str, urgent: bool = False, **fields):
+        """
+        Queues fields to be written to a task hash. A later update to the same field replaces an earlier one which has
+        not been written yet.
+
+        Arguments
+        redis_name (str): The Redis name of the task.
+        urgent (bool, optional): Write the pending updates now rather than at the end of the interval.
+        fields: The fields to write.
+        """
+        with self._lock:
+            pending = self._pending.setdefault(redis_name, {})
+
+            for field, value in fields.items():
+                self.updates += 1
+
+                if field in pending:
+                    self.coalesced += 1
+
+                pending[field] = value
+
+        if urgent:
+            if self._running:
+                self._urgent.set()
+
+            else:
+                self.flush()
+
+    def track(self, redis_name: str):
+        """
+        Starts collecting the fields of a running TaskChain. Collected fields are only kept for tracked tasks, so a
+        collection which was running while a task was discarded cannot queue stale fields for it.
+
+        Arguments
+        redis_name (str): The Redis name of the task.
+        """
+        with self._lock:
+            self._tracked.add(redis_name)
+
+    def discard(self, redis_name: str):
+        """
+        Drops the pending updates of a task and stops tracking it. Called before a TaskChain reports its own final
+        status so the final status cannot be overwritten by an older update. Waits for a flush which is in progress.
+
+        Arguments
+        redis_name (str): The Redis name of the task.
+        """
+        with self._lock:
+            self._tracked.discard(redis_name)
+            self._pending.pop(redis_name, None)
+            self._reported.pop(redis_name, None)
+
+    def finish(self, redis_name: str, **fields):
+        """
+        Writes the final fields of a task right away and forgets the task. Pending updates of the task are dropped
+        because they are older than its final status.
+
+        Arguments
+        redis_name (str): The Redis name of the task.
+        fields: The fields to write.
+        """
+        with self._lock:
+            self._tracked.discard(redis_name)
+            self._pending.pop(redis_name, None)
+            self._reported.pop(redis_name, None)
+
+            if not fields:
+                return
+
+            try:
+                self.client.hset(redis_name, mapping=fields)
+
+            except Exception as e:
+                logger.error(f'reporter: could not write the final fields of {redis_name}: {e.args}')
+                return
+
+            self.updates += len(fields)
+            self.fields_written += len(fields)
+
+    def _collect(self):
+        if self.collect is None:
+            return
+
+        try:
+            current = self.collect()
+
+        except Exception as e:
+            logger.error(f'reporter: could not collect TaskChain progress: {e.args}')
+            return
+
+        with self._lock:
+            for redis_name, fields in current.items():
+                # The task was discarded while its fields were being collected
+                if redis_name not in self._tracked:
+                    continue
+
+                reported = self._reported.get(redis_name, {})
+
+                changed = {
+                    field: value
+                    for field, value in fields.items()
+                    if reported.get(field) != value
+                }
+
+                if changed:
+                    self._pending.setdefault(redis_name, {}).update(changed)
+
+    def flush(self) -> int:
+        """
+        Writes every pending update in a single pipeline.
+
+        Returns
+        The number of fields written.
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+
+            pending, self._pending = self._pending, {}
+
+            try:
+                with self.client.pipeline(transaction=False) as pipeline:
+                    for redis_name, fields in pending.items():
+                        pipeline.hset(redis_name, mapping=fields)
+
+                    pipeline.execute()
+
+            except Exception as e:
+                logger.error(f'reporter: could not write {len(pending)} task updates: {e.args}')
+
+                # Keep the updates for the next flush
+                self._pending = pending
+
+                return 0
+
+            written = 0
+            for redis_name, fields in pending.items():
+                if redis_name in self._tracked:
+                    self._reported.setdefault(redis_name, {}).update(fields)
+
+                written += len(fields)
+
+            self.flushes += 1
+            self.fields_written += written
+
+        return written
+
+    def _run(self):
+        while self._running:
+            self._urgent.wait(timeout=self.interval_seconds)
+            self._urgent.clear()
+
+            if not self._running:
+                break
+
+            self._collect()
+            self.flush()
+
+    def start(self) -> 'StatusReporter':
+        """
+        Starts the reporter thread.
+        """
+        if self._thread and self._thread.is_alive():
+            return self
+
+        self._running = True
+        self._thread = Thread(target=self._run, name='status-reporter', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stops the reporter thread and writes any pending updates.
+        """
+        self._running = False
+        self._urgent.set()
+
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+
+        self.flush()
+
+    def stats(self) -> dict:
+        """
+        Returns the reporter's update and write counters.
+        """
+        with self._lock:
+            return {
+                'coalesced': self.coalesced,
+                'fields_written': self.fields_written,
+                'flushes': self.flushes,
+                'pending_tasks': len(self._pending),
+                'tracked_tasks': len(self._tracked),
+                'updates': self.updates
+            }
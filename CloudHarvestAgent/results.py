@@ -0,0 +1,382 @@
+"""
+Chunked, compressed storage for TaskChain results. Rather than storing a TaskChain's entire result in one field of its
+task hash, a ResultSink serializes records as JSON lines, compresses them with zlib in chunks of at most
+`max_chunk_bytes`, and appends each chunk to the Redis Stream `<task redis name>::results` as soon as it is full. The
+memory held by the agent and the size of each Redis write are therefore bounded by the chunk size, however large the
+result.
+
+When the sink is closed, a manifest with the number of chunks and records, the raw and compressed sizes, and a SHA-256
+checksum of the uncompressed data is written to the `result_manifest` field of the task hash. Readers page through the
+stream with `read_result_page()` or `iter_results()`.
+
+Every TaskChain built by the agent is handed a sink as `task_chain.result_sink`; the sink is closed when the TaskChain
+finishes. TaskChains may write their records to the sink as they produce them. Otherwise, a result whose JSON is larger
+than `agent.results.inline_max_bytes` is moved into the sink by `spill_result()` once the TaskChain has run, and the
+TaskChain's `result` is replaced with a small reference to the stream before the TaskChain reports it.
+"""
+
+from logging import getLogger
+from threading import Lock
+from weakref import WeakKeyDictionary
+
+import json
+
+logger = getLogger('harvest')
+
+RESULT_STREAM_SUFFIX = '::results'
+RESULT_MANIFEST_FIELD = 'result_manifest'
+
+# The largest result, as JSON, which is left in the `result` field of the task hash
+DEFAULT_INLINE_MAX_BYTES = 65536
+
+# Binary clients for result streams, keyed by the connection pool of the silo client they were derived from. A client
+# is dropped along with its pool.
+_binary_clients = WeakKeyDictionary()
+_binary_clients_lock = Lock()
+
+
+def result_stream_name(redis_name: str) -> str:
+    """
+    Returns the name of the Redis Stream which holds a task's result chunks.
+
+    Arguments
+    redis_name (str): The Redis name of the task.
+    """
+    return f'{redis_name}{RESULT_STREAM_SUFFIX}'
+
+
+def binary_client(client):
+    """
+    Returns a client connected to the same server as `client` which does not decode responses, as compressed chunks
+    are not valid text.
+
+    Arguments
+    client (StrictRedis): A silo client.
+    """
+    from redis import ConnectionPool, StrictRedis
+
+    pool = client.connection_pool
+
+    if not pool.connection_kwargs.get('decode_responses'):
+        return client
+
+    with _binary_clients_lock:
+        if pool not in _binary_clients:
+            _binary_clients[pool] = StrictRedis(connection_pool=ConnectionPool(
+                connection_class=pool.connection_class,
+                **pool.connection_kwargs | {'decode_responses': False}
+            ))
+
+        return _binary_clients[pool]
+
+
+class ResultSink:
+    """
+    Writes a TaskChain's result records to Redis as compressed, size-bounded chunks.
+    """
+
+    def __init__(self, client, redis_name: str, max_chunk_bytes: int = 1048576, compression_level: int = 6):
+        """
+        Arguments
+        client (StrictRedis): A client of the `harvest-tasks` silo.
+        redis_name (str): The Redis name of the task.
+        max_chunk_bytes (int, optional): The maximum size of a chunk before compression. Defaults to 1 MiB.
+        compression_level (int, optional): The zlib compression level, from 0 (none) to 9 (smallest). Defaults to 6.
+        """
+        from hashlib import sha256
+
+        self.client = client
+        self.redis_name = redis_name
+        self.stream_name = result_stream_name(redis_name)
+        self.max_chunk_bytes = max_chunk_bytes
+        self.compression_level = compression_level
+
+        self.chunks = 0
+        self.records = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.closed = False
+
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_records = 0
+        self._checksum = sha256()
+        self._lock = Lock()
+
+    def write(self, record):
+        """
+        Adds a record to the result. A chunk is written to Redis whenever the buffered records reach `max_chunk_bytes`.
+
+        Arguments
+        record: Any JSON serializable value.
+        """
+        self._write_line(json.dumps(record, default=str).encode('utf-8') + b'\n')
+
+    def _write_line(self, line: bytes):
+        """
+        Adds a record which is already serialized as a JSON line to the result.
+
+        Arguments
+        line (bytes): The record's JSON, followed by a newline.
+        """
+        with self._lock:
+            if self.closed:
+                raise ValueError(f'The result sink for {self.redis_name} is closed.')
+
+            self._buffer.append(line)
+            self._buffer_bytes += len(line)
+            self._buffer_records += 1
+
+            if self._buffer_bytes >= self.max_chunk_bytes:
+                self._flush()
+
+    def write_many(self, records):
+        """
+        Adds each record of an iterable to the result.
+
+        Arguments
+        records (iterable): JSON serializable values.
+        """
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        """
+        Writes the buffered records to Redis as a chunk.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        from zlib import compress
+
+        if not self._buffer:
+            return
+
+        payload = b''.join(self._buffer)
+        compressed = compress(payload, self.compression_level)
+
+        with self.client.pipeline(transaction=False) as pipeline:
+            # Discard the chunks of a previous attempt at this task
+            if not self.chunks:
+                pipeline.delete(self.stream_name)
+
+            pipeline.xadd(self.stream_name, fields={
+                'seq': self.chunks,
+                'records': self._buffer_records,
+                'bytes': len(payload),
+                'data': compressed
+            })
+            pipeline.execute()
+
+        self._checksum.update(payload)
+        self.chunks += 1
+        self.records += self._buffer_records
+        self.raw_bytes += len(payload)
+        self.compressed_bytes += len(compressed)
+
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_records = 0
+
+    def manifest(self) -> dict:
+        """
+        Returns the manifest describing the chunks written so far.
+        """
+        return {
+            'bytes': self.raw_bytes,
+            'checksum': f'sha256:{self._checksum.hexdigest()}',
+            'chunks': self.chunks,
+            'complete': self.closed,
+            'compressed_bytes': self.compressed_bytes,
+            'compression': 'zlib',
+            'compression_level': self.compression_level,
+            'format': 'jsonl',
+            'records': self.records,
+            'stream': self.stream_name
+        }
+
+    def close(self) -> dict or None:
+        """
+        Writes any buffered records and the manifest. The result stream expires along with the task hash. Sinks which
+        were never written to leave Redis untouched.
+
+        Returns
+        The manifest, or None if nothing was written.
+        """
+        with self._lock:
+            if self.closed:
+                return self.manifest() if self.chunks else None
+
+            self._flush()
+            self.closed = True
+
+            if not self.chunks:
+                return None
+
+            manifest = self.manifest()
+
+            ttl = self.client.ttl(self.redis_name)
+
+            with self.client.pipeline(transaction=False) as pipeline:
+                pipeline.hset(self.redis_name, key=RESULT_MANIFEST_FIELD, value=json.dumps(manifest))
+
+                if ttl and ttl > 0:
+                    pipeline.expire(self.stream_name, ttl)
+
+                pipeline.execute()
+
+        logger.debug(f'{self.redis_name}: wrote {manifest["records"]} result records in {manifest["chunks"]} chunks '
+                     f'({manifest["bytes"]} bytes, {manifest["compressed_bytes"]} compressed)')
+
+        return manifest
+
+
+def spill_result(task_chain, inline_max_bytes: int = DEFAULT_INLINE_MAX_BYTES) -> bool:
+    """
+    Moves the result of a TaskChain which has run into its result sink when its records are larger than
+    `inline_max_bytes` as JSON. The records are the result's `data` when it is a list, the result itself when it is a
+    list, or otherwise the result as a single record. The TaskChain's `result` is replaced with a reference to the
+    stream: the result's other keys, with `data` set to None and the stream name in `result_stream`. The sink is left
+    open; the manifest is written when it is closed.
+
+    Records are serialized one at a time and measuring stops once `inline_max_bytes` is exceeded, so at most
+    `inline_max_bytes` and one record are held as JSON at once. The serialized records are written to the sink as they
+    are.
+
+    Results of TaskChains which wrote records to the sink themselves are left as they are.
+
+    Arguments
+    task_chain (BaseTaskChain): The TaskChain which has run.
+    inline_max_bytes (int, optional): The largest result which is left in place.
+
+    Returns
+    True if the result was moved into the sink.
+    """
+    result_sink = getattr(task_chain, 'result_sink', None)
+    result = getattr(task_chain, 'result', None)
+
+    if result_sink is None or result is None or result_sink.records or result_sink._buffer_records:
+        return False
+
+    if isinstance(result, dict) and isinstance(result.get('data'), list):
+        records, reference = result['data'], {key: value for key, value in result.items() if key != 'data'}
+
+    elif isinstance(result, list):
+        records, reference = result, {}
+
+    else:
+        records, reference = [result], {}
+
+    records = iter(records)
+    lines = []
+    size = 0
+
+    for record in records:
+        lines.append(json.dumps(record, default=str).encode('utf-8') + b'\n')
+        size += len(lines[-1])
+
+        if size > inline_max_bytes:
+            break
+
+    else:
+        # Every record was measured without exceeding the threshold
+        return False
+
+    for line in lines:
+        result_sink._write_line(line)
+
+    del lines
+
+    result_sink.write_many(records)
+    result_sink.flush()
+
+    task_chain.result = reference | {'data': None, 'result_stream': result_sink.stream_name}
+
+    logger.debug(f'{result_sink.redis_name}: moved {result_sink.records} result records ({result_sink.raw_bytes} bytes) '
+                 f'into {result_sink.stream_name}')
+
+    return True
+
+
+def read_result_manifest(client, redis_name: str) -> dict or None:
+    """
+    Returns the result manifest of a task, or None if the task has no chunked result.
+
+    Arguments
+    client (StrictRedis): A client of the `harvest-tasks` silo.
+    redis_name (str): The Redis name of the task.
+    """
+    manifest = client.hget(redis_name, RESULT_MANIFEST_FIELD)
+
+    return json.loads(manifest) if manifest else None
+
+
+def read_result_page(client, redis_name: str, cursor: str = None, chunks: int = 1) -> tuple:
+    """
+    Reads the next chunks of a task's result.
+
+    Arguments
+    client (StrictRedis): A client of the `harvest-tasks` silo.
+    redis_name (str): The Redis name of the task.
+    cursor (str, optional): The cursor returned by the previous page. Omit to read from the first chunk.
+    chunks (int, optional): The number of chunks to read. Defaults to 1.
+
+    Returns
+    A tuple of the page's records and the cursor of the next page, which is None after the last page.
+    """
+    from zlib import decompress
+
+    client = binary_client(client)
+    entries = client.xrange(result_stream_name(redis_name),
+                            min=f'({cursor}' if cursor else '-',
+                            max='+',
+                            count=chunks)
+
+    records = [
+        json.loads(line)
+        for entry_id, fields in entries
+        for line in decompress(fields[b'data']).splitlines()
+    ]
+
+    next_cursor = entries[-1][0].decode() if len(entries) == chunks else None
+
+    return records, next_cursor
+
+
+def iter_results(client, redis_name: str, chunks_per_page: int = 16):
+    """
+    Yields every record of a task's result, reading `chunks_per_page` chunks at a time, and verifies the result's
+    checksum once every chunk has been read.
+
+    Arguments
+    client (StrictRedis): A client of the `harvest-tasks` silo.
+    redis_name (str): The Redis name of the task.
+    chunks_per_page (int, optional): The number of chunks read from Redis at a time.
+    """
+    from hashlib import sha256
+    from zlib import decompress
+
+    manifest = read_result_manifest(client, redis_name)
+    client = binary_client(client)
+    stream_name = result_stream_name(redis_name)
+    checksum = sha256()
+    cursor = '-'
+
+    while True:
+        entries = client.xrange(stream_name, min=cursor, max='+', count=chunks_per_page)
+
+        for entry_id, fields in entries:
+            payload = decompress(fields[b'data'])
+            checksum.update(payload)
+
+            for line in payload.splitlines():
+                yield json.loads(line)
+
+        if len(entries) < chunks_per_page:
+            break
+
+        cursor = f'({entries[-1][0].decode()}'
+
+    if manifest and manifest['checksum'] != f'sha256:{checksum.hexdigest()}':
+        raise ValueError(f'The result of {redis_name} does not match its manifest checksum.')
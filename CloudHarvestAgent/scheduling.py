@@ -0,0 +1,242 @@
+"""
+Pickup schedulers decide how many tasks the TaskChainQueue claims from each of its queues when slots are free. The
+scheduler is selected by `agent.tasks.pickup_scheduler.name` and receives the remaining keys of that block as keyword
+arguments.
+
+`strict` (default) drains the queues in priority order, so a burst of priority 0 tasks delays every priority 2 task
+until it has been worked through. `weighted_fair` shares the agent's slots between priorities in proportion to their
+weights, boosts priorities whose oldest task has waited longest, and can reserve slots for a priority.
+
+Other schedulers may be configured by their import path, such as `my_package.scheduling.MyScheduler`, and must subclass
+PickupScheduler.
+"""
+
+from logging import getLogger
+
+logger = getLogger('harvest')
+
+
+def queue_priority(queue_name: str) -> int or None:
+    """
+    Returns the priority of a queue, account queue, or processing list, such as 2 for `queue::2::aws:123456789`.
+
+    Arguments
+    queue_name (str): The name of the queue.
+    """
+    try:
+        return int(queue_name.split('::')[1])
+
+    except (IndexError, ValueError):
+        return None
+
+
+class PickupScheduler:
+    """
+    The base pickup scheduler, which claims from the queues in priority order.
+    """
+
+    name = 'strict'
+
+    # When True, `plan()` receives the length and oldest task of each queue, which costs an additional round trip
+    needs_queue_state = False
+
+    def __init__(self, **kwargs):
+        pass
+
+    def plan(self, count: int, queue_names: list, running: dict, max_chains: int, queue_state: dict = None) -> list:
+        """
+        Returns the number of tasks to claim from each queue.
+
+        Arguments
+        count (int): The number of free slots.
+        queue_names (list): The queues this agent reads, in priority order.
+        running (dict): The number of running TaskChains by priority.
+        max_chains (int): The number of slots of the agent.
+        queue_state (dict, optional): `{queue name: {'length': int, 'oldest_wait_seconds': float or None}}`, when
+            `needs_queue_state` is True.
+
+        Returns
+        A list of (queue name, maximum tasks to claim) for every queue in `queue_names`, in the order they are read.
+        The total number of tasks claimed never exceeds `count`.
+        """
+        return [(queue_name, count) for queue_name in queue_names]
+
+    def waiting_plan(self, count: int, queue_names: list, running: dict, max_chains: int, queue_state: dict = None) -> list:
+        """
+        Returns the number of tasks to claim from each queue when a task arrives while the agent waits on the queues.
+        Each queue is planned as if it held `count` tasks, and each queue of a priority may take all of that priority's
+        slots because the queues were empty when the wait began. Queues with a quota of 0 are not waited on.
+
+        Arguments
+        count (int): The number of free slots.
+        queue_names (list): The queues this agent reads, in priority order.
+        running (dict): The number of running TaskChains by priority.
+        max_chains (int): The number of slots of the agent.
+        queue_state (dict, optional): The queue state, when `needs_queue_state` is True.
+
+        Returns
+        A list of (queue name, maximum tasks to claim) for every queue in `queue_names`, in the order they are read.
+        """
+        waiting_state = {
+            queue_name: {**((queue_state or {}).get(queue_name) or {}), 'length': count}
+            for queue_name in queue_names
+        }
+
+        plan = self.plan(count=count, queue_names=queue_names, running=running, max_chains=max_chains,
+                         queue_state=waiting_state)
+
+        slots = {}
+        for queue_name, quota in plan:
+            slots[queue_priority(queue_name)] = max(slots.get(queue_priority(queue_name), 0), quota)
+
+        return [(queue_name, slots[queue_priority(queue_name)]) for queue_name, quota in plan]
+
+    def stats(self) -> dict:
+        """
+        Returns the scheduler's configuration and state for the queue status.
+        """
+        return {'name': self.name}
+
+
+class WeightedFairScheduler(PickupScheduler):
+    """
+    Shares slots between priorities in proportion to their weights. A priority's share grows with the time its oldest
+    task has waited, by one weight every `aging_seconds`, so no priority can be starved. Slots reserved for a priority
+    are only used by that priority, even while its queues are empty.
+    """
+
+    name = 'weighted_fair'
+    needs_queue_state = True
+
+    def __init__(self, weights: dict = None, aging_seconds: float = 300, reservations: dict = None, **kwargs):
+        """
+        Arguments
+        weights (dict, optional): `{priority: weight}`. Priorities without a weight have a weight of 1.
+        aging_seconds (float, optional): The wait which adds one weight to a priority's share, so the share is
+            `weight * (1 + oldest wait / aging_seconds)`: double after one `aging_seconds`, triple after two. 0 disables
+            aging.
+        reservations (dict, optional): `{priority: slots}` reserved for a priority within `max_chains`.
+        """
+        super().__init__(**kwargs)
+
+        self.weights = {int(priority): float(weight) for priority, weight in (weights or {}).items()}
+        self.aging_seconds = aging_seconds
+        self.reservations = {int(priority): int(slots) for priority, slots in (reservations or {}).items()}
+
+        # The shares used by the most recent plan, for the queue status
+        self.last_shares = {}
+
+    def share(self, priority: int, oldest_wait_seconds: float = None) -> float:
+        """
+        Returns the share of a priority whose oldest task has waited `oldest_wait_seconds`.
+
+        Arguments
+        priority (int): The priority.
+        oldest_wait_seconds (float, optional): How long the oldest task of the priority has waited.
+        """
+        weight = self.weights.get(priority, 1.0)
+
+        if self.aging_seconds and oldest_wait_seconds:
+            weight *= 1 + oldest_wait_seconds / self.aging_seconds
+
+        return weight
+
+    def plan(self, count: int, queue_names: list, running: dict, max_chains: int, queue_state: dict = None) -> list:
+        queue_state = queue_state or {}
+
+        # Group the queues by priority, keeping their order
+        queues_by_priority = {}
+        for queue_name in queue_names:
+            queues_by_priority.setdefault(queue_priority(queue_name), []).append(queue_name)
+
+        backlog = {}
+        shares = {}
+        for priority, priority_queues in queues_by_priority.items():
+            states = [queue_state.get(queue_name) or {} for queue_name in priority_queues]
+
+            backlog[priority] = sum(state.get('length') or 0 for state in states)
+            shares[priority] = self.share(priority, max((state.get('oldest_wait_seconds') or 0 for state in states), default=0))
+
+        self.last_shares = shares
+
+        allocated = {priority: 0 for priority in queues_by_priority}
+
+        def idle_reservation(priority: int) -> int:
+            return max(self.reservations.get(priority, 0) - running.get(priority, 0) - allocated[priority], 0)
+
+        # Fill the reservations of priorities with waiting tasks first
+        free = count
+        for priority in queues_by_priority:
+            slots = min(backlog[priority], idle_reservation(priority), free)
+            allocated[priority] += slots
+            free -= slots
+
+        # Give each remaining slot to the priority furthest below its share, keeping slots reserved for others free
+        while free > 0:
+            candidates = [
+                priority
+                for priority in queues_by_priority
+                if backlog[priority] > allocated[priority]
+                and free > sum(idle_reservation(other) for other in queues_by_priority if other != priority)
+            ]
+
+            if not candidates:
+                break
+
+            priority = min(candidates, key=lambda p: ((running.get(p, 0) + allocated[p] + 1) / shares[p], p))
+            allocated[priority] += 1
+            free -= 1
+
+        # Split each priority's slots between its queues in the order they are read
+        result = []
+        for priority, priority_queues in queues_by_priority.items():
+            remaining = allocated[priority]
+
+            for queue_name in priority_queues:
+                quota = min((queue_state.get(queue_name) or {}).get('length') or 0, remaining)
+                remaining -= quota
+                result.append((queue_name, quota))
+
+        return result
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'aging_seconds': self.aging_seconds,
+            'reservations': self.reservations,
+            'shares': {priority: round(share, 3) for priority, share in self.last_shares.items()},
+            'weights': self.weights
+        }
+
+
+# Schedulers which may be selected by name
+PICKUP_SCHEDULERS = {
+    scheduler.name: scheduler
+    for scheduler in (PickupScheduler, WeightedFairScheduler)
+}
+
+
+def get_pickup_scheduler(name: str = None, **kwargs) -> PickupScheduler:
+    """
+    Returns a pickup scheduler.
+
+    Arguments
+    name (str, optional): A name in PICKUP_SCHEDULERS or the import path of a PickupScheduler subclass. Defaults to
+        `strict`.
+    kwargs: The scheduler's configuration.
+    """
+    name = name or PickupScheduler.name
+
+    if name in PICKUP_SCHEDULERS:
+        scheduler_class = PICKUP_SCHEDULERS[name]
+
+    else:
+        from importlib import import_module
+
+        module_name, _, class_name = name.rpartition('.')
+        scheduler_class = getattr(import_module(module_name), class_name)
+
+        if not issubclass(scheduler_class, PickupScheduler):
+            raise TypeError(f'{name} is not a PickupScheduler.')
+
+    return scheduler_class(**kwargs)
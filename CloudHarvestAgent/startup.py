@@ -30,13 +30,14 @@ def flatten_dict_preserve_lists(d, parent_key='', sep='.') -> dict:
     return dict(items)
 
 
-def start_node_heartbeat(config: WalkableDict):
+def start_node_heartbeat(config: WalkableDict, first_heartbeat=None):
     """
     Start the heartbeat process on the harvest-nodes silo. This process will update the node status in the Redis
     cache at regular intervals.
 
     Args:
     config (WalkableDict): The configuration for the node heartbeat process.
+    first_heartbeat (Event, optional): Set once the first heartbeat has been written.
 
     Example:
         >>> # Start the heartbeat process with a 5x expiration multiplier and a check rate of 1 second. The API will be
@@ -67,15 +68,19 @@ def start_node_heartbeat(config: WalkableDict):
     def _thread():
         start_datetime = datetime.now(tz=timezone.utc)
 
+        from CloudHarvestAgent.prometheus import HEARTBEAT_LAG_SECONDS, HEARTBEAT_LAST_SUCCESS, instrument_redis, registry
+
         # Get the Redis client
         silo = get_silo('harvest-nodes')
-        client = silo.connect()     # A StrictRedis instance
+        client = instrument_redis(silo.connect(), 'harvest-nodes')     # A StrictRedis instance
 
         # Get the application metadata
         import tomli
         with open('./pyproject.toml', 'rb') as meta_file:
             app_metadata = tomli.load(meta_file).get('project') or {}
 
+        from CloudHarvestAgent.jobs import agent_capabilities
+        from CloudHarvestAgent.template_catalog import template_catalog
         from CloudHarvestCorePluginManager import Registry
         node_name = platform.node()
         node_role = 'agent'
@@ -89,11 +94,9 @@ def start_node_heartbeat(config: WalkableDict):
             "architecture": f'{platform.machine()}',
             "available_chains": sorted(Registry.find(category='chain', result_key='name', limit=None)),
             "available_tasks": sorted(Registry.find(category='task', result_key='name', limit=None)),
-            "available_templates": sorted([
-                f'{result["category"]}/{result["name"]}'
-                for result in
-                Registry.find(category='template_*', result_key='*', limit=None)
-            ]),
+            "available_templates": template_catalog.identifiers(),
+            "capabilities": agent_capabilities(platforms=config.get('platforms'),
+                                               chain_task_restrictions=config.walk('agent.tasks.chain_task_restrictions')),
             "ip": gethostbyname(getfqdn()),
             "heartbeat_seconds": heartbeat_check_rate,
             "name": node_name,
@@ -102,10 +105,8 @@ def start_node_heartbeat(config: WalkableDict):
             "pid": config.walk('agent.pid'),
             "port": config.walk('agent.connection.port') or 8500,
             "python": platform.python_version(),
-            "queue": Environment.get('queue_object').detailed_status(),
             "role": node_role,
             "start": start_datetime.isoformat(),
-            "status": Environment.get('queue_object').detailed_status(),
             "version": app_metadata.get('version')
         }
 
@@ -130,28 +131,95 @@ def start_node_heartbeat(config: WalkableDict):
 
             return dictionary
 
-        # Record the information to Redis
-        client.hset(node_record_identifier, mapping=format_for_redis(node_info))
+        # The static fields are serialized once and versioned by their content hash. They are only written when the
+        # stored version differs from this one, which covers a new or expired record and a record left by another
+        # build of this node.
+        import json
+        from hashlib import sha256
+        from time import perf_counter
+
+        static_fields = format_for_redis(node_info)
+        static_fields['static_version'] = sha256(json.dumps(static_fields, sort_keys=True).encode()).hexdigest()[:16]
+
+        expiration_seconds = int(expiration_multiplier * heartbeat_check_rate)
+        written_fields = {}     # The dynamic fields as last written to Redis
+        costs = {}              # The serialization and network cost of the previous heartbeat
+        last_written = [perf_counter()]     # When the most recent heartbeat was written
+
+        def collect_heartbeat():
+            # How long the next heartbeat is overdue; grows while heartbeats fail or stall
+            HEARTBEAT_LAG_SECONDS.set(max(perf_counter() - last_written[0] - heartbeat_check_rate, 0))
+
+        registry.add_collector('heartbeat', collect_heartbeat)
 
         while True:
             # Update the last heartbeat time
+            serialize_start = perf_counter()
             last_datetime = datetime.now(tz=timezone.utc)
-            node_info |= {
+            queue_summary = Environment.get('queue_object').queue_summary()
+            api = Environment.get('api_object')
+            dynamic_fields = format_for_redis({
+                'api': api.stats() if api else {},
+                'queue': queue_summary,
+                'status': queue_summary['status'],
                 'last': last_datetime.isoformat(),
                 'duration': (last_datetime - start_datetime).total_seconds()
+            } | costs | {
+                key: value
+                for key, value in Environment.get('queue_object').metrics.latest.items()
+                if key != 'timestamp'
+            })
+
+            # Only write the fields which changed since the last heartbeat
+            changed_fields = {
+                key: value
+                for key, value in dynamic_fields.items()
+                if written_fields.get(key) != value
             }
+            serialize_seconds = perf_counter() - serialize_start
 
             # Update the node status in the Redis cache
             try:
-                # Record the information to Redis
-                client.hset(node_record_identifier, mapping=format_for_redis(node_info))
+                network_start = perf_counter()
+
+                # HGET runs before HSET so it returns the stored static version, or None if the record is new or expired
+                with client.pipeline(transaction=True) as pipeline:
+                    pipeline.hget(node_record_identifier, 'static_version')
+                    pipeline.hset(node_record_identifier, mapping=changed_fields)
+                    pipeline.expire(node_record_identifier, expiration_seconds)
+                    stored_version = pipeline.execute()[0]
+
+                if isinstance(stored_version, bytes):
+                    stored_version = stored_version.decode()
+
+                if stored_version != static_fields['static_version']:
+                    # The record is new, expired, or holds other static fields; write them with every dynamic field
+                    with client.pipeline(transaction=True) as pipeline:
+                        pipeline.hset(node_record_identifier, mapping=static_fields | dynamic_fields)
+                        pipeline.expire(node_record_identifier, expiration_seconds)
+                        pipeline.execute()
+
+                    logger.debug(f'heartbeat: wrote static fields version {static_fields["static_version"]}')
+
+                written_fields = dynamic_fields
 
-                # Set the expiration time for the node record
-                client.expire(node_record_identifier, int(expiration_multiplier * heartbeat_check_rate))
+                last_written[0] = perf_counter()
+                HEARTBEAT_LAST_SUCCESS.set(last_datetime.timestamp())
+
+                if first_heartbeat is not None:
+                    first_heartbeat.set()
+
+                costs = {
+                    'heartbeat_network_ms': round((perf_counter() - network_start) * 1000, 3),
+                    'heartbeat_serialize_ms': round(serialize_seconds * 1000, 3)
+                }
 
                 logger.debug(f'heartbeat: OK')
 
             except Exception as e:
+                # Rewrite every field once Redis is reachable again
+                written_fields = {}
+
                 logger.error(f'heartbeat: Could not update silo `harvest-nodes`: {e.args}')
 
             sleep(heartbeat_check_rate)
@@ -162,6 +230,57 @@ def start_node_heartbeat(config: WalkableDict):
 
     return thread
 
+def start_metrics_publisher(config: WalkableDict):
+    """
+    Start the metrics publisher. Every `agent.metrics.interval_seconds`, the publisher appends a record of the queue's
+    recent activity to this agent's capped metrics stream (`metrics::<agent name>`) in the harvest-nodes silo. The most
+    recent record is also included in the node heartbeat.
+
+    Args:
+    config (WalkableDict): The agent configuration.
+
+    Returns: The thread object that is running the metrics publisher.
+    """
+
+    interval_seconds = config.walk('agent.metrics.interval_seconds') or 10
+    max_length = config.walk('agent.metrics.max_length') or 360
+
+    from CloudHarvestAgent.metrics import metrics_stream_name
+    from CloudHarvestCoreTasks.silos import get_silo
+    from logging import getLogger
+    from time import sleep
+    from threading import Thread
+
+    logger = getLogger('harvest')
+
+    def _thread():
+        client = get_silo('harvest-nodes').connect()
+        stream_name = metrics_stream_name(config.walk('agent.name'))
+
+        while True:
+            sleep(interval_seconds)
+
+            record = Environment.get('queue_object').metrics_record()
+
+            try:
+                with client.pipeline(transaction=False) as pipeline:
+                    pipeline.xadd(stream_name, fields=record, maxlen=max_length, approximate=True)
+
+                    # The stream outlives its agent by one full window so trends remain visible after a shutdown
+                    pipeline.expire(stream_name, int(interval_seconds * max_length))
+                    pipeline.execute()
+
+                logger.debug(f'metrics: OK')
+
+            except Exception as e:
+                logger.error(f'metrics: Could not update silo `harvest-nodes`: {e.args}')
+
+    # Start the metrics thread
+    thread = Thread(target=_thread, daemon=True)
+    thread.start()
+
+    return thread
+
 #############################################
 # Startup methods                           #
 #############################################
@@ -258,26 +377,282 @@ def load_logging(log_destination: str = './app/logs/', log_level: str = 'info',
     return new_logger
 
 
-def refresh_silos():
+def silo_snapshot_version(silos: dict) -> str:
     """
-    Creates silo connections for the agent.
-    :return:
+    Returns a version identifier for a set of silo configurations which changes whenever any configuration changes.
+
+    Arguments
+    silos (dict): The silo configurations keyed by silo name.
     """
+    import json
+    from hashlib import sha256
+
+    return sha256(json.dumps(silos, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def load_silo_snapshot(path: str) -> dict or None:
+    """
+    Reads the last good silo configurations persisted by `save_silo_snapshot()`.
+
+    Arguments
+    path (str): The path of the snapshot file.
+
+    Returns
+    The snapshot, or None if it does not exist or cannot be read.
+    """
+    import json
     from logging import getLogger
-    logger = getLogger('harvest')
+    from os.path import abspath, expanduser, exists
+
+    path = abspath(expanduser(path))
+
+    if not exists(path):
+        return None
+
+    try:
+        with open(path) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+
+        if not isinstance(snapshot.get('silos'), dict):
+            raise ValueError('The snapshot does not contain any silos.')
+
+        return snapshot
+
+    except Exception as e:
+        getLogger('harvest').warning(f'silos: Could not read the silo snapshot {path}: {e.args}')
 
+        return None
+
+
+def save_silo_snapshot(path: str, snapshot: dict):
+    """
+    Atomically writes a silo snapshot. The snapshot contains credentials, so it is only readable by its owner.
+
+    Arguments
+    path (str): The path of the snapshot file.
+    snapshot (dict): The snapshot, containing the `silos`, their `version`, the API `etag`, and when they were `retrieved`.
+    """
+    import json
+    from os import O_CREAT, O_TRUNC, O_WRONLY, fdopen, getpid, open as os_open, replace
+    from os.path import abspath, dirname, expanduser
+    from pathlib import Path
+
+    path = abspath(expanduser(path))
+    Path(dirname(path)).mkdir(parents=True, exist_ok=True)
+
+    # Each gunicorn worker writes its own temporary file, so concurrent refreshes never interleave
+    temporary_path = f'{path}.{getpid()}.tmp'
+
+    with fdopen(os_open(temporary_path, O_WRONLY | O_CREAT | O_TRUNC, 0o600), 'w') as snapshot_file:
+        json.dump(snapshot, snapshot_file, default=str)
+
+    replace(temporary_path, path)
+
+
+def apply_silos(silos: dict, previous: dict = None) -> list:
+    """
+    Adds or replaces the silos whose configuration differs from `previous`.
+
+    Arguments
+    silos (dict): The silo configurations keyed by silo name.
+    previous (dict, optional): The silo configurations which are already applied.
+
+    Returns
+    The names of the silos which were added or replaced.
+    """
     from CloudHarvestCoreTasks.silos import add_silo
-    silos = Environment.get('api_object').request('get', 'silos/get_all')
+
+    previous = previous or {}
+
+    changed = [
+        silo_name
+        for silo_name, silo_config in silos.items()
+        if previous.get(silo_name) != silo_config
+    ]
+
+    for silo_name in changed:
+        add_silo(name=silo_name, **silos[silo_name])
+
+    # Keep the silo configurations so they can be handed to process pool workers
+    Environment.add(name='silos', value=silos)
+
+    return changed
+
+
+def refresh_silos(snapshot_path: str = None, etag: str = None) -> dict or None:
+    """
+    Retrieves the silo configurations from the API and applies any which changed. When `snapshot_path` is provided,
+    the new configurations are persisted so later starts do not depend on the API.
+
+    Arguments
+    snapshot_path (str, optional): The path of the silo snapshot file.
+    etag (str, optional): The ETag of the silo configurations already applied. The API may answer 304 Not Modified.
+
+    Returns
+    The new snapshot, the current snapshot when nothing changed, or None if the API could not be reached.
+    """
+    from datetime import datetime, timezone
+    from logging import getLogger
+    logger = getLogger('harvest')
+
+    silos = Environment.get('api_object').request('get', 'silos/get_all',
+                                                  headers={'If-None-Match': etag} if etag else None)
+
+    current = Environment.get('silo_snapshot')
+
+    if silos['status_code'] == 304 and current:
+        logger.debug('silos: not modified')
+
+        return current
 
     if silos['status_code'] != 200:
+        logger.error(f'silos: Could not retrieve silos from the API. {silos["status_code"]}:{silos["reason"]} {silos["url"]}')
+
+        return None
+
+    result = silos['response']['result']
+    version = silo_snapshot_version(result)
+
+    if current and current.get('version') == version:
+        logger.debug('silos: unchanged')
+
+        return current
+
+    changed = apply_silos(result, previous=(current or {}).get('silos'))
+
+    snapshot = {
+        'etag': silos['headers'].get('ETag'),
+        'retrieved': datetime.now(tz=timezone.utc).isoformat(),
+        'silos': result,
+        'version': version
+    }
+
+    Environment.add(name='silo_snapshot', value=snapshot)
+
+    logger.info(f'silos: applied version {version}; changed silos: {changed}')
+
+    if snapshot_path:
+        try:
+            save_silo_snapshot(snapshot_path, snapshot)
+
+        except Exception as e:
+            logger.error(f'silos: Could not write the silo snapshot {snapshot_path}: {e.args}')
+
+    return snapshot
+
+
+def load_silos(config: WalkableDict):
+    """
+    Creates the silo connections for the agent. The last good silo configurations are loaded from the local snapshot so
+    startup does not wait on the API; only an agent without a snapshot retrieves them from the API before starting,
+    exiting if it cannot. A background thread then applies changes from the API every
+    `agent.silos.refresh_interval_seconds`.
+
+    Arguments
+    config (WalkableDict): The agent configuration.
+
+    Returns
+    The thread object that is running the silo refresher.
+    """
+    from logging import getLogger
+    from threading import Thread
+    from time import sleep
+
+    logger = getLogger('harvest')
+
+    snapshot_path = config.walk('agent.silos.snapshot_path') or './app/silos.json'
+    refresh_interval_seconds = config.walk('agent.silos.refresh_interval_seconds') or 300
+
+    snapshot = load_silo_snapshot(snapshot_path)
+
+    if snapshot:
+        apply_silos(snapshot['silos'])
+        Environment.add(name='silo_snapshot', value=snapshot)
+
+        logger.info(f'silos: loaded version {snapshot.get("version")} from {snapshot_path} '
+                    f'(retrieved {snapshot.get("retrieved")})')
+
+    elif not refresh_silos(snapshot_path=snapshot_path):
         from sys import exit
-        logger.critical(f'Could not retrieve silos from the API. {silos["status_code"]}:{silos["reason"]} {silos["url"]}. Exiting.')
+        logger.critical('Could not retrieve silos from the API and no silo snapshot is available. Exiting.')
         exit(1)
 
-    # Add the silos to make sure they are up to date
-    [
-        add_silo(name=silo_name, **silo_config)
-        for silo_name, silo_config in silos['response']['result'].items()
-    ]
+    def _thread():
+        # An agent started from its snapshot checks the API for changes right away
+        delay = 0 if snapshot else refresh_interval_seconds
+
+        while True:
+            sleep(delay)
+            delay = refresh_interval_seconds
+
+            try:
+                refresh_silos(snapshot_path=snapshot_path,
+                              etag=(Environment.get('silo_snapshot') or {}).get('etag'))
+
+            except Exception as e:
+                logger.error(f'silos: Could not refresh silos: {e.args}')
+
+    thread = Thread(target=_thread, daemon=True)
+    thread.start()
+
+    return thread
+
+
+def start_agent(config: WalkableDict):
+    """
+    Starts the agent's connection to the API, its silos, its TaskChainQueue, the node heartbeat, and the metrics
+    publisher in this process. Under gunicorn, this runs once in the agent's supervisor process; in debug mode, it runs
+    in the Flask process.
+
+    Arguments
+    config (WalkableDict): The agent configuration.
+
+    Returns
+    The TaskChainQueue.
+    """
+    from CloudHarvestAgent.startup_profiler import startup_profiler
+    from threading import Event
+
+    with startup_profiler.phase('load_silos'):
+        from CloudHarvestAgent.api import Api
+
+        # Create a new API interface which will be used to communicate with the CloudHarvestApi
+        api = Api(host=config.walk('api.host'),
+                  port=config.walk('api.port'),
+                  token=config.walk('api.token'),
+                  pem=config.walk('api.ssl.pem'),
+                  verify=config.walk('api.ssl.verify'),
+                  **config.walk('api.connection', {}))
+
+        Environment.add(name='api_object', value=api)
+
+        # Loads the silos from the local snapshot or the API, then keeps them up to date in the background
+        load_silos(config)
+
+    with startup_profiler.phase('queue_construction'):
+        from CloudHarvestAgent.async_jobs import AsyncTaskChainQueue
+        from CloudHarvestAgent.jobs import TaskChainQueue
+
+        # Instantiate the JobQueue using the configured engine
+        if config.walk('agent.tasks.engine') == AsyncTaskChainQueue.engine:
+            queue = AsyncTaskChainQueue(api=api, **config.walk('agent.tasks', {}))
+
+        else:
+            queue = TaskChainQueue(api=api, **config.walk('agent.tasks', {}))
+
+        Environment.add(name='queue_object', value=queue)
+
+    # Start the node heartbeat and metrics publisher
+    with startup_profiler.phase('first_heartbeat'):
+        first_heartbeat = Event()
+        start_node_heartbeat(config, first_heartbeat=first_heartbeat)
+
+        if startup_profiler.enabled:
+            first_heartbeat.wait(timeout=30)
+
+    start_metrics_publisher(config)
+
+    if config.walk('agent.tasks.auto_start', True):
+        queue.start()
 
-    return
\ No newline at end of file
+    return queue
@@ -0,0 +1,220 @@
+"""
+Breaks the agent's cold start down into phases. Enabled by `--profile-startup`, the profiler records the wall time,
+import time, and memory allocations of each startup phase, prints a table, and writes the results as JSON so they can be
+compared across releases.
+
+Import time is measured per module, like `python -X importtime`, and aggregated by top-level package. Allocations are
+measured with `tracemalloc`, which slows imports down; compare wall times between profiles rather than with unprofiled
+starts.
+
+When the profiler is disabled, `phase()` does nothing, so the startup code can be instrumented unconditionally.
+"""
+
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+from time import perf_counter
+
+import sys
+
+# The number of packages with the highest import time reported for each phase
+TOP_IMPORTS = 10
+
+
+class _ImportTimer(MetaPathFinder):
+    """
+    Times the execution of every module imported while it is installed at the front of `sys.meta_path`.
+    """
+
+    def __init__(self):
+        self.records = []           # [(module name, cumulative seconds, self seconds)]
+        self._stack = []            # [[module name, start, seconds spent in nested imports]]
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+
+            spec = finder.find_spec(fullname, path, target)
+
+            if spec is None:
+                continue
+
+            loader = spec.loader
+
+            # Built-in and frozen modules share a class-level loader and import in microseconds
+            if loader is not None and not isinstance(loader, type) and hasattr(loader, 'exec_module'):
+                loader.exec_module = self._timed(fullname, loader.exec_module)
+
+            return spec
+
+        return None
+
+    def _timed(self, fullname: str, exec_module):
+        def _exec_module(module):
+            self._stack.append([fullname, perf_counter(), 0.0])
+
+            try:
+                return exec_module(module)
+
+            finally:
+                name, start, nested = self._stack.pop()
+                cumulative = perf_counter() - start
+
+                if self._stack:
+                    self._stack[-1][2] += cumulative
+
+                self.records.append((name, cumulative, cumulative - nested))
+
+        return _exec_module
+
+
+class StartupProfiler:
+    """
+    Records the cost of each startup phase.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.phases = []
+        self._import_timer = None
+        self._start = None
+
+    def enable(self):
+        """
+        Starts measuring imports and allocations. Modules imported before this call are not measured.
+        """
+        import tracemalloc
+
+        if self.enabled:
+            return
+
+        self.enabled = True
+        self._start = perf_counter()
+        self._import_timer = _ImportTimer()
+
+        sys.meta_path.insert(0, self._import_timer)
+        tracemalloc.start()
+
+    def disable(self):
+        """
+        Stops measuring imports and allocations.
+        """
+        import tracemalloc
+
+        if not self.enabled:
+            return
+
+        sys.meta_path.remove(self._import_timer)
+        tracemalloc.stop()
+
+        self.enabled = False
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Measures a startup phase.
+
+        Arguments
+        name (str): The name of the phase.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        import tracemalloc
+
+        first_import = len(self._import_timer.records)
+        tracemalloc.reset_peak()
+        memory_start, _ = tracemalloc.get_traced_memory()
+        start = perf_counter()
+
+        try:
+            yield
+
+        finally:
+            wall_seconds = perf_counter() - start
+            memory_end, memory_peak = tracemalloc.get_traced_memory()
+            imports = self._import_timer.records[first_import:]
+
+            by_package = {}
+            for module_name, cumulative, own in imports:
+                package = module_name.split('.')[0]
+                by_package[package] = by_package.get(package, 0) + own
+
+            self.phases.append({
+                'name': name,
+                'wall_ms': round(wall_seconds * 1000, 3),
+                'import_ms': round(sum(own for module_name, cumulative, own in imports) * 1000, 3),
+                'modules_imported': len(imports),
+                'top_imports_ms': {
+                    package: round(seconds * 1000, 3)
+                    for package, seconds in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:TOP_IMPORTS]
+                },
+                'allocated_kib': round((memory_end - memory_start) / 1024, 1),
+                'peak_kib': round((memory_peak - memory_start) / 1024, 1),
+            })
+
+    def report(self) -> dict:
+        """
+        Returns the profile of every phase measured so far.
+        """
+        from datetime import datetime, timezone
+        from platform import python_version
+
+        return {
+            'timestamp': datetime.now(tz=timezone.utc).isoformat(),
+            'python': python_version(),
+            'total_ms': round((perf_counter() - self._start) * 1000, 3) if self._start else 0,
+            'phases': self.phases
+        }
+
+    def format_table(self) -> str:
+        """
+        Returns the profile as a human-readable table.
+        """
+        report = self.report()
+
+        headers = ('Phase', 'Wall ms', 'Import ms', 'Modules', 'Alloc KiB', 'Peak KiB', 'Slowest imports')
+        rows = [
+            (
+                phase['name'],
+                f'{phase["wall_ms"]:.1f}',
+                f'{phase["import_ms"]:.1f}',
+                str(phase['modules_imported']),
+                f'{phase["allocated_kib"]:.1f}',
+                f'{phase["peak_kib"]:.1f}',
+                ', '.join(f'{package} {ms:.0f}' for package, ms in list(phase['top_imports_ms'].items())[:3])
+            )
+            for phase in report['phases']
+        ]
+        rows.append(('total', f'{report["total_ms"]:.1f}', '', '', '', '', ''))
+
+        widths = [max(len(row[index]) for row in (headers, *rows)) for index in range(len(headers))]
+
+        lines = [
+            '  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip()
+            for row in (headers, tuple('-' * width for width in widths), *rows)
+        ]
+
+        return '\n'.join(lines)
+
+    def write(self, path: str):
+        """
+        Writes the profile to a JSON file.
+
+        Arguments
+        path (str): The path of the file.
+        """
+        import json
+        from os.path import abspath, dirname, expanduser
+        from pathlib import Path
+
+        path = abspath(expanduser(path))
+        Path(dirname(path)).mkdir(parents=True, exist_ok=True)
+
+        with open(path, 'w') as profile_file:
+            json.dump(self.report(), profile_file, indent=4)
+
+
+# The profiler shared by the startup code of this process
+startup_profiler = StartupProfiler()
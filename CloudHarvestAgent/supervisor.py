@@ -0,0 +1,460 @@
+"""
+The agent supervisor. Under gunicorn, a single supervisor process per agent owns the TaskChainQueue, the node heartbeat,
+the metrics publisher, and the execution pools, so an agent runs exactly `max_chains` TaskChains and registers one node
+no matter how many HTTP workers it has.
+
+The gunicorn master starts the supervisor before forking its workers and restarts it whenever it exits (see
+`gunicorn_conf.on_starting`). HTTP workers query and control the queue through a QueueClient, which calls the
+supervisor over a local Unix socket. The socket's key is handed to each worker by `gunicorn_conf.post_fork` rather
+than through the environment, so the processes started by TaskChains do not inherit it.
+"""
+
+from CloudHarvestCoreTasks.environment import Environment
+
+from logging import getLogger
+from threading import Event, Lock, Thread, local
+
+logger = getLogger('harvest')
+
+# How HTTP workers reach the supervisor, as `(address, authkey)`; set by `configure_client()` after the worker forks
+_client_settings = None
+
+# TaskChainQueue methods which HTTP workers may call
+SUPERVISOR_METHODS = (
+    'detailed_status',
+    'profile_agent',
+    'profile_task',
+    'prometheus_metrics',
+    'start',
+    'stop',
+    'task_status',
+    'terminate_task',
+)
+
+
+class SupervisorUnavailable(Exception):
+    """
+    Raised when the supervisor cannot be reached.
+    """
+    pass
+
+
+class QueueClient:
+    """
+    Stands in for the TaskChainQueue in HTTP workers by calling the supervisor's queue. Each thread keeps its own
+    connection to the supervisor.
+    """
+
+    def __init__(self, address: str, authkey: bytes):
+        """
+        Arguments
+        address (str): The path of the supervisor's Unix socket.
+        authkey (bytes): The key shared with the supervisor.
+        """
+        self.address = address
+        self._authkey = authkey
+        self._local = local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+
+        if connection is None:
+            from multiprocessing.connection import Client
+            connection = Client(address=self.address, family='AF_UNIX', authkey=self._authkey)
+            self._local.connection = connection
+
+        return connection
+
+    def call(self, method: str, *args, **kwargs):
+        """
+        Calls a method of the supervisor's queue. A connection which the supervisor closed, for example because it was
+        restarted, is replaced once.
+
+        Arguments
+        method (str): The name of the method, which must be one of SUPERVISOR_METHODS.
+        args: Positional arguments for the method.
+        kwargs: Keyword arguments for the method.
+
+        Returns
+        The result of the method.
+        """
+        for attempt in (1, 2):
+            reused = getattr(self._local, 'connection', None) is not None
+
+            try:
+                connection = self._connection()
+                connection.send((method, args, kwargs))
+                status, result = connection.recv()
+                break
+
+            except (EOFError, OSError) as ex:
+                self._local.connection = None
+
+                if not reused or attempt == 2:
+                    raise SupervisorUnavailable(f'Could not reach the supervisor at {self.address}: {ex}') from ex
+
+        if status == 'error':
+            raise RuntimeError(result)
+
+        return result
+
+    def detailed_status(self) -> dict:
+        return self.call('detailed_status')
+
+    def profile_agent(self, seconds: float = 10) -> dict:
+        return self.call('profile_agent', seconds=seconds)
+
+    def profile_task(self, task_id: str, seconds: float = 10) -> dict or None:
+        return self.call('profile_task', task_id, seconds=seconds)
+
+    def prometheus_metrics(self) -> str:
+        return self.call('prometheus_metrics')
+
+    def start(self) -> 'QueueClient':
+        self.call('start')
+        return self
+
+    def stop(self, terminate: bool = False) -> 'QueueClient':
+        self.call('stop', terminate=terminate)
+        return self
+
+    def task_status(self, task_id: str) -> str or None:
+        return self.call('task_status', task_id)
+
+    def terminate_task(self, task_id: str) -> bool:
+        return self.call('terminate_task', task_id)
+
+
+def configure_client(address: str, authkey: bytes):
+    """
+    Tells this process how to reach the supervisor. Called in each HTTP worker after it forks, before the application
+    is loaded.
+
+    Arguments
+    address (str): The path of the supervisor's Unix socket.
+    authkey (bytes): The key shared with the supervisor.
+    """
+    global _client_settings
+
+    _client_settings = (address, authkey)
+
+
+def queue_client() -> QueueClient or None:
+    """
+    Returns a QueueClient of the supervisor, or None if this process is not an HTTP worker of a supervised agent.
+    """
+    if _client_settings is None:
+        return None
+
+    address, authkey = _client_settings
+
+    return QueueClient(address=address, authkey=authkey)
+
+
+def supervisor_address(config) -> str:
+    """
+    Returns the path of the supervisor's Unix socket.
+
+    Arguments
+    config (WalkableDict): The agent configuration, including `agent.connection`.
+    """
+    from os.path import abspath, expanduser
+
+    port = config.walk('agent.connection.port')
+
+    return abspath(expanduser(config.walk('agent.supervisor.socket_path') or f'./app/supervisor-{port}.sock'))
+
+
+def start_supervisor(address: str, authkey: bytes, connection: dict):
+    """
+    Starts the supervisor process.
+
+    Arguments
+    address (str): The path of the Unix socket the supervisor listens on.
+    authkey (bytes): The key HTTP workers must present.
+    connection (dict): The agent's `host`, `port`, and `pemfile`, as seen by HTTP clients.
+
+    Returns
+    The supervisor process.
+    """
+    from multiprocessing import get_context
+
+    # The supervisor may create a process pool, so it cannot be a daemon process
+    process = get_context('spawn').Process(target=run_supervisor,
+                                           args=(address, authkey, connection),
+                                           name='harvest-supervisor',
+                                           daemon=False)
+    process.start()
+
+    return process
+
+
+class Supervisor:
+    """
+    Owns the supervisor process on behalf of the gunicorn master. A watchdog thread restarts the supervisor whenever it
+    exits, even when no worker is being spawned. The address and key are kept across restarts so running workers can
+    reconnect.
+    """
+
+    def __init__(self, connection: dict, check_interval_seconds: float = 1, log=None):
+        """
+        Arguments
+        connection (dict): The agent's `host`, `port`, and `pemfile`, as seen by HTTP clients.
+        check_interval_seconds (float, optional): How often the watchdog checks the supervisor.
+        log (Logger, optional): The logger of the gunicorn master. Defaults to the agent's logger.
+        """
+        from CloudHarvestAgent.startup import load_configuration_from_file
+        from CloudHarvestCoreTasks.dataset import WalkableDict
+        from os import urandom
+
+        config = WalkableDict(**load_configuration_from_file())
+        config['agent']['connection'] = connection
+
+        self.connection = connection
+        self.address = supervisor_address(config)
+        self.authkey = urandom(32)
+        self.check_interval_seconds = check_interval_seconds
+        self.log = log or logger
+
+        self.process = None
+        self.restarts = 0
+
+        self._lock = Lock()
+        self._stopping = Event()
+        self._watchdog = None
+
+    @property
+    def pid(self) -> int or None:
+        return self.process.pid if self.process is not None else None
+
+    def start(self) -> 'Supervisor':
+        """
+        Starts the supervisor process and the watchdog thread.
+        """
+        with self._lock:
+            self.process = start_supervisor(self.address, self.authkey, self.connection)
+
+        self._watchdog = Thread(target=self._watch, name='supervisor-watchdog', daemon=True)
+        self._watchdog.start()
+
+        return self
+
+    def ensure_running(self) -> bool:
+        """
+        Restarts the supervisor process if it has exited.
+
+        Returns
+        True if the supervisor was restarted.
+        """
+        with self._lock:
+            if self._stopping.is_set() or supervisor_alive(self.process):
+                return False
+
+            self.log.warning(f'Supervisor (pid: {self.pid}) exited; restarting')
+
+            self.process = start_supervisor(self.address, self.authkey, self.connection)
+            self.restarts += 1
+
+            self.log.info(f'Supervisor restarted (pid: {self.pid})')
+
+        return True
+
+    def _watch(self):
+        while not self._stopping.wait(self.check_interval_seconds):
+            try:
+                self.ensure_running()
+
+            except Exception:
+                self.log.error('Could not restart the supervisor', exc_info=True)
+
+    def stop(self, timeout: float = 30):
+        """
+        Stops the watchdog and then the supervisor process.
+
+        Arguments
+        timeout (float, optional): The number of seconds to wait for the supervisor to exit.
+        """
+        self._stopping.set()
+
+        with self._lock:
+            stop_supervisor(self.process, timeout=timeout)
+
+
+def supervisor_alive(process) -> bool:
+    """
+    Returns True if the supervisor process is running. gunicorn reaps every child of the master, which
+    `Process.is_alive()` does not expect, so the process is polled directly.
+
+    Arguments
+    process (Process): The supervisor process.
+    """
+    from os import WNOHANG, waitpid
+
+    if process is None or process.pid is None:
+        return False
+
+    try:
+        pid, status = waitpid(process.pid, WNOHANG)
+
+    except ChildProcessError:
+        # gunicorn already reaped the supervisor
+        return False
+
+    return pid == 0
+
+
+def stop_supervisor(process, timeout: float = 30):
+    """
+    Asks the supervisor to stop its queue and exit, killing it if it has not exited within `timeout` seconds.
+
+    Arguments
+    process (Process): The supervisor process.
+    timeout (float, optional): The number of seconds to wait for the supervisor to exit.
+    """
+    from os import kill
+    from signal import SIGKILL, SIGTERM
+    from time import monotonic, sleep
+
+    if not supervisor_alive(process):
+        return
+
+    kill(process.pid, SIGTERM)
+
+    deadline = monotonic() + timeout
+    while supervisor_alive(process) and monotonic() < deadline:
+        sleep(0.1)
+
+    if supervisor_alive(process):
+        kill(process.pid, SIGKILL)
+
+
+def run_supervisor(address: str, authkey: bytes, connection: dict):
+    """
+    The entrypoint of the supervisor process. Loads the agent configuration and plugins, starts the agent, and serves
+    queue calls from HTTP workers until it receives SIGTERM or SIGINT.
+
+    Arguments
+    address (str): The path of the Unix socket to listen on.
+    authkey (bytes): The key HTTP workers must present.
+    connection (dict): The agent's `host`, `port`, and `pemfile`, as seen by HTTP clients.
+    """
+    from CloudHarvestAgent.startup import load_configuration_from_file, load_logging, start_agent
+    from CloudHarvestAgent.template_cache import template_cache
+    from CloudHarvestAgent.template_catalog import template_catalog
+    from CloudHarvestCoreTasks.dataset import WalkableDict
+    from CloudHarvestCorePluginManager import register_all
+    from os import getpid, setsid
+
+    # Leave the master's process group so a Ctrl-C aimed at gunicorn does not stop the supervisor behind the
+    # watchdog's back; the master stops the supervisor itself when it exits
+    setsid()
+
+    # Imports objects which need to be registered by the CloudHarvestCorePluginManager
+    import CloudHarvestAgent.__register__
+
+    config = WalkableDict(**load_configuration_from_file())
+    config['agent']['connection'] = connection
+    config['agent']['pid'] = getpid()
+    config['agent']['name'] = ':'.join([
+        'agent',
+        connection['host'],
+        str(connection['port']),
+        str(getpid())
+    ])
+
+    Environment.merge(config)
+
+    load_logging(log_destination=config.walk('agent.logging.location'),
+                 log_level=config.walk('agent.logging.level'),
+                 quiet=config.walk('agent.logging.quiet'))
+
+    register_all()
+    template_cache.invalidate()
+    template_catalog.build()
+
+    queue = start_agent(config)
+
+    logger.info(f'supervisor: started {config.walk("agent.name")}')
+
+    serve(queue=queue, address=address, authkey=authkey)
+
+
+def serve(queue, address: str, authkey: bytes):
+    """
+    Serves queue calls on a Unix socket until SIGTERM or SIGINT is received, then stops the queue.
+
+    Arguments
+    queue (TaskChainQueue): The queue to serve.
+    address (str): The path of the Unix socket to listen on.
+    authkey (bytes): The key clients must present.
+    """
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Listener
+    from os import remove
+    from os.path import exists
+    from signal import SIG_IGN, SIGINT, SIGTERM, signal
+
+    def _shutdown(signum, frame):
+        # Further signals, such as a second SIGTERM from the master, must not interrupt the shutdown
+        signal(SIGTERM, SIG_IGN)
+        signal(SIGINT, SIG_IGN)
+
+        raise SystemExit(0)
+
+    signal(SIGTERM, _shutdown)
+    signal(SIGINT, _shutdown)
+
+    # Remove the socket of a previous supervisor which did not exit cleanly
+    if exists(address):
+        remove(address)
+
+    listener = Listener(address=address, family='AF_UNIX', authkey=authkey)
+
+    try:
+        while True:
+            try:
+                connection = listener.accept()
+
+            except (AuthenticationError, EOFError, ConnectionError) as ex:
+                logger.warning(f'supervisor: rejected a connection: {ex}')
+                continue
+
+            Thread(target=_serve_connection, args=(queue, connection), daemon=True).start()
+
+    finally:
+        listener.close()
+
+        logger.info('supervisor: stopping')
+        queue.stop()
+
+
+def _serve_connection(queue, connection):
+    """
+    Answers calls from one client connection until the client disconnects.
+
+    Arguments
+    queue (TaskChainQueue): The queue to call.
+    connection (Connection): The client connection.
+    """
+    with connection:
+        while True:
+            try:
+                method, args, kwargs = connection.recv()
+
+            except (EOFError, OSError):
+                return
+
+            try:
+                if method not in SUPERVISOR_METHODS:
+                    raise AttributeError(f'`{method}` cannot be called through the supervisor.')
+
+                result = getattr(queue, method)(*args, **kwargs)
+
+                # Methods which return the queue itself are used for their side effects
+                connection.send(('ok', None if result is queue else result))
+
+            except (EOFError, OSError):
+                return
+
+            except Exception as ex:
+                connection.send(('error', f'{type(ex).__name__}: {ex}'))
@@ -0,0 +1,178 @@
+"""
+A cache of precompiled TaskChain templates. Every claimed task needs a private copy of its template because TaskChains
+modify their templates while they run. Rather than looking the template up in the Registry and `deepcopy`ing it for every
+task, the cache compiles each template once into an immutable form. Immutable values, such as strings and numbers, are
+shared between instances while dictionaries and lists are rebuilt, which is considerably faster than a generic deepcopy.
+
+The cache is keyed by `category/name` and must be invalidated whenever plugins are registered.
+"""
+
+from copy import deepcopy
+from logging import getLogger
+from threading import Lock
+from time import perf_counter
+
+logger = getLogger('harvest')
+
+# Values which are never modified in place and may be shared between template instances
+IMMUTABLE_TYPES = (str, int, float, bool, bytes, type(None))
+
+
+class _FrozenDict:
+    __slots__ = ('items', 'flat')
+
+    def __init__(self, items: tuple):
+        self.items = items
+        self.flat = all(type(value) in IMMUTABLE_TYPES for key, value in items)
+
+
+class _FrozenList:
+    __slots__ = ('items', 'flat')
+
+    def __init__(self, items: tuple):
+        self.items = items
+        self.flat = all(type(value) in IMMUTABLE_TYPES for value in items)
+
+
+class _Opaque:
+    """
+    Wraps values of unknown types which must still be deep copied for every instance.
+    """
+    __slots__ = ('value', )
+
+    def __init__(self, value):
+        self.value = value
+
+
+def freeze(value):
+    """
+    Compiles a template into its immutable form.
+
+    Arguments
+    value: The template or part of a template to compile.
+    """
+    if type(value) in IMMUTABLE_TYPES:
+        return value
+
+    if isinstance(value, dict):
+        return _FrozenDict(tuple((key, freeze(item)) for key, item in value.items()))
+
+    if isinstance(value, list):
+        return _FrozenList(tuple(freeze(item) for item in value))
+
+    if isinstance(value, tuple) and all(type(item) in IMMUTABLE_TYPES for item in value):
+        return value
+
+    return _Opaque(deepcopy(value))
+
+
+def thaw(node):
+    """
+    Creates a new, independently modifiable instance of a compiled template.
+
+    Arguments
+    node: The compiled template or part of a compiled template.
+    """
+    node_type = type(node)
+
+    if node_type is _FrozenDict:
+        if node.flat:
+            return dict(node.items)
+
+        return {key: thaw(item) for key, item in node.items}
+
+    if node_type is _FrozenList:
+        if node.flat:
+            return list(node.items)
+
+        return [thaw(item) for item in node.items]
+
+    if node_type is _Opaque:
+        return deepcopy(node.value)
+
+    return node
+
+
+class TemplateCache:
+    """
+    Holds the compiled form of each TaskChain template, keyed by `category/name`.
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.instantiation_seconds = 0.0
+
+    def instantiate(self, category: str, name: str) -> dict or None:
+        """
+        Returns a new instance of a template, compiling and caching the template on first use.
+
+        Arguments
+        category (str): The template category, such as `template_reports`.
+        name (str): The template name.
+
+        Returns
+        A copy of the template which the caller may modify, or None if no such template is registered.
+        """
+        start = perf_counter()
+        key = f'{category}/{name}'
+
+        compiled = self._templates.get(key)
+
+        if compiled is None:
+            from CloudHarvestCorePluginManager.registry import Registry
+            template = Registry.find(result_key='cls', name=name, category=category)
+
+            if not template:
+                return None
+
+            compiled = freeze(template[0])
+
+            with self._lock:
+                self._templates[key] = compiled
+                self.misses += 1
+
+        else:
+            with self._lock:
+                self.hits += 1
+
+        result = thaw(compiled)
+
+        with self._lock:
+            self.instantiation_seconds += perf_counter() - start
+
+        return result
+
+    def invalidate(self):
+        """
+        Discards all compiled templates. Must be called whenever plugins are (re)registered.
+        """
+        with self._lock:
+            self._templates.clear()
+            self.invalidations += 1
+
+        logger.debug('Template cache invalidated.')
+
+    def stats(self) -> dict:
+        """
+        Returns the cache hit, miss, and instantiation time statistics.
+        """
+        with self._lock:
+            instantiations = self.hits + self.misses
+
+            return {
+                'hits': self.hits,
+                'instantiation_ms_mean': round(self.instantiation_seconds * 1000 / instantiations, 3) if instantiations else 0,
+                'instantiation_ms_total': round(self.instantiation_seconds * 1000, 3),
+                'invalidations': self.invalidations,
+                'misses': self.misses,
+                'templates': len(self._templates)
+            }
+
+
+# The cache shared by all TaskChainQueues in this process
+template_cache = TemplateCache()
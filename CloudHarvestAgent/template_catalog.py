@@ -0,0 +1,118 @@
+"""
+A catalog of the TaskChain templates registered on this agent. The catalog is built once after plugins are registered
+and indexes every template by category and name along with its serialized JSON and a content hash. The `/templates`
+endpoints serve the pre-serialized JSON with the hash as its ETag, so the API can keep its copy of the fleet's templates
+in sync without downloading templates which have not changed.
+"""
+
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+
+class TemplateCatalog:
+    """
+    Registered templates indexed by category and name.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._index = None          # {category: {name: entry}}
+        self._etag = None
+
+    def build(self) -> 'TemplateCatalog':
+        """
+        Serializes and indexes every registered template. Must be called whenever plugins are (re)registered.
+        """
+        import json
+        from CloudHarvestCorePluginManager.registry import Registry
+        from hashlib import sha256
+
+        index = {}
+
+        for record in Registry.find(category='template_*', result_key='*', limit=None):
+            body = json.dumps(record['cls'], default=str).encode('utf-8')
+
+            index.setdefault(record['category'], {})[record['name']] = {
+                'category': record['category'],
+                'name': record['name'],
+                'etag': sha256(body).hexdigest()[:32],
+                'size': len(body),
+                'body': body
+            }
+
+        etag = sha256(
+            '\n'.join(
+                f'{category}/{name}:{entry["etag"]}'
+                for category in sorted(index)
+                for name, entry in sorted(index[category].items())
+            ).encode('utf-8')
+        ).hexdigest()[:32]
+
+        with self._lock:
+            self._index = index
+            self._etag = etag
+
+        logger.debug(f'Template catalog built with {sum(len(names) for names in index.values())} templates.')
+
+        return self
+
+    @property
+    def index(self) -> dict:
+        if self._index is None:
+            self.build()
+
+        return self._index
+
+    @property
+    def etag(self) -> str:
+        """
+        A hash of the identifiers and content of every template, which changes whenever any template changes.
+        """
+        if self._index is None:
+            self.build()
+
+        return self._etag
+
+    def get(self, category: str, name: str) -> dict or None:
+        """
+        Returns a template's catalog entry, which includes its serialized JSON as `body`.
+
+        Arguments
+        category (str): The template category, such as `template_reports`.
+        name (str): The template name.
+        """
+        return self.index.get(category, {}).get(name)
+
+    def identifiers(self) -> list:
+        """
+        Returns the sorted `category/name` identifiers of every template.
+        """
+        return sorted(
+            f'{category}/{name}'
+            for category, names in self.index.items()
+            for name in names
+        )
+
+    def find(self, category: str = None, name: str = None) -> list:
+        """
+        Returns the catalog entries of the templates which match the filters, sorted by category and name.
+
+        Arguments
+        category (str, optional): A category or shell-style pattern, such as `template_*`.
+        name (str, optional): A name or shell-style pattern.
+        """
+        from fnmatch import fnmatchcase
+
+        return [
+            entry
+            for template_category in sorted(self.index)
+            if category is None or fnmatchcase(template_category, category)
+            for template_name, entry in sorted(self.index[template_category].items())
+            if name is None or fnmatchcase(template_name, name)
+        ]
+
+
+# The catalog shared by the endpoints and heartbeat of this process
+template_catalog = TemplateCatalog()
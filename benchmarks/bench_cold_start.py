@@ -0,0 +1,81 @@
+"""
+Measures the cold start of the agent by running `python -m CloudHarvestAgent --profile-startup` in fresh processes and
+aggregating the profile of each startup phase. Run it from the agent's working directory, where `harvest.yaml` and the
+`app` directory are found. Once a silo snapshot exists, startup does not depend on the API.
+
+The JSON output can be kept alongside each release to track cold start over time.
+
+Example:
+    python benchmarks/bench_cold_start.py --runs 5 --output cold-start.json
+"""
+
+from argparse import ArgumentParser
+from statistics import median
+from subprocess import DEVNULL, run
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import json
+import sys
+
+
+def run_benchmark(runs: int) -> dict:
+    profiles = []
+    process_seconds = []
+
+    with TemporaryDirectory() as directory:
+        for index in range(runs):
+            profile_path = f'{directory}/profile-{index}.json'
+
+            start = perf_counter()
+            run([sys.executable, '-m', 'CloudHarvestAgent', '--profile-startup', profile_path],
+                check=True, stdout=DEVNULL)
+            process_seconds.append(perf_counter() - start)
+
+            with open(profile_path) as profile_file:
+                profiles.append(json.load(profile_file))
+
+    phase_names = [phase['name'] for phase in profiles[0]['phases']]
+
+    return {
+        'runs': runs,
+        'python': profiles[0]['python'],
+        'process_ms_median': round(median(process_seconds) * 1000, 1),
+        'total_ms_median': round(median(profile['total_ms'] for profile in profiles), 1),
+        'phases': {
+            name: {
+                key: round(median(
+                    phase[key]
+                    for profile in profiles
+                    for phase in profile['phases']
+                    if phase['name'] == name
+                ), 1)
+                for key in ('wall_ms', 'import_ms', 'allocated_kib', 'peak_kib')
+            }
+            for name in phase_names
+        }
+    }
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks the cold start of the CloudHarvestAgent.')
+    parser.add_argument('--runs', type=int, default=5, help='Number of cold starts to measure')
+    parser.add_argument('--output', type=str, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run_benchmark(runs=args.runs)
+
+    print(f'{"Phase":<20} {"Wall ms":>10} {"Import ms":>10} {"Alloc KiB":>10} {"Peak KiB":>10}')
+    for name, phase in results['phases'].items():
+        print(f'{name:<20} {phase["wall_ms"]:>10} {phase["import_ms"]:>10} {phase["allocated_kib"]:>10} {phase["peak_kib"]:>10}')
+
+    print(f'{"total (median)":<20} {results["total_ms_median"]:>10}')
+    print(f'{"process (median)":<20} {results["process_ms_median"]:>10}')
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmarks the threaded and asyncio TaskChainQueue engines against a live Redis server.
+
+Each run enqueues `--tasks` synthetic tasks on a dedicated queue, starts the engine, and measures the time until every
+task has completed along with the pickup latency of each task (enqueue to start). The synthetic TaskChains sleep for
+`--chain-seconds` so the benchmark measures the queue engine rather than the work performed by the TaskChains.
+
+Example:
+    python benchmarks/bench_queue_engines.py --silo '{"host": "localhost", "port": 6379}' --tasks 500 --max-chains 50
+"""
+
+from argparse import ArgumentParser
+from statistics import mean, quantiles
+from threading import Event
+from time import monotonic, sleep
+
+import json
+
+BENCHMARK_PRIORITY = 'benchmark'
+
+
+class SleepTaskChain:
+    """
+    A stand-in TaskChain which sleeps instead of running tasks.
+    """
+
+    def __init__(self, task: dict, chain_seconds: float, started: dict):
+        self.redis_name = task['redis_name']
+        self.template_identifier = 'benchmark/sleep'
+        self.status = 'initialized'
+        self._chain_seconds = chain_seconds
+        self._started = started
+        self._terminated = Event()
+
+    def run(self):
+        self._started[self.redis_name] = monotonic()
+        self.status = 'running'
+        self._terminated.wait(self._chain_seconds)
+        self.status = 'complete'
+
+    def terminate(self):
+        self._terminated.set()
+
+    def update_status(self):
+        pass
+
+
+def run_benchmark(engine: str, tasks: int, chain_seconds: float, max_chains: int) -> dict:
+    import CloudHarvestAgent.jobs as jobs
+    from CloudHarvestAgent.async_jobs import AsyncTaskChainQueue
+
+    started = {}
+    jobs.build_task_chain = lambda task: SleepTaskChain(task, chain_seconds=chain_seconds, started=started)
+
+    queue_class = AsyncTaskChainQueue if engine == 'asyncio' else jobs.TaskChainQueue
+    queue = queue_class(api=None,
+                        accepted_chain_priorities=[BENCHMARK_PRIORITY],
+                        queue_check_interval_seconds=1,
+                        max_chains=max_chains,
+                        orphan_recovery_interval_seconds=0)
+
+    client = queue.task_silo
+    queue_name = queue.queue_names[0]
+    client.delete(queue_name, queue.processing_list_name(queue_name))
+
+    # Start the engine first so pickup latency includes waking from an idle queue
+    queue.start()
+    sleep(1)
+
+    enqueued = {}
+    for index in range(tasks):
+        redis_name = f'task::benchmark-{engine}-{index}'
+        client.hset(redis_name, mapping={
+            'category': 'benchmark',
+            'config': '{}',
+            'id': f'benchmark-{engine}-{index}',
+            'name': 'sleep',
+            'status': 'enqueued'
+        })
+        client.expire(redis_name, 600)
+        enqueued[redis_name] = monotonic()
+        client.lpush(queue_name, redis_name)
+
+    start = monotonic()
+    while len(started) < tasks or queue.tasks:
+        sleep(0.01)
+
+    elapsed = monotonic() - start
+    queue.stop()
+
+    client.delete(*enqueued.keys())
+
+    latencies = [(started[name] - enqueued[name]) * 1000 for name in enqueued]
+
+    return {
+        'engine': engine,
+        'tasks': tasks,
+        'max_chains': max_chains,
+        'elapsed_seconds': round(elapsed, 3),
+        'tasks_per_second': round(tasks / elapsed, 1),
+        'pickup_ms_mean': round(mean(latencies), 2),
+        'pickup_ms_p99': round(quantiles(latencies, n=100)[98], 2) if len(latencies) > 1 else round(latencies[0], 2),
+    }
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks the TaskChainQueue engines.')
+    parser.add_argument('--silo', type=str, default='{"host": "localhost", "port": 6379}',
+                        help='JSON silo configuration used for the harvest-tasks and harvest-nodes silos')
+    parser.add_argument('--tasks', type=int, default=200, help='Number of tasks to enqueue per engine')
+    parser.add_argument('--chain-seconds', type=float, default=0.05, help='Duration of each synthetic TaskChain')
+    parser.add_argument('--max-chains', type=int, default=10, help='Maximum number of concurrent TaskChains')
+    parser.add_argument('--engines', nargs='+', default=['threaded', 'asyncio'], choices=['threaded', 'asyncio'])
+    args = parser.parse_args()
+
+    from CloudHarvestCoreTasks.environment import Environment
+    from CloudHarvestCoreTasks.silos import add_silo
+
+    Environment.merge({'agent': {'name': 'agent:benchmark:0:0'}})
+    for silo_name in ('harvest-nodes', 'harvest-tasks'):
+        add_silo(name=silo_name, **json.loads(args.silo))
+
+    results = [
+        run_benchmark(engine=engine, tasks=args.tasks, chain_seconds=args.chain_seconds, max_chains=args.max_chains)
+        for engine in args.engines
+    ]
+
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
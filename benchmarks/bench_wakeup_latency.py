@@ -0,0 +1,116 @@
+"""
+Measures the end-to-end latency (enqueue to completion) of short TaskChains under each queue wakeup strategy against a
+live Redis server:
+
+    poll        the worker polls the queues every `queue_check_interval_seconds` and no wakeups are published
+    pubsub      the worker polls the queues, but is woken by a notification published on the `harvest-tasks` channel
+    blocking    the worker blocks on the queues with BRPOP
+
+Tasks are enqueued one at a time at random intervals so every task arrives at an idle queue, which is the common case
+for short report chains such as `harvest/jobs`.
+
+Example:
+    python benchmarks/bench_wakeup_latency.py --silo '{"host": "localhost", "port": 6379}' --tasks 50
+"""
+
+from argparse import ArgumentParser
+from bench_queue_engines import BENCHMARK_PRIORITY, SleepTaskChain
+from random import uniform
+from statistics import mean, median
+from time import monotonic, sleep
+
+import json
+
+STRATEGIES = ('poll', 'pubsub', 'blocking')
+
+
+def run_benchmark(strategy: str, tasks: int, chain_seconds: float, interval_seconds: int) -> dict:
+    import CloudHarvestAgent.jobs as jobs
+
+    started = {}
+    chains = {}
+
+    def build(task: dict):
+        chains[task['redis_name']] = SleepTaskChain(task, chain_seconds=chain_seconds, started=started)
+        return chains[task['redis_name']]
+
+    jobs.build_task_chain = build
+
+    queue = jobs.TaskChainQueue(api=None,
+                                accepted_chain_priorities=[BENCHMARK_PRIORITY],
+                                blocking_pickup=strategy == 'blocking',
+                                queue_check_interval_seconds=interval_seconds,
+                                orphan_recovery_interval_seconds=0,
+                                wakeup_channel='harvest-tasks' if strategy == 'pubsub' else None)
+
+    client = queue.task_silo
+    queue_name = queue.queue_names[0]
+    queue.start()
+    sleep(1)
+
+    latencies = []
+    for index in range(tasks):
+        redis_name = f'task::benchmark-{strategy}-{index}'
+        client.hset(redis_name, mapping={
+            'category': 'benchmark',
+            'config': '{}',
+            'id': f'benchmark-{strategy}-{index}',
+            'name': 'sleep',
+            'status': 'enqueued'
+        })
+        client.expire(redis_name, 600)
+
+        enqueued = monotonic()
+        client.lpush(queue_name, redis_name)
+
+        if strategy == 'pubsub':
+            client.publish('harvest-tasks', queue_name)
+
+        while redis_name not in chains or chains[redis_name].status != 'complete':
+            sleep(0.001)
+
+        latencies.append((monotonic() - enqueued) * 1000)
+        client.delete(redis_name)
+
+        # Arrive at a random point of the polling interval
+        sleep(uniform(0, interval_seconds))
+
+    queue.stop()
+
+    return {
+        'strategy': strategy,
+        'tasks': tasks,
+        'latency_ms_mean': round(mean(latencies), 2),
+        'latency_ms_median': round(median(latencies), 2),
+        'latency_ms_max': round(max(latencies), 2),
+    }
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks the TaskChainQueue wakeup strategies.')
+    parser.add_argument('--silo', type=str, default='{"host": "localhost", "port": 6379}',
+                        help='JSON silo configuration used for the harvest-tasks and harvest-nodes silos')
+    parser.add_argument('--tasks', type=int, default=20, help='Number of tasks to run per strategy')
+    parser.add_argument('--chain-seconds', type=float, default=0.01, help='Duration of each synthetic TaskChain')
+    parser.add_argument('--interval', type=int, default=1, help='queue_check_interval_seconds for every strategy')
+    parser.add_argument('--strategies', nargs='+', default=list(STRATEGIES), choices=STRATEGIES)
+    args = parser.parse_args()
+
+    from CloudHarvestCoreTasks.environment import Environment
+    from CloudHarvestCoreTasks.silos import add_silo
+
+    Environment.merge({'agent': {'name': 'agent:benchmark:0:0'}})
+    for silo_name in ('harvest-nodes', 'harvest-tasks'):
+        add_silo(name=silo_name, **json.loads(args.silo))
+
+    results = [
+        run_benchmark(strategy=strategy, tasks=args.tasks, chain_seconds=args.chain_seconds,
+                      interval_seconds=args.interval)
+        for strategy in args.strategies
+    ]
+
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Helpers shared by the tests which run a TaskChainQueue against an in-memory Redis server.
+"""
+
+from contextlib import contextmanager
+from threading import Event
+from unittest import mock
+
+try:
+    import fakeredis
+
+except ImportError:
+    fakeredis = None
+
+AGENT_NAME = 'agent:test-host:1:1'
+
+
+class FakeSilo:
+    """
+    Stands in for a CloudHarvestCoreTasks silo whose connections share one in-memory Redis server.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def connect(self):
+        return fakeredis.FakeStrictRedis(server=self.server, decode_responses=True)
+
+
+@contextmanager
+def fake_silos():
+    """
+    Patches `get_silo()` so every silo connects to the same in-memory Redis server. Yields a client of that server.
+    """
+    server = fakeredis.FakeServer()
+
+    with mock.patch('CloudHarvestCoreTasks.silos.get_silo', return_value=FakeSilo(server)):
+        yield fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+
+
+def make_queue(queue_class=None, **kwargs):
+    """
+    Returns a TaskChainQueue of the test agent. Must be called within `fake_silos()`.
+
+    Arguments
+    queue_class (type, optional): The queue engine. Defaults to TaskChainQueue.
+    kwargs: The queue configuration.
+    """
+    from CloudHarvestAgent.jobs import TaskChainQueue
+    from CloudHarvestCoreTasks.environment import Environment
+
+    Environment.merge({'agent': {'name': AGENT_NAME}})
+
+    return (queue_class or TaskChainQueue)(api=None, **{'accepted_chain_priorities': [0], **kwargs})
+
+
+class FakeTaskChain:
+    """
+    A TaskChain whose run is stepped through its statuses by the test.
+    """
+
+    def __init__(self, task: dict):
+        self.redis_name = task['redis_name']
+        self.template_identifier = f"{task.get('category')}/{task.get('name')}"
+        self.status = 'initialized'
+        self.result = None
+
+        self.running = Event()
+        self.finish = Event()
+        self.completed = Event()
+        self.exit = Event()
+
+    def run(self):
+        self.status = 'running'
+        self.running.set()
+        self.finish.wait(10)
+
+        self.status = 'complete'
+        self.completed.set()
+        self.exit.wait(10)
+
+    def terminate(self):
+        self.status = 'terminating'
+        self.finish.set()
+        self.exit.set()
+
+    def update_status(self):
+        pass
@@ -0,0 +1,366 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from tests.support import AGENT_NAME, fake_silos, fakeredis, make_queue
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestClaimTasks(unittest.TestCase):
+    def setUp(self):
+        self.silos = fake_silos()
+        self.redis = self.silos.__enter__()
+
+        # The agent serves the `aws` account `111`
+        self.queue = make_queue(accepted_chain_priorities=[0, 1])
+        self.queue.capabilities = ['aws:111']
+
+    def tearDown(self):
+        self.queue.reporter.stop()
+        self.silos.__exit__(None, None, None)
+
+    def enqueue(self, queue_name: str, *task_redis_names: str, **fields):
+        for task_redis_name in task_redis_names:
+            self.redis.hset(task_redis_name, mapping={'status': 'enqueued', 'name': 'test', **fields})
+            self.redis.lpush(queue_name, task_redis_name)
+
+    def processing_list(self, queue_name: str) -> list:
+        return self.redis.lrange(self.queue.processing_list_name(queue_name), 0, -1)
+
+    def test_claims_a_batch_in_priority_order(self):
+        self.enqueue('queue::1', 'task::3')
+        self.enqueue('queue::0', 'task::1', 'task::2')
+        self.enqueue('queue::0::aws:111', 'task::0')
+
+        tasks = self.queue._get_tasks(3)
+
+        self.assertEqual([task['redis_name'] for task in tasks], ['task::0', 'task::1', 'task::2'])
+        self.assertEqual(tasks[1]['processing_list'], f'queue::0::processing::{AGENT_NAME}')
+        self.assertEqual(tasks[1]['agent'], AGENT_NAME)
+        self.assertIsNotNone(self.redis.hget('task::1', 'claimed'))
+
+        # Claimed tasks are held in the processing lists until their chains complete
+        self.assertEqual(self.processing_list('queue::0'), ['task::2', 'task::1'])
+        self.assertEqual(self.processing_list('queue::0::aws:111'), ['task::0'])
+        self.assertEqual(self.redis.lrange('queue::1', 0, -1), ['task::3'])
+        self.assertGreater(self.queue.metrics.record(running_chains=0, max_chains=10)['claims_per_second'], 0)
+
+    def test_claims_follow_the_pickup_plan(self):
+        self.enqueue('queue::0', 'task::0', 'task::1', 'task::2')
+        self.enqueue('queue::1', 'task::3', 'task::4')
+
+        with mock.patch.object(self.queue.pickup_scheduler, 'plan', return_value=[('queue::0', 1), ('queue::1', 2)]):
+            tasks = self.queue._get_tasks(4)
+
+        self.assertEqual([task['redis_name'] for task in tasks], ['task::0', 'task::3', 'task::4'])
+
+    def test_seed_task_is_claimed_first(self):
+        self.enqueue('queue::0', 'task::0', 'task::1')
+        seed_task = self.redis.rpop('queue::0')
+
+        tasks = self.queue._claim_tasks(count=2, plan=self.queue._pickup_plan(2), seed_queue='queue::0', seed_task=seed_task)
+
+        self.assertEqual([task['redis_name'] for task in tasks], ['task::0', 'task::1'])
+        self.assertEqual(self.redis.llen('queue::0'), 0)
+
+    def test_blocking_pickup_seeds_the_claim(self):
+        self.enqueue('queue::1', 'task::0', 'task::1')
+        claim_tasks = self.queue._claim_tasks
+        calls = []
+
+        def first_claim_finds_nothing(**kwargs):
+            calls.append(kwargs)
+            return claim_tasks(**kwargs) if len(calls) > 1 else []
+
+        with mock.patch.object(self.queue, '_claim_tasks', side_effect=first_claim_finds_nothing):
+            tasks = self.queue._get_tasks(2)
+
+        self.assertEqual(calls[1]['seed_queue'], 'queue::1')
+        self.assertEqual(calls[1]['seed_task'], 'task::0')
+        self.assertEqual(calls[1]['plan'], self.queue._pickup_plan(2, waiting=True))
+        self.assertEqual([task['redis_name'] for task in tasks], ['task::0', 'task::1'])
+
+    def test_blocking_pickup_keeps_to_the_plan(self):
+        from CloudHarvestAgent.scheduling import WeightedFairScheduler
+
+        # Both free slots are reserved for priority 0, which has no waiting tasks
+        self.queue.pickup_scheduler = WeightedFairScheduler(reservations={0: 2})
+        self.queue.capabilities = []
+        self.queue.queue_check_interval_seconds = 1
+        self.enqueue('queue::1', 'task::0')
+
+        with mock.patch.object(self.queue.task_silo, 'brpop', wraps=self.queue.task_silo.brpop) as brpop:
+            self.assertEqual(self.queue._get_tasks(2), [])
+
+        brpop.assert_called_once_with(keys=['queue::0'], timeout=1)
+        self.assertEqual(self.redis.lrange('queue::1', 0, -1), ['task::0'])
+
+    def test_seed_task_without_a_quota_is_returned_to_its_queue(self):
+        self.enqueue('queue::0', 'task::0', 'task::1')
+        self.enqueue('queue::1', 'task::2')
+        seed_task = self.redis.rpop('queue::0')
+
+        tasks = self.queue._claim_tasks(count=2, plan=[('queue::0', 0), ('queue::1', 2)], seed_queue='queue::0',
+                                        seed_task=seed_task)
+        self.assertEqual([task['redis_name'] for task in tasks], ['task::2'])
+        self.assertEqual(self.redis.lrange('queue::0', 0, -1), ['task::1', 'task::0'])
+
+        # A seed whose queue is not planned at all is returned as well
+        seed_task = self.redis.rpop('queue::0')
+
+        self.assertEqual(self.queue._claim_tasks(count=2, plan=[('queue::1', 2)], seed_queue='queue::0',
+                                                 seed_task=seed_task), [])
+        self.assertEqual(self.redis.lrange('queue::0', 0, -1), ['task::1', 'task::0'])
+        self.assertEqual(self.processing_list('queue::0'), [])
+
+    def test_seed_task_is_returned_when_the_claim_fails(self):
+        from redis.exceptions import ConnectionError
+
+        self.queue.queue_check_interval_seconds = 1
+        self.enqueue('queue::0', 'task::0', 'task::1')
+        claim_tasks = self.queue._claim_tasks
+
+        def seeded_claim_fails(**kwargs):
+            if kwargs.get('seed_task'):
+                with mock.patch.object(self.queue, '_pop_script', side_effect=ConnectionError('connection lost')):
+                    return claim_tasks(**kwargs)
+
+            return []
+
+        with mock.patch.object(self.queue, '_claim_tasks', side_effect=seeded_claim_fails):
+            with self.assertRaises(ConnectionError):
+                self.queue._get_tasks(1)
+
+        # The seed is back at the front of its queue
+        self.assertEqual(self.redis.lrange('queue::0', 0, -1), ['task::1', 'task::0'])
+        self.assertEqual(self.processing_list('queue::0'), [])
+
+    def test_popped_tasks_are_returned_when_the_claim_fails(self):
+        from redis.exceptions import ConnectionError
+
+        self.enqueue('queue::0', 'task::0', 'task::1', 'task::2')
+
+        with mock.patch.object(self.queue, '_claim_task_arguments', side_effect=ConnectionError('connection lost')):
+            with self.assertRaises(ConnectionError):
+                self.queue._get_tasks(2)
+
+        self.assertEqual(self.redis.lrange('queue::0', 0, -1), ['task::2', 'task::1', 'task::0'])
+        self.assertEqual(self.processing_list('queue::0'), [])
+
+        # Returned tasks can be claimed by any agent
+        self.assertEqual([task['redis_name'] for task in self.queue._get_tasks(3)], ['task::0', 'task::1', 'task::2'])
+
+    def test_returned_tasks_release_the_claim(self):
+        self.enqueue('queue::0', 'task::0', 'task::1')
+        tasks = self.queue._get_tasks(1)
+
+        self.queue._return_tasks(popped=[('queue::0', tasks[0]['redis_name'])])
+
+        self.assertIsNone(self.redis.hget('task::0', 'agent'))
+        self.assertEqual(self.redis.lrange('queue::0', 0, -1), ['task::1', 'task::0'])
+
+        # Tasks which are no longer in the processing list are not returned twice
+        self.queue._return_tasks(popped=[('queue::0', 'task::0')])
+        self.assertEqual(self.redis.llen('queue::0'), 2)
+
+    def test_unclaimable_tasks_are_discarded(self):
+        self.enqueue('queue::0', 'task::0', 'task::1', 'task::2')
+        self.redis.hset('task::0', 'status', 'complete')
+        self.redis.hset('task::1', 'agent', 'agent:other-host:1:1')
+
+        tasks = self.queue._get_tasks(3)
+
+        self.assertEqual([task['redis_name'] for task in tasks], ['task::2'])
+        self.assertEqual(self.processing_list('queue::0'), ['task::2'])
+        self.assertEqual(self.redis.hget('task::1', 'agent'), 'agent:other-host:1:1')
+
+    def test_tasks_of_other_accounts_are_rerouted(self):
+        self.enqueue('queue::0', 'task::0', platform='aws', account='222')
+        self.enqueue('queue::0', 'task::1', platform='aws', account='111')
+        self.enqueue('queue::0', 'task::2')
+
+        tasks = self.queue._get_tasks(3)
+
+        self.assertEqual([task['redis_name'] for task in tasks], ['task::1', 'task::2'])
+        self.assertEqual(self.redis.lrange('queue::0::aws:222', 0, -1), ['task::0'])
+        self.assertIsNone(self.redis.hget('task::0', 'agent'))
+        self.assertEqual(self.processing_list('queue::0'), ['task::2', 'task::1'])
+
+    def test_account_queues_are_not_rerouted(self):
+        self.enqueue('queue::0::aws:111', 'task::0', platform='aws', account='222')
+
+        self.assertEqual([task['redis_name'] for task in self.queue._get_tasks(1)], ['task::0'])
+
+    def test_reroutes_are_bounded_by_the_batch(self):
+        self.enqueue('queue::0', *(f'task::{index}' for index in range(10)), platform='aws', account='222')
+
+        self.assertEqual(self.queue._claim_tasks(count=3, plan=self.queue._pickup_plan(3)), [])
+        self.assertEqual(self.redis.llen('queue::0::aws:222'), 3)
+        self.assertEqual(self.redis.llen('queue::0'), 7)
+
+    def test_queue_state(self):
+        self.enqueue('queue::0', 'task::0', enqueued='2026-01-01T00:00:00+00:00')
+        self.enqueue('queue::0', 'task::1')
+
+        state = self.queue._get_queue_state()
+
+        self.assertEqual(state['queue::0']['length'], 2)
+        self.assertGreater(state['queue::0']['oldest_wait_seconds'], 0)
+        self.assertEqual(state['queue::1'], {'length': 0, 'oldest_wait_seconds': None})
+
+    def test_async_claim(self):
+        from CloudHarvestAgent.async_jobs import AsyncTaskChainQueue
+
+        queue = make_queue(queue_class=AsyncTaskChainQueue, accepted_chain_priorities=[0],
+                           pickup_scheduler={'name': 'weighted_fair'})
+        queue.capabilities = ['aws:111']
+        self.addCleanup(queue.reporter.stop)
+
+        self.enqueue('queue::0', 'task::0', platform='aws', account='222')
+        self.enqueue('queue::0', 'task::1')
+
+        async def claim():
+            from CloudHarvestAgent.async_jobs import (
+                CLAIM_TASK_SCRIPT,
+                POP_TASKS_SCRIPT,
+                REROUTE_TASK_SCRIPT,
+                RETURN_TASK_SCRIPT
+            )
+
+            queue._async_task_silo = fakeredis.FakeAsyncRedis(server=self.redis.connection_pool.connection_kwargs['server'],
+                                                              decode_responses=True)
+            queue._async_pop_script = queue._async_task_silo.register_script(POP_TASKS_SCRIPT)
+            queue._async_claim_script = queue._async_task_silo.register_script(CLAIM_TASK_SCRIPT)
+            queue._async_reroute_script = queue._async_task_silo.register_script(REROUTE_TASK_SCRIPT)
+            queue._async_return_script = queue._async_task_silo.register_script(RETURN_TASK_SCRIPT)
+
+            return await queue._get_tasks_async(2)
+
+        self.assertEqual([task['redis_name'] for task in asyncio.run(claim())], ['task::1'])
+        self.assertEqual(self.redis.lrange('queue::0::aws:222', 0, -1), ['task::0'])
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestWorkerPickup(unittest.TestCase):
+    def setUp(self):
+        self.silos = fake_silos()
+        self.redis = self.silos.__enter__()
+
+    def tearDown(self):
+        self.silos.__exit__(None, None, None)
+
+    def run_worker(self, queue, seconds: float = 0.3):
+        from threading import Thread
+        from time import sleep
+
+        from CloudHarvestAgent.jobs import JobQueueStatusCodes
+
+        queue.status = JobQueueStatusCodes.running
+
+        worker = Thread(target=queue._worker, daemon=True)
+        worker.start()
+        sleep(seconds)
+
+        queue.status = JobQueueStatusCodes.stopped
+        queue._wake()
+        worker.join(5)
+        self.assertFalse(worker.is_alive())
+
+    def test_failed_pickups_wait_before_retrying(self):
+        from redis.exceptions import ConnectionError
+
+        queue = make_queue(queue_check_interval_seconds=1)
+        self.addCleanup(queue.reporter.stop)
+
+        with mock.patch.object(queue, '_claim_tasks', side_effect=ConnectionError('connection refused')) as claim_tasks:
+            self.run_worker(queue)
+
+        self.assertEqual(claim_tasks.call_count, 1)
+
+    def test_pickups_without_queues_wait_before_retrying(self):
+        queue = make_queue(accepted_chain_priorities=[], queue_check_interval_seconds=1)
+        self.addCleanup(queue.reporter.stop)
+
+        with mock.patch.object(queue, '_get_tasks', wraps=queue._get_tasks) as get_tasks:
+            self.run_worker(queue)
+
+        self.assertEqual(get_tasks.call_count, 1)
+
+    def test_blocking_pickups_do_not_wait_again(self):
+        queue = make_queue(queue_check_interval_seconds=1)
+        self.addCleanup(queue.reporter.stop)
+
+        with mock.patch.object(queue._wake_event, 'wait', wraps=queue._wake_event.wait) as wake_wait:
+            self.run_worker(queue, seconds=1.5)
+
+        # The worker waited on BRPOP and only waits on the wake event once it is stopped
+        wake_wait.assert_not_called()
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestRecoverOrphanedTasks(unittest.TestCase):
+    crashed_agent = 'agent:crashed-host:1:1'
+
+    def setUp(self):
+        self.silos = fake_silos()
+        self.redis = self.silos.__enter__()
+        self.queue = make_queue()
+
+    def tearDown(self):
+        self.queue.reporter.stop()
+        self.silos.__exit__(None, None, None)
+
+    def orphan(self, *tasks: tuple, agent_name: str = crashed_agent):
+        # Claims are pushed to the left of the processing list, so the oldest claim is on the right
+        for task_redis_name, status in tasks:
+            self.redis.hset(task_redis_name, mapping={'status': status, 'agent': agent_name, 'claimed': 'then'})
+            self.redis.lpush(f'queue::0::processing::{agent_name}', task_redis_name)
+
+    def test_unstarted_tasks_are_returned_to_the_front_of_the_queue(self):
+        self.redis.lpush('queue::0', 'task::new')
+        self.orphan(('task::0', 'enqueued'), ('task::1', 'enqueued'))
+
+        self.assertEqual(self.queue.recover_orphaned_tasks(), 2)
+
+        # The oldest claim is claimed first again
+        self.assertEqual(self.redis.lrange('queue::0', 0, -1), ['task::new', 'task::1', 'task::0'])
+        self.assertEqual(self.redis.hgetall('task::0'), {'status': 'enqueued'})
+        self.assertFalse(self.redis.exists(f'queue::0::processing::{self.crashed_agent}'))
+        self.assertIsNotNone(self.queue.last_orphan_recovery)
+
+    def test_started_tasks_are_marked_as_errors(self):
+        self.orphan(('task::0', 'running'), ('task::1', 'complete'))
+
+        self.assertEqual(self.queue.recover_orphaned_tasks(), 0)
+
+        self.assertEqual(self.redis.llen('queue::0'), 0)
+        self.assertEqual(self.redis.hget('task::0', 'status'), 'error')
+        self.assertEqual(self.redis.hget('task::1', 'status'), 'complete')
+
+    def test_live_agents_keep_their_tasks(self):
+        self.redis.set('agent:live-host:1:1', 'heartbeat')
+        self.orphan(('task::0', 'enqueued'), agent_name='agent:live-host:1:1')
+        self.orphan(('task::1', 'enqueued'), agent_name=self.queue.agent_name)
+
+        self.assertEqual(self.queue.recover_orphaned_tasks(), 0)
+        self.assertEqual(self.redis.llen('queue::0'), 0)
+
+    def test_popped_tasks_are_recovered_when_the_claim_did_not_finish(self):
+        self.redis.hset('task::0', 'status', 'enqueued')
+        self.redis.lpush('queue::0', 'task::0')
+
+        # Another agent pops the task into its processing list and stops before claiming it
+        crashed = make_queue()
+        crashed.agent_name = self.crashed_agent
+        self.addCleanup(crashed.reporter.stop)
+
+        keys, args = crashed._pop_arguments(count=1, plan=crashed._pickup_plan(1))
+        crashed._pop_script(keys=keys, args=args)
+        self.assertEqual(self.redis.llen('queue::0'), 0)
+
+        self.assertEqual(self.queue.recover_orphaned_tasks(), 1)
+        self.assertEqual([task['redis_name'] for task in self.queue._get_tasks(1)], ['task::0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from unittest import mock
+
+from CloudHarvestAgent.concurrency import AdaptiveConcurrency
+
+
+def controller(**kwargs) -> AdaptiveConcurrency:
+    # Host signals are read from /proc; the tests decide them instead
+    with mock.patch('CloudHarvestAgent.concurrency.read_cpu_times', return_value=None):
+        return AdaptiveConcurrency(**{'max_chains': 10, 'min_chains': 2, 'rss_limit_mb': None, **kwargs})
+
+
+def adjust(concurrency: AdaptiveConcurrency, cpu_times: tuple = None, rss_bytes: int = None) -> int:
+    with mock.patch('CloudHarvestAgent.concurrency.read_cpu_times', return_value=cpu_times), \
+            mock.patch('CloudHarvestAgent.concurrency.read_rss_bytes', return_value=rss_bytes):
+        return concurrency.adjust()
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def test_initial_limit_is_within_bounds(self):
+        self.assertEqual(controller().limit, 2)
+        self.assertEqual(controller(initial_chains=50).limit, 10)
+        self.assertEqual(controller(min_chains=0).min_chains, 1)
+
+    def test_saturated_queue_increases_additively(self):
+        concurrency = controller(running=lambda: 100)
+
+        self.assertEqual([adjust(concurrency) for i in range(10)], [3, 4, 5, 6, 7, 8, 9, 10, 10, 10])
+        self.assertEqual(concurrency.increases, 8)
+        self.assertEqual(concurrency.decisions[-1]['reason'], 'saturated')
+
+    def test_idle_slots_hold_the_limit(self):
+        concurrency = controller(initial_chains=5, running=lambda: 3)
+
+        self.assertEqual(adjust(concurrency), 5)
+        self.assertEqual(len(concurrency.decisions), 0)
+
+    def test_error_rate_decreases_multiplicatively(self):
+        concurrency = controller(initial_chains=8, running=lambda: 8)
+
+        concurrency.record('reports/a', 1, errored=True)
+        concurrency.record('reports/a', 1)
+
+        self.assertEqual(adjust(concurrency), 6)
+        self.assertEqual(concurrency.decisions[-1]['reason'], 'error_rate')
+        self.assertEqual(concurrency.signals['error_rate'], 0.5)
+
+        # The window is reset after each decision
+        self.assertEqual(adjust(concurrency), 7)
+
+    def test_latency_is_compared_per_template(self):
+        concurrency = controller(initial_chains=8, running=lambda: 100)
+
+        concurrency.record('reports/short', 1)
+        concurrency.record('reports/long', 100)
+        adjust(concurrency)
+
+        concurrency.record('reports/short', 1)
+        concurrency.record('reports/long', 100)
+        self.assertEqual(adjust(concurrency), 10)
+        self.assertEqual(concurrency.signals['latency_ratio'], 1)
+
+        concurrency.record('reports/short', 5)
+        self.assertEqual(adjust(concurrency), 7)
+        self.assertEqual(concurrency.decisions[-1]['reason'], 'latency')
+
+    def test_host_signals_decrease_the_limit(self):
+        concurrency = controller(initial_chains=8, running=lambda: 8, rss_limit_mb=100)
+
+        adjust(concurrency, cpu_times=(0, 100))
+        self.assertEqual(adjust(concurrency, cpu_times=(95, 200)), 6)
+        self.assertEqual(concurrency.signals['cpu'], 0.95)
+
+        self.assertEqual(adjust(concurrency, cpu_times=(100, 300), rss_bytes=200 * 1024 * 1024), 4)
+        self.assertEqual(concurrency.decisions[-1]['reason'], 'rss')
+
+        self.assertEqual(adjust(concurrency, cpu_times=(400, 400), rss_bytes=200 * 1024 * 1024), 3)
+        self.assertEqual(concurrency.decisions[-1]['reason'], 'cpu, rss')
+
+        self.assertEqual(adjust(concurrency, cpu_times=(500, 500), rss_bytes=200 * 1024 * 1024), 2)
+        self.assertEqual(adjust(concurrency, cpu_times=(600, 600), rss_bytes=200 * 1024 * 1024), 2)
+
+    def test_stats(self):
+        stats = controller().stats()
+
+        self.assertEqual(list(stats), sorted(stats))
+        self.assertEqual(stats['limit'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from threading import Event
+from time import monotonic
+
+from CloudHarvestAgent.deadlines import COMPACTION_THRESHOLD, DeadlineScheduler, DeadlineStages
+
+
+class TestDeadlineScheduler(unittest.TestCase):
+    def setUp(self):
+        self.fired = []
+        self.event = Event()
+
+        def on_deadline(key, stage):
+            self.fired.append((key, stage))
+            self.event.set()
+
+        self.deadlines = DeadlineScheduler(on_deadline=on_deadline)
+
+    def tearDown(self):
+        self.deadlines.stop()
+
+    def test_deadlines_fire_in_order(self):
+        self.deadlines.start()
+
+        self.deadlines.schedule('task::2', 0.2)
+        self.deadlines.schedule('task::1', 0.1, stage=DeadlineStages.escalate)
+
+        start = monotonic()
+        while len(self.fired) < 2 and monotonic() - start < 5:
+            self.event.wait(0.05)
+
+        self.assertEqual(self.fired, [('task::1', 'escalate'), ('task::2', 'terminate')])
+        self.assertEqual(self.deadlines.fired, 2)
+        self.assertEqual(len(self.deadlines), 0)
+
+    def test_earlier_deadline_wakes_the_scheduler(self):
+        self.deadlines.start()
+
+        self.deadlines.schedule('task::late', 60)
+        self.deadlines.schedule('task::early', 0.05)
+
+        self.assertTrue(self.event.wait(5))
+        self.assertEqual(self.fired, [('task::early', 'terminate')])
+        self.assertEqual(len(self.deadlines), 1)
+
+    def test_cancelled_and_rescheduled_deadlines_do_not_fire(self):
+        self.deadlines.schedule('task::1', 0.05)
+        self.deadlines.schedule('task::2', 0.05)
+        self.deadlines.schedule('task::2', 60)
+
+        self.assertTrue(self.deadlines.cancel('task::1'))
+        self.assertFalse(self.deadlines.cancel('task::1'))
+
+        self.deadlines.start()
+        self.assertFalse(self.event.wait(0.3))
+        self.assertEqual(len(self.deadlines), 1)
+
+    def test_stale_entries_are_compacted(self):
+        for index in range(COMPACTION_THRESHOLD * 2):
+            self.deadlines.schedule(f'task::{index}', 60)
+            self.deadlines.cancel(f'task::{index}')
+
+        self.assertLessEqual(len(self.deadlines._heap), COMPACTION_THRESHOLD + 1)
+
+    def test_handler_errors_do_not_stop_the_scheduler(self):
+        def on_deadline(key, stage):
+            if key == 'task::1':
+                raise ValueError('failed')
+
+            self.event.set()
+
+        self.deadlines.on_deadline = on_deadline
+        self.deadlines.start()
+
+        self.deadlines.schedule('task::1', 0)
+        self.deadlines.schedule('task::2', 0.05)
+
+        self.assertTrue(self.event.wait(5))
+        self.assertEqual(self.deadlines.fired, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from tests.support import fake_silos, fakeredis
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestProcessTaskChain(unittest.TestCase):
+    def setUp(self):
+        from CloudHarvestAgent.execution import ProcessTaskChain
+
+        self.task_chain = ProcessTaskChain({'redis_name': 'task::1', 'category': 'template_reports', 'name': 'cpu'})
+
+    def test_failed_worker_is_reported_by_the_parent(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool('A process in the process pool was terminated abruptly.'))
+
+        with fake_silos() as redis:
+            self.task_chain.complete(future)
+            self.task_chain.update_status()
+
+            self.assertEqual(self.task_chain.status, 'error')
+            self.assertEqual(redis.hget('task::1', 'status'), 'error')
+            self.assertIn('BrokenProcessPool', redis.hget('task::1', 'error'))
+
+    def test_completed_worker_reported_its_own_status(self):
+        future = Future()
+        future.set_result({'status': 'complete', 'records': 3})
+
+        with fake_silos() as redis:
+            self.task_chain.complete(future)
+            self.task_chain.update_status()
+
+            self.assertEqual(self.task_chain.status, 'complete')
+            self.assertEqual(redis.hgetall('task::1'), {})
+
+    def test_worker_pid_is_shared(self):
+        from CloudHarvestAgent.execution import write_pid, write_status
+
+        self.assertIsNone(self.task_chain.pid)
+
+        write_pid(self.task_chain._shared_memory, 4321)
+        write_status(self.task_chain._shared_memory, 'running')
+
+        self.assertEqual(self.task_chain.pid, 4321)
+        self.assertEqual(self.task_chain.status, 'running')
+
+        future = Future()
+        future.set_result({'status': 'complete'})
+        self.task_chain.complete(future)
+
+        # The pid is kept after the shared memory block is released
+        self.assertEqual(self.task_chain.pid, 4321)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+from unittest import mock
+
+from tests.support import FakeTaskChain, fake_silos, fakeredis, make_queue
+
+
+def nonzero(counts: dict) -> dict:
+    return {status: count for status, count in counts.items() if count}
+
+
+def wait_until(condition, timeout: float = 5) -> bool:
+    deadline = monotonic() + timeout
+
+    while not condition():
+        if monotonic() > deadline:
+            return False
+
+        sleep(0.01)
+
+    return True
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestChainLifecycle(unittest.TestCase):
+    def setUp(self):
+        self.silos = fake_silos()
+        self.redis = self.silos.__enter__()
+        self.queue = make_queue(chain_timeout_seconds=0)
+        self.queue._executor = ThreadPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.queue._executor.shutdown(wait=True)
+        self.queue.reporter.stop()
+        self.silos.__exit__(None, None, None)
+
+    def test_chain_status_counts_follow_the_chain(self):
+        chains = []
+
+        def build(task):
+            chains.append(FakeTaskChain(task))
+            return chains[-1]
+
+        task = {
+            'redis_name': 'task::1',
+            'category': 'template_reports',
+            'name': 'lifecycle',
+            'processing_list': 'queue::0::processing::agent:test-host:1:1'
+        }
+
+        with mock.patch('CloudHarvestAgent.jobs.build_task_chain', side_effect=build):
+            task_chain = self.queue._submit_task_chain(task)
+
+        self.assertIs(task_chain, chains[0])
+        self.assertTrue(task_chain.running.wait(5))
+
+        status = self.queue.detailed_status()
+        self.assertEqual(nonzero(status['chain_status']), {'running': 1})
+        self.assertEqual(status['chain_templates'], {'template_reports/lifecycle': 1})
+
+        task_chain.finish.set()
+        self.assertTrue(task_chain.completed.wait(5))
+
+        # Reading the status does not visit the running chains; the reporter's collection records their status
+        with mock.patch.object(self.queue.counters, 'transition') as transition:
+            self.queue.detailed_status()
+            self.queue.queue_summary()
+
+        transition.assert_not_called()
+
+        self.queue._collect_progress()
+        self.assertEqual(nonzero(self.queue.detailed_status()['chain_status']), {'complete': 1})
+
+        task_chain.exit.set()
+        self.assertTrue(wait_until(lambda: 'task::1' not in self.queue.tasks))
+
+        status = self.queue.detailed_status()
+        self.assertEqual(nonzero(status['chain_status']), {})
+        self.assertEqual(status['chain_templates'], {})
+        self.assertEqual(status['totals']['processed'], 1)
+        self.assertEqual(status['totals']['errored'], 0)
+
+        # The resource usage is written with the final status and the reporter forgets the chain
+        self.assertEqual(json.loads(self.redis.hget('task::1', 'resource_usage'))['status'], 'complete')
+        self.assertNotIn('task::1', self.queue.reporter._pending)
+        self.assertNotIn('task::1', self.queue.reporter._reported)
+
+    def test_new_chain_is_counted_as_initialized(self):
+        task = {'redis_name': 'task::2', 'category': 'template_reports', 'name': 'lifecycle',
+                'processing_list': 'queue::0::processing::agent:test-host:1:1'}
+
+        with mock.patch('CloudHarvestAgent.jobs.build_task_chain', side_effect=FakeTaskChain):
+            # Nothing runs the submitted chain, so it keeps its initial status
+            with mock.patch.object(self.queue._executor, 'submit'):
+                self.queue._submit_task_chain(task)
+
+        self.assertEqual(nonzero(self.queue.detailed_status()['chain_status']), {'initialized': 1})
+
+    def test_queue_summary(self):
+        task = {'redis_name': 'task::3', 'category': 'template_reports', 'name': 'lifecycle',
+                'processing_list': 'queue::0::processing::agent:test-host:1:1'}
+
+        with mock.patch('CloudHarvestAgent.jobs.build_task_chain', side_effect=FakeTaskChain):
+            task_chain = self.queue._submit_task_chain(task)
+
+        self.assertTrue(task_chain.running.wait(5))
+
+        summary = self.queue.queue_summary()
+        self.assertEqual(summary['chain_status'], {'running': 1})
+        self.assertEqual(summary['total_chains_in_queue'], 1)
+        self.assertEqual(summary['engine'], 'threaded')
+        self.assertNotIn('chain_templates', summary)
+
+        task_chain.terminate()
+        self.assertTrue(wait_until(lambda: not self.queue.tasks))
+
+    def test_async_queue_summary_includes_the_event_loop(self):
+        from CloudHarvestAgent.async_jobs import AsyncTaskChainQueue
+
+        queue = make_queue(queue_class=AsyncTaskChainQueue)
+        self.addCleanup(queue.reporter.stop)
+
+        summary = queue.queue_summary()
+        self.assertEqual(summary['engine'], 'asyncio')
+        self.assertFalse(summary['event_loop_running'])
+        self.assertEqual(summary['pending_completions'], 0)
+        self.assertEqual(list(summary), sorted(summary))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+from CloudHarvestAgent.metrics import QueueCounters, QueueMetrics, QueueWaitTimes, percentile
+
+
+def nonzero(counts: dict) -> dict:
+    return {status: count for status, count in counts.items() if count}
+
+
+class TestQueueCounters(unittest.TestCase):
+    def test_status_codes_are_always_reported(self):
+        counters = QueueCounters(status_codes=['initialized', 'running', 'complete'])
+
+        self.assertEqual(counters.snapshot()['chain_status'], {'initialized': 0, 'running': 0, 'complete': 0})
+
+    def test_counts_follow_transitions(self):
+        counters = QueueCounters(status_codes=['initialized', 'running'])
+
+        counters.started('task::1', 'reports/a', 'initialized')
+        counters.started('task::2', 'reports/a', 'initialized')
+        counters.started('task::3', 'reports/b', 'initialized')
+        counters.transition('task::1', 'running')
+        counters.transition('task::1', 'running')
+        counters.transition('task::2', 'complete')
+
+        snapshot = counters.snapshot()
+        self.assertEqual(nonzero(snapshot['chain_status']), {'initialized': 1, 'running': 1, 'complete': 1})
+        self.assertEqual(snapshot['chain_templates'], {'reports/a': 2, 'reports/b': 1})
+
+    def test_unknown_chains_are_ignored(self):
+        counters = QueueCounters()
+
+        counters.transition('task::1', 'running')
+        counters.finished('task::1', 'complete')
+
+        self.assertEqual(counters.snapshot()['chain_status'], {})
+        self.assertEqual(counters.snapshot()['totals']['processed'], 0)
+
+    def test_finished_chains_are_added_to_the_totals(self):
+        counters = QueueCounters()
+
+        for index, status in enumerate(['complete', 'error', 'terminating', 'timeout', 'timeout']):
+            counters.started(f'task::{index}', 'reports/a', 'running')
+            counters.finished(f'task::{index}', status)
+
+        snapshot = counters.snapshot()
+        self.assertEqual(nonzero(snapshot['chain_status']), {})
+        self.assertEqual(snapshot['chain_templates'], {})
+        self.assertEqual(snapshot['chain_timeouts'], {'reports/a': 2})
+        self.assertEqual(snapshot['totals'], {'errored': 1, 'processed': 5, 'terminated': 1, 'timed_out': 2})
+
+    def test_snapshot_is_a_copy(self):
+        counters = QueueCounters()
+        counters.started('task::1', 'reports/a', 'running')
+
+        snapshot = counters.snapshot()
+        counters.finished('task::1', 'complete')
+
+        self.assertEqual(snapshot['chain_status'], {'running': 1})
+
+
+class TestQueueMetrics(unittest.TestCase):
+    def test_record_covers_one_window(self):
+        metrics = QueueMetrics()
+
+        metrics.claimed(queue_wait_seconds=2)
+        metrics.claimed(queue_wait_seconds=4)
+        metrics.claimed()
+        metrics.completed(duration_seconds=10)
+
+        record = metrics.record(running_chains=3, max_chains=10, concurrency_limit=4)
+        self.assertEqual(record['free_slots'], 1)
+        self.assertEqual(record['concurrency_limit'], 4)
+        self.assertEqual(record['queue_wait_seconds_mean'], 3)
+        self.assertEqual(record['chain_duration_seconds_mean'], 10)
+        self.assertIs(metrics.latest, record)
+
+        record = metrics.record(running_chains=12, max_chains=10)
+        self.assertEqual(record['free_slots'], 0)
+        self.assertEqual(record['claims_per_second'], 0)
+        self.assertEqual(record['queue_wait_seconds_mean'], 0)
+
+
+class TestQueueWaitTimes(unittest.TestCase):
+    def test_percentiles(self):
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 2)
+        self.assertEqual(percentile([1], 0.99), 1)
+
+        wait_times = QueueWaitTimes(samples=100)
+
+        for seconds in range(1, 201):
+            wait_times.record('queue::0', seconds)
+
+        wait_times.record('queue::1', 5)
+
+        self.assertEqual(wait_times.percentiles(), {
+            'queue::0': {'count': 100, 'p50': 150, 'p90': 190, 'p99': 199, 'max': 200},
+            'queue::1': {'count': 1, 'p50': 5, 'p90': 5, 'p99': 5, 'max': 5}
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
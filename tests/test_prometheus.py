@@ -0,0 +1,101 @@
+import unittest
+from threading import Thread
+
+
+class TestPrometheusMetrics(unittest.TestCase):
+    def test_counter_family_name_matches_its_samples(self):
+        from CloudHarvestAgent.prometheus import Counter
+
+        counter = Counter('harvest_test_events', 'Test events.', ('kind',))
+        counter.inc('a')
+        counter.inc('a', amount=2)
+        counter.inc('b')
+
+        self.assertEqual(counter.render(), '\n'.join([
+            '# HELP harvest_test_events_total Test events.',
+            '# TYPE harvest_test_events_total counter',
+            'harvest_test_events_total{kind="a"} 3',
+            'harvest_test_events_total{kind="b"} 1'
+        ]))
+
+        self.assertEqual(Counter('harvest_test_total', 'Test.').name, 'harvest_test_total')
+
+    def test_counter_sums_thread_shards(self):
+        from CloudHarvestAgent.prometheus import Counter
+
+        counter = Counter('harvest_test_threads', 'Test.')
+
+        threads = [Thread(target=lambda: [counter.inc() for _ in range(100)]) for _ in range(4)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+
+        counter.inc()
+
+        self.assertEqual(counter.samples(), [('', (), (), 401)])
+
+        # The shards of exited threads are retired without losing their values
+        self.assertEqual(len(counter._shards), 1)
+        self.assertEqual(counter.samples(), [('', (), (), 401)])
+
+    def test_histogram_buckets_are_cumulative(self):
+        from CloudHarvestAgent.prometheus import Histogram
+
+        histogram = Histogram('harvest_test_seconds', 'Test latency.', ('silo',), buckets=(0.1, 1))
+
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value, 'tasks')
+
+        self.assertEqual(histogram.render(), '\n'.join([
+            '# HELP harvest_test_seconds Test latency.',
+            '# TYPE harvest_test_seconds histogram',
+            'harvest_test_seconds_bucket{silo="tasks",le="0.1"} 2',
+            'harvest_test_seconds_bucket{silo="tasks",le="1"} 3',
+            'harvest_test_seconds_bucket{silo="tasks",le="+Inf"} 4',
+            'harvest_test_seconds_sum{silo="tasks"} 5.65',
+            'harvest_test_seconds_count{silo="tasks"} 4'
+        ]))
+
+    def test_gauge_and_label_escaping(self):
+        from CloudHarvestAgent.prometheus import Gauge
+
+        gauge = Gauge('harvest_test_gauge', 'Test gauge.', ('name',))
+        gauge.set(1.5, 'a "quoted"\nname\\')
+
+        self.assertEqual(gauge.render().splitlines()[-1], 'harvest_test_gauge{name="a \\"quoted\\"\\nname\\\\"} 1.5')
+
+        gauge.replace({('b',): 2.0})
+        self.assertEqual(gauge.render().splitlines()[-1], 'harvest_test_gauge{name="b"} 2')
+
+    def test_registry_runs_collectors_and_survives_failures(self):
+        from CloudHarvestAgent.prometheus import Gauge, MetricsRegistry
+
+        registry = MetricsRegistry()
+        gauge = registry.register(Gauge('harvest_test_running', 'Test.'))
+
+        def fail():
+            raise RuntimeError('collector failed')
+
+        registry.add_collector('running', lambda: gauge.set(7))
+        registry.add_collector('broken', fail)
+
+        self.assertIn('harvest_test_running 7\n', registry.render())
+
+    def test_thread_group(self):
+        from CloudHarvestAgent.prometheus import thread_group
+
+        self.assertEqual(thread_group('ThreadPoolExecutor-0_3'), 'ThreadPoolExecutor')
+        self.assertEqual(thread_group('chain_12'), 'chain')
+        self.assertEqual(thread_group('status-reporter'), 'status-reporter')
+
+
+class TestEndpointRoute(unittest.TestCase):
+    def test_routes_are_bounded(self):
+        from CloudHarvestAgent.api import endpoint_route
+
+        self.assertEqual(endpoint_route('silos/get_all'), 'silos/get_all')
+        self.assertEqual(endpoint_route('/tasks/get/abc123?full=true'), 'tasks/get/*')
+        self.assertEqual(endpoint_route('tasks/get/def456/records'), 'tasks/get/*')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+from tests.support import fakeredis
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestStatusReporter(unittest.TestCase):
+    def setUp(self):
+        from CloudHarvestAgent.reporter import StatusReporter
+
+        self.redis = fakeredis.FakeStrictRedis(decode_responses=True)
+        self.current = {}
+        self.reporter = StatusReporter(client=self.redis, collect=lambda: self.current)
+
+    def test_updates_are_coalesced_into_one_flush(self):
+        self.reporter.update('task::1', status='running')
+        self.reporter.update('task::1', status='complete')
+        self.reporter.update('task::2', status='running', progress='{}')
+
+        self.assertEqual(self.reporter.flush(), 3)
+        self.assertEqual(self.redis.hget('task::1', 'status'), 'complete')
+        self.assertEqual(self.redis.hgetall('task::2'), {'status': 'running', 'progress': '{}'})
+
+        stats = self.reporter.stats()
+        self.assertEqual(stats['coalesced'], 1)
+        self.assertEqual(stats['flushes'], 1)
+        self.assertEqual(stats['updates'], 4)
+
+    def test_urgent_update_is_written_immediately_when_not_running(self):
+        self.reporter.update('task::1', urgent=True, status='error')
+
+        self.assertEqual(self.redis.hget('task::1', 'status'), 'error')
+
+    def test_only_changed_collected_fields_are_written(self):
+        self.reporter.track('task::1')
+        self.current = {'task::1': {'status': 'running', 'progress': '1'}}
+
+        self.reporter._collect()
+        self.assertEqual(self.reporter.flush(), 2)
+
+        self.current = {'task::1': {'status': 'running', 'progress': '2'}}
+        self.reporter._collect()
+        self.assertEqual(self.reporter._pending, {'task::1': {'progress': '2'}})
+
+    def test_untracked_tasks_are_not_collected(self):
+        self.current = {'task::1': {'status': 'running'}}
+
+        self.reporter._collect()
+
+        self.assertEqual(self.reporter._pending, {})
+
+    def test_collection_racing_a_discard_is_dropped(self):
+        self.reporter.track('task::1')
+
+        def collect():
+            # The TaskChain finishes while its fields are being collected
+            fields = {'task::1': {'status': 'running'}}
+            self.reporter.discard('task::1')
+            self.redis.hset('task::1', 'status', 'complete')
+            return fields
+
+        self.reporter.collect = collect
+        self.reporter._collect()
+        self.reporter.flush()
+
+        self.assertEqual(self.redis.hget('task::1', 'status'), 'complete')
+
+    def test_finish_writes_and_forgets_the_task(self):
+        self.reporter.track('task::1')
+        self.reporter.update('task::1', status='running')
+        self.reporter.flush()
+        self.reporter.update('task::1', progress='stale')
+
+        self.reporter.finish('task::1', status='timeout', resource_usage='{}')
+
+        self.assertEqual(self.redis.hgetall('task::1'), {'status': 'timeout', 'resource_usage': '{}'})
+        self.assertEqual(self.reporter._pending, {})
+        self.assertEqual(self.reporter._reported, {})
+        self.assertEqual(self.reporter.stats()['tracked_tasks'], 0)
+
+    def test_reported_fields_are_only_kept_for_tracked_tasks(self):
+        for index in range(100):
+            self.reporter.update(f'task::{index}', status='error')
+
+        self.reporter.flush()
+
+        self.assertEqual(self.reporter._reported, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from types import SimpleNamespace
+
+from tests.support import fakeredis
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestSpillResult(unittest.TestCase):
+    def setUp(self):
+        from CloudHarvestAgent.results import ResultSink
+
+        self.redis = fakeredis.FakeStrictRedis()
+        self.redis.hset('task::1', 'status', 'running')
+
+        self.task_chain = SimpleNamespace(redis_name='task::1',
+                                          result=None,
+                                          result_sink=ResultSink(client=self.redis, redis_name='task::1',
+                                                                 max_chunk_bytes=1024))
+
+    def test_large_result_is_moved_into_the_stream(self):
+        from CloudHarvestAgent.results import iter_results, read_result_manifest, spill_result
+
+        records = [{'id': index, 'name': f'resource-{index}'} for index in range(200)]
+        self.task_chain.result = {'data': records, 'meta': {'count': 200}}
+
+        self.assertTrue(spill_result(self.task_chain, inline_max_bytes=1024))
+        self.assertEqual(self.task_chain.result, {'meta': {'count': 200}, 'data': None, 'result_stream': 'task::1::results'})
+
+        manifest = self.task_chain.result_sink.close()
+        self.assertEqual(manifest['records'], 200)
+        self.assertGreater(manifest['chunks'], 1)
+        self.assertEqual(read_result_manifest(self.redis, 'task::1'), manifest)
+        self.assertEqual(list(iter_results(self.redis, 'task::1')), records)
+
+    def test_list_result_is_written_record_by_record(self):
+        from CloudHarvestAgent.results import iter_results, spill_result
+
+        self.task_chain.result = list(range(1000))
+
+        self.assertTrue(spill_result(self.task_chain, inline_max_bytes=100))
+        self.assertEqual(self.task_chain.result, {'data': None, 'result_stream': 'task::1::results'})
+
+        self.task_chain.result_sink.close()
+        self.assertEqual(list(iter_results(self.redis, 'task::1')), list(range(1000)))
+
+    def test_small_result_stays_inline(self):
+        from CloudHarvestAgent.results import spill_result
+
+        self.task_chain.result = {'data': [1, 2, 3]}
+
+        self.assertFalse(spill_result(self.task_chain, inline_max_bytes=1024))
+        self.assertEqual(self.task_chain.result, {'data': [1, 2, 3]})
+        self.assertIsNone(self.task_chain.result_sink.close())
+        self.assertFalse(self.redis.exists('task::1::results'))
+
+    def test_streamed_result_is_left_alone(self):
+        from CloudHarvestAgent.results import spill_result
+
+        self.task_chain.result_sink.write_many(range(10))
+        self.task_chain.result = {'data': list(range(1000))}
+
+        self.assertFalse(spill_result(self.task_chain, inline_max_bytes=100))
+        self.assertEqual(len(self.task_chain.result['data']), 1000)
+
+    def test_records_are_serialized_once(self):
+        from unittest import mock
+
+        from CloudHarvestAgent import results
+
+        self.task_chain.result = list(range(1000))
+        dumps = mock.Mock(side_effect=results.json.dumps)
+
+        with mock.patch.object(results.json, 'dumps', dumps):
+            self.assertTrue(results.spill_result(self.task_chain, inline_max_bytes=100))
+
+        # Each record is serialized once, whether it was measured or not, and the whole result never is
+        self.assertEqual(dumps.call_count, 1000)
+        self.assertNotIn(mock.call(self.task_chain.result, default=str), dumps.call_args_list)
+
+    def test_single_record_result_is_moved_into_the_stream(self):
+        from CloudHarvestAgent.results import iter_results, spill_result
+
+        self.task_chain.result = {'report': 'x' * 2000}
+
+        self.assertTrue(spill_result(self.task_chain, inline_max_bytes=1024))
+        self.task_chain.result_sink.close()
+        self.assertEqual(list(iter_results(self.redis, 'task::1')), [{'report': 'x' * 2000}])
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestBinaryClient(unittest.TestCase):
+    def test_clients_are_cached_per_pool(self):
+        from gc import collect
+
+        from CloudHarvestAgent.results import _binary_clients, binary_client
+
+        client = fakeredis.FakeStrictRedis(decode_responses=True)
+
+        self.assertIs(binary_client(client), binary_client(client))
+        self.assertFalse(binary_client(client).connection_pool.connection_kwargs['decode_responses'])
+        self.assertIn(client.connection_pool, _binary_clients)
+
+        count = len(_binary_clients)
+        del client
+        collect()
+
+        self.assertEqual(len(_binary_clients), count - 1)
+
+    def test_binary_clients_are_returned_as_they_are(self):
+        from CloudHarvestAgent.results import binary_client
+
+        client = fakeredis.FakeStrictRedis()
+
+        self.assertIs(binary_client(client), client)
+
+
+if __name__ == '__main__':
+    unittest.main()
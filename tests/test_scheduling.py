@@ -0,0 +1,146 @@
+import unittest
+
+from CloudHarvestAgent.scheduling import PickupScheduler, WeightedFairScheduler, get_pickup_scheduler, queue_priority
+
+
+def state(length: int, oldest_wait_seconds: float = None) -> dict:
+    return {'length': length, 'oldest_wait_seconds': oldest_wait_seconds}
+
+
+def totals(plan: list) -> dict:
+    result = {}
+
+    for queue_name, quota in plan:
+        result[queue_priority(queue_name)] = result.get(queue_priority(queue_name), 0) + quota
+
+    return result
+
+
+class TestWeightedFairScheduler(unittest.TestCase):
+    queue_names = ['queue::0', 'queue::1', 'queue::2']
+
+    def test_share_grows_linearly_with_the_oldest_wait(self):
+        scheduler = WeightedFairScheduler(weights={0: 2}, aging_seconds=100)
+
+        self.assertEqual(scheduler.share(0), 2)
+        self.assertEqual(scheduler.share(0, 100), 4)
+        self.assertEqual(scheduler.share(0, 200), 6)
+        self.assertEqual(scheduler.share(1, 50), 1.5)
+
+        self.assertEqual(WeightedFairScheduler(weights={0: 2}, aging_seconds=0).share(0, 1000), 2)
+
+    def test_slots_are_shared_by_weight(self):
+        scheduler = WeightedFairScheduler(weights={0: 3, 1: 1}, aging_seconds=0)
+
+        plan = scheduler.plan(count=8, queue_names=self.queue_names[:2], running={}, max_chains=8,
+                              queue_state={'queue::0': state(100), 'queue::1': state(100)})
+
+        self.assertEqual(totals(plan), {0: 6, 1: 2})
+
+    def test_running_chains_count_against_the_share(self):
+        scheduler = WeightedFairScheduler(weights={0: 3, 1: 1}, aging_seconds=0)
+
+        plan = scheduler.plan(count=2, queue_names=self.queue_names[:2], running={0: 6}, max_chains=8,
+                              queue_state={'queue::0': state(100), 'queue::1': state(100)})
+
+        self.assertEqual(totals(plan), {0: 0, 1: 2})
+
+    def test_aging_raises_the_share_of_a_waiting_priority(self):
+        scheduler = WeightedFairScheduler(weights={0: 3, 1: 1}, aging_seconds=100)
+
+        # Priority 1 has waited two `aging_seconds`, so its share has tripled to that of priority 0
+        plan = scheduler.plan(count=8, queue_names=self.queue_names[:2], running={}, max_chains=8,
+                              queue_state={'queue::0': state(100, 0), 'queue::1': state(100, 200)})
+
+        self.assertEqual(totals(plan), {0: 4, 1: 4})
+        self.assertEqual(scheduler.stats()['shares'], {0: 3, 1: 3})
+
+    def test_aging_prevents_starvation(self):
+        scheduler = WeightedFairScheduler(weights={0: 6, 1: 1}, aging_seconds=100)
+        queue_names = self.queue_names[:2]
+
+        fresh = scheduler.plan(count=1, queue_names=queue_names, running={}, max_chains=1,
+                               queue_state={'queue::0': state(100, 0), 'queue::1': state(100, 10)})
+        self.assertEqual(totals(fresh), {0: 1, 1: 0})
+
+        starved = scheduler.plan(count=1, queue_names=queue_names, running={}, max_chains=1,
+                                 queue_state={'queue::0': state(100, 0), 'queue::1': state(100, 600)})
+        self.assertEqual(totals(starved), {0: 0, 1: 1})
+
+    def test_reservations_are_filled_first(self):
+        scheduler = WeightedFairScheduler(weights={0: 10}, aging_seconds=0, reservations={2: 2})
+
+        plan = scheduler.plan(count=4, queue_names=self.queue_names, running={}, max_chains=4,
+                              queue_state={'queue::0': state(10), 'queue::1': state(0), 'queue::2': state(5)})
+
+        self.assertEqual(totals(plan), {0: 2, 1: 0, 2: 2})
+
+    def test_reserved_slots_stay_free_for_their_priority(self):
+        scheduler = WeightedFairScheduler(aging_seconds=0, reservations={2: 2})
+
+        plan = scheduler.plan(count=4, queue_names=self.queue_names, running={}, max_chains=4,
+                              queue_state={'queue::0': state(10), 'queue::1': state(0), 'queue::2': state(0)})
+
+        self.assertEqual(totals(plan), {0: 2, 1: 0, 2: 0})
+
+    def test_quotas_follow_queue_order_and_length(self):
+        scheduler = WeightedFairScheduler(aging_seconds=0)
+        queue_names = ['queue::0::aws:1', 'queue::0']
+
+        plan = scheduler.plan(count=5, queue_names=queue_names, running={}, max_chains=5,
+                              queue_state={'queue::0::aws:1': state(2), 'queue::0': state(10)})
+
+        self.assertEqual(plan, [('queue::0::aws:1', 2), ('queue::0', 3)])
+
+    def test_never_plans_more_than_the_free_slots(self):
+        scheduler = WeightedFairScheduler(weights={0: 2, 1: 1, 2: 1}, aging_seconds=60, reservations={1: 1})
+
+        for count in range(0, 12):
+            plan = scheduler.plan(count=count, queue_names=self.queue_names, running={}, max_chains=12,
+                                  queue_state={name: state(4, 30) for name in self.queue_names})
+
+            self.assertLessEqual(sum(quota for name, quota in plan), count)
+
+
+class TestWaitingPlan(unittest.TestCase):
+    def test_strict_scheduler_waits_on_every_queue(self):
+        self.assertEqual(PickupScheduler().waiting_plan(count=2, queue_names=['queue::0', 'queue::1'], running={},
+                                                        max_chains=2),
+                         [('queue::0', 2), ('queue::1', 2)])
+
+    def test_reserved_slots_are_only_waited_on_by_their_priority(self):
+        scheduler = WeightedFairScheduler(aging_seconds=0, reservations={0: 2})
+        queue_names = ['queue::0', 'queue::1']
+
+        plan = scheduler.waiting_plan(count=2, queue_names=queue_names, running={}, max_chains=4,
+                                      queue_state={'queue::0': state(0), 'queue::1': state(5)})
+
+        self.assertEqual(plan, [('queue::0', 2), ('queue::1', 0)])
+
+    def test_every_queue_of_a_priority_is_waited_on(self):
+        scheduler = WeightedFairScheduler(weights={0: 3, 1: 1}, aging_seconds=0)
+        queue_names = ['queue::0::aws:1', 'queue::0', 'queue::1']
+
+        plan = scheduler.waiting_plan(count=4, queue_names=queue_names, running={}, max_chains=4,
+                                      queue_state={name: state(0) for name in queue_names})
+
+        self.assertEqual(plan, [('queue::0::aws:1', 3), ('queue::0', 3), ('queue::1', 1)])
+
+
+class TestGetPickupScheduler(unittest.TestCase):
+    def test_schedulers_by_name_and_path(self):
+        self.assertIsInstance(get_pickup_scheduler(), PickupScheduler)
+        self.assertIsInstance(get_pickup_scheduler('weighted_fair', weights={0: 2}), WeightedFairScheduler)
+        self.assertIsInstance(get_pickup_scheduler('CloudHarvestAgent.scheduling.WeightedFairScheduler'),
+                              WeightedFairScheduler)
+
+        with self.assertRaises(TypeError):
+            get_pickup_scheduler('CloudHarvestAgent.metrics.QueueMetrics')
+
+    def test_strict_scheduler_claims_in_priority_order(self):
+        self.assertEqual(PickupScheduler().plan(count=3, queue_names=['queue::0', 'queue::1'], running={}, max_chains=3),
+                         [('queue::0', 3), ('queue::1', 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
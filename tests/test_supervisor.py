@@ -0,0 +1,77 @@
+import os
+import unittest
+from unittest import mock
+
+
+class FakeProcess:
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.alive = True
+
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        from CloudHarvestAgent import supervisor
+
+        self.supervisor_module = supervisor
+        self.started = []
+
+        def start(address, authkey, connection):
+            self.started.append(FakeProcess(pid=1000 + len(self.started)))
+            return self.started[-1]
+
+        patches = [
+            mock.patch('CloudHarvestAgent.startup.load_configuration_from_file', return_value={'agent': {}}),
+            mock.patch.object(supervisor, 'start_supervisor', side_effect=start),
+            mock.patch.object(supervisor, 'supervisor_alive', side_effect=lambda process: process.alive),
+            mock.patch.object(supervisor, 'stop_supervisor')
+        ]
+
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.supervisor = supervisor.Supervisor({'host': '127.0.0.1', 'port': 8500}, check_interval_seconds=0.01)
+
+    def tearDown(self):
+        self.supervisor.stop()
+
+    def test_watchdog_restarts_an_exited_supervisor(self):
+        from time import monotonic, sleep
+
+        self.supervisor.start()
+        self.started[0].alive = False
+
+        deadline = monotonic() + 5
+        while self.supervisor.restarts == 0 and monotonic() < deadline:
+            sleep(0.01)
+
+        self.assertEqual(self.supervisor.restarts, 1)
+        self.assertEqual(self.supervisor.pid, 1001)
+
+    def test_stopped_supervisor_is_not_restarted(self):
+        self.supervisor.start()
+        self.supervisor.stop()
+        self.started[0].alive = False
+
+        self.assertFalse(self.supervisor.ensure_running())
+        self.assertEqual(len(self.started), 1)
+
+    def test_authkey_is_not_exported_to_the_environment(self):
+        self.supervisor.start()
+
+        self.assertNotIn(self.supervisor.authkey.hex(), os.environ.values())
+
+    def test_workers_build_a_client_from_the_configured_settings(self):
+        self.assertIsNone(self.supervisor_module.queue_client())
+
+        self.supervisor_module.configure_client(self.supervisor.address, self.supervisor.authkey)
+        self.addCleanup(setattr, self.supervisor_module, '_client_settings', None)
+
+        client = self.supervisor_module.queue_client()
+        self.assertEqual(client.address, self.supervisor.address)
+        self.assertEqual(client._authkey, self.supervisor.authkey)
+
+
+if __name__ == '__main__':
+    unittest.main()